@@ -1,5 +1,294 @@
+import datetime
+import re
+from decimal import Decimal
+
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest, Least, Round
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+
+from . import book_cache, facets
+from .api import streaming_export
+from .cache import bump_catalog_version
+from .export import FORMATS, ORDER_ITEM_FIELDS, order_item_rows
+from .jobs import enqueue, retry
+from .models import ArchivedOrder, ArchivedOrderItem, Book, Job, Order, OrderItem
+from .pagination import EstimatedCountPaginator
+from .sales import complete_orders, record_orders_deleted, sales_report
+from .search import matching_book_ids
+
+ISBN_RE = re.compile(r'^[\dXx-]{10,20}$')
+MAX_PRICE = Decimal('9999.99')
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без точных COUNT(*): оценка из статистики СУБД и без общего числа строк.
+
+    Сортировка разрешена только по полям, покрытым индексами, поиск —
+    только точными совпадениями по индексам (см. get_search_results).
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class PriceChangeForm(forms.Form):
+    percent = forms.DecimalField(label='Изменение цены, %', max_digits=6, decimal_places=2,
+                                 min_value=-100, max_value=1000)
+
+
+@admin.register(Book)
+class BookAdmin(LargeTableAdmin):
+    list_display = ('title', 'author', 'price', 'isbn', 'created_at')
+    ordering = ('-created_at', '-id')
+    sortable_by = ('created_at',)
+    list_filter = (('created_at', admin.DateFieldListFilter),)
+    # Поле нужно, чтобы показать строку поиска; сам поиск — в get_search_results
+    search_fields = ('isbn',)
+    search_help_text = 'ISBN или слова из названия, автора, описания'
+    actions = ['change_price']
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if ISBN_RE.match(search_term):
+            return queryset.filter(isbn=search_term), False
+        # По инвертированному индексу вместо LIKE '%...%' по всей таблице
+        return queryset.filter(pk__in=matching_book_ids(search_term)), False
+
+    @admin.action(description='Изменить цену на процент', permissions=['change'])
+    def change_price(self, request, queryset):
+        form = PriceChangeForm(request.POST if 'apply' in request.POST else None)
+        if not form.is_valid():
+            return TemplateResponse(request, 'admin/bookstore/book/change_price.html', {
+                **self.admin_site.each_context(request),
+                'opts': self.model._meta,
+                'title': 'Изменение цены',
+                'form': form,
+                'selected': request.POST.getlist(admin.helpers.ACTION_CHECKBOX_NAME),
+                'select_across': request.POST.get('select_across', '0'),
+                'action': request.POST.get('action'),
+            })
+        factor = 1 + form.cleaned_data['percent'] / 100
+        # Один UPDATE на всю выборку; цена ограничена размером поля
+        with transaction.atomic():
+            # Ценовые диапазоны фасетов: UPDATE обходит сигналы, поправка — в той же транзакции
+            old_keys = facets.current_keys(queryset.select_for_update())
+            updated = queryset.update(
+                price=Least(Greatest(Round(F('price') * Value(factor), 2), Value(Decimal('0'))), Value(MAX_PRICE)),
+                updated_at=timezone.now(),
+            )
+            facets.record_updated(old_keys)
+            transaction.on_commit(bump_catalog_version)
+            book_cache.touch(old_keys)
+        self.message_user(request, f'Цена изменена у книг: {updated}')
+
+
+class DateRangeForm(forms.Form):
+    start = forms.DateField(label='С даты', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(label='По дату (включительно)', required=False,
+                          widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned = super().clean()
+        start, end = cleaned.get('start'), cleaned.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError('Начало периода позже конца')
+        return cleaned
+
+    def bounds(self):
+        def midnight(day):
+            return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+        start, end = self.cleaned_data['start'], self.cleaned_data['end']
+        return (
+            midnight(start) if start else None,
+            midnight(end + datetime.timedelta(days=1)) if end else None,
+        )
+
+
+class OrderExportForm(DateRangeForm):
+    format = forms.ChoiceField(label='Формат', choices=[(fmt, fmt.upper()) for fmt in FORMATS])
+
+
+class OrderItemInline(admin.TabularInline):
+    """Позиции только для просмотра: правка мимо place_order разошлась бы с
+    ``Order.item_count`` и сводками продаж."""
+    model = OrderItem
+    fields = readonly_fields = ('book', 'quantity', 'price')
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('book')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+def _exact_order_search(queryset, search_term, order_field='pk', user_prefix='user__'):
+    """Поиск заказа по номеру, логину или email — только точные совпадения по индексам."""
+    search_term = search_term.strip()
+    if not search_term:
+        return queryset
+    condition = Q(**{user_prefix + 'username': search_term})
+    if '@' in search_term:
+        condition |= Q(**{user_prefix + 'email': search_term})
+    if search_term.isdigit():
+        condition |= Q(**{order_field: int(search_term)})
+    return queryset.filter(condition)
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'created_at', 'status', 'item_count', 'total_price')
+    list_select_related = ('user',)
+    list_filter = ('status',)
+    ordering = ('-created_at', '-id')
+    sortable_by = ('id', 'created_at')
+    search_fields = ('=id',)
+    search_help_text = 'Номер заказа, логин или email покупателя'
+    raw_id_fields = ('user',)
+    inlines = [OrderItemInline]
+    change_list_template = 'admin/bookstore/order/change_list.html'
+    actions = ['mark_completed']
+
+    def get_search_results(self, request, queryset, search_term):
+        return _exact_order_search(queryset, search_term), False
+
+    def get_urls(self):
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view), name='bookstore_order_export'),
+            path('sales/', self.admin_site.admin_view(self.sales_view), name='bookstore_order_sales'),
+        ] + super().get_urls()
+
+    @admin.action(description='Отметить выполненными', permissions=['change'])
+    def mark_completed(self, request, queryset):
+        updated = complete_orders(queryset)
+        self.message_user(request, f'Выполнено заказов: {updated}')
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            record_orders_deleted([obj.pk])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            record_orders_deleted(queryset)
+            super().delete_queryset(request, queryset)
+
+    def sales_view(self, request):
+        """Отчёт о продажах за период; читает только сводные таблицы."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        today = timezone.localdate()
+        data = request.POST if request.method == 'POST' else request.GET
+        form = DateRangeForm(data or {'start': today - datetime.timedelta(days=29), 'end': today})
+        report = None
+        if form.is_valid():
+            start = form.cleaned_data['start'] or today - datetime.timedelta(days=29)
+            end = form.cleaned_data['end'] or today
+            if request.method == 'POST' and self.has_change_permission(request):
+                job = enqueue('rebuild_sales_rollups', start=start.isoformat(), end=end.isoformat())
+                self.message_user(request, f'Пересборка сводок поставлена в очередь: задача #{job.pk}')
+                return redirect(f'{request.path}?start={start}&end={end}')
+            report = sales_report(start, end)
+        return TemplateResponse(request, 'admin/bookstore/order/sales_report.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Продажи',
+            'form': form,
+            'report': report,
+            'has_change_permission': self.has_change_permission(request),
+        })
+
+    def export_view(self, request):
+        """Позиции заказов за период потоком, без загрузки всей выборки в память."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        form = OrderExportForm(request.GET or None)
+        if form.is_valid():
+            start, end = form.bounds()
+            fmt = form.cleaned_data['format']
+            fields = tuple(ORDER_ITEM_FIELDS)
+            name = 'orders-%s-%s' % (form.cleaned_data['start'] or 'all', form.cleaned_data['end'] or 'now')
+            return streaming_export(request, order_item_rows(start, end, fields), fields, fmt, name)
+        return TemplateResponse(request, 'admin/bookstore/order/export.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Экспорт заказов',
+            'form': form,
+        })
+
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'order', 'book', 'quantity', 'price')
+    list_select_related = ('order', 'book')
+    ordering = ('-id',)
+    sortable_by = ('id',)
+    search_fields = ('=order__id',)
+    search_help_text = 'Номер заказа, логин или email покупателя'
+    raw_id_fields = ('order', 'book')
+
+    def get_search_results(self, request, queryset, search_term):
+        return _exact_order_search(queryset, search_term, order_field='order_id', user_prefix='order__user__'), False
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    raw_id_fields = ('book',)
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('book')
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(LargeTableAdmin):
+    """Архив только для просмотра: заказы переносит команда archive_orders."""
+    list_display = ('id', 'user', 'created_at', 'status', 'item_count', 'total_price', 'archived_at')
+    list_select_related = ('user',)
+    ordering = ('-created_at', '-id')
+    sortable_by = ('id', 'created_at')
+    search_fields = ('=id',)
+    search_help_text = 'Номер заказа, логин или email покупателя'
+    raw_id_fields = ('user',)
+    inlines = [ArchivedOrderItemInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        return _exact_order_search(queryset, search_term), False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
-from .models import Book
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'status', 'progress', 'progress_message', 'attempts', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    ordering = ('-id',)
+    sortable_by = ('id',)
+    readonly_fields = ('status', 'attempts', 'progress', 'progress_message', 'result', 'error',
+                       'locked_by', 'locked_at', 'created_at', 'updated_at')
+    actions = ['retry_jobs']
 
-admin.site.register(Book)
+    @admin.action(description='Перезапустить упавшие', permissions=['change'])
+    def retry_jobs(self, request, queryset):
+        self.message_user(request, f'Поставлено в очередь заново: {retry(queryset)}')
@@ -0,0 +1,95 @@
+"""Read-only JSON API каталога и потоковая выгрузка для партнёров."""
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from .export import BOOK_FIELDS, FORMATS, ExportError, aiter_lines, book_rows, encode, parse_fields
+from .models import Book
+from .pagination import InvalidCursor, KeysetPaginator
+from .recommendations import TOP_N, for_books
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise ExportError('limit должен быть числом')
+    return max(1, min(size, API_MAX_PAGE_SIZE))
+
+
+@require_GET
+def book_collection(request):
+    """``/api/books/?fields=id,title&limit=100&cursor=...``"""
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+        page_size = _page_size(request)
+    except ExportError as exc:
+        return _error(str(exc))
+    columns = tuple(dict.fromkeys(('id',) + fields))
+    paginator = KeysetPaginator(Book.objects.values(*columns), page_size, ordering=('id',))
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return _error('Неверный курсор страницы')
+
+    next_url = None
+    if page.next_cursor:
+        query = request.GET.copy()
+        query['cursor'] = page.next_cursor
+        next_url = request.build_absolute_uri('?' + query.urlencode())
+    return JsonResponse({
+        'results': [{name: row[name] for name in fields} for row in page.object_list],
+        'next': next_url,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@require_GET
+def book_detail(request, pk):
+    try:
+        fields = parse_fields(request.GET.get('fields'), default=BOOK_FIELDS)
+    except ExportError as exc:
+        return _error(str(exc))
+    row = get_object_or_404(Book.objects.values(*fields), pk=pk)
+    return JsonResponse(row, json_dumps_params={'ensure_ascii': False})
+
+
+@require_GET
+def book_recommendations(request, pk):
+    """``/api/books/<pk>/recommendations/`` — «с этой книгой покупают», один запрос."""
+    return JsonResponse({'results': for_books([pk], limit=TOP_N)}, json_dumps_params={'ensure_ascii': False})
+
+
+def streaming_export(request, rows, fields, fmt, filename):
+    """StreamingHttpResponse по генератору строк: первый байт уходит сразу.
+
+    Под ASGI — асинхронный итератор, иначе Django собрал бы всю выгрузку в память.
+    """
+    lines = encode(rows, fields, fmt)
+    if isinstance(request, ASGIRequest):
+        lines = aiter_lines(lines)
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    # Не даём nginx буферизовать ответ целиком
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+def book_export(request):
+    """``/api/books/export/?format=ndjson|csv&fields=...`` — весь каталог одним потоком."""
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return _error('format должен быть одним из: %s' % ', '.join(FORMATS))
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except ExportError as exc:
+        return _error(str(exc))
+    return streaming_export(request, book_rows(fields), fields, fmt, 'books')
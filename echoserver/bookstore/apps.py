@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class BookstoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'bookstore'
\ No newline at end of file
+    name = 'bookstore'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
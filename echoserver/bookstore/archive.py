@@ -0,0 +1,82 @@
+"""Архив выполненных заказов.
+
+``Order``/``OrderItem`` со временем растут, и каждый список заказов и
+каждый индекс по ним платит за годы истории. Выполненные заказы старше
+срока переносятся пачками в ``ArchivedOrder``/``ArchivedOrderItem`` (те
+же id и поля) командой archive_orders. История в личном кабинете читает
+архив только по запросу (``?archive=1``) и когда заказа нет в рабочей
+таблице.
+
+Родное секционирование MySQL по ``created_at`` здесь не подходит: InnoDB
+не поддерживает внешние ключи у секционированных таблиц, а на ``Order``
+ссылаются позиции, и ключ секционирования должен входить в первичный
+ключ. Поэтому архив — отдельные таблицы на любой СУБД.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+# Выполненные заказы старше этого числа дней уходят в архив
+ARCHIVE_AFTER_DAYS = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365)
+ORDER_FIELDS = ('id', 'user_id', 'created_at', 'updated_at', 'total_price', 'status', 'item_count')
+ITEM_FIELDS = ('id', 'order_id', 'book_id', 'quantity', 'price')
+
+
+def default_cutoff():
+    return timezone.now() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+
+
+def archivable(before):
+    return Order.objects.filter(status='C', created_at__lt=before)
+
+
+def archive_batch(before, batch_size=500):
+    """Переносит в архив до ``batch_size`` заказов одной транзакцией. Возвращает их число."""
+    with transaction.atomic():
+        # Блокировка: заказ не сменит статус между копированием и удалением
+        orders = list(
+            archivable(before).select_for_update().order_by('id').values(*ORDER_FIELDS)[:batch_size]
+        )
+        if not orders:
+            return 0
+        ids = [order['id'] for order in orders]
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(**item)
+            for item in OrderItem.objects.filter(order_id__in=ids).order_by('id').values(*ITEM_FIELDS)
+        ])
+        # Позиции удаляются каскадом, одним запросом
+        Order.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def archive_orders(before=None, batch_size=500, limit=None, progress=None):
+    """Переносит выполненные заказы старше ``before`` пачками. Возвращает их число.
+
+    Каждая пачка — своя короткая транзакция, чтобы не держать блокировки
+    на всё время переноса.
+    """
+    before = before or default_cutoff()
+    total = 0
+    while limit is None or total < limit:
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        moved = archive_batch(before, size)
+        if not moved:
+            break
+        total += moved
+        if progress:
+            progress(total)
+    return total
+
+
+def order_history(archive=False):
+    """Заказы с позициями и книгами — из рабочей таблицы или из архива."""
+    order_model, item_model = (ArchivedOrder, ArchivedOrderItem) if archive else (Order, OrderItem)
+    return order_model.objects.prefetch_related(
+        Prefetch('items', queryset=item_model.objects.select_related('book').order_by('id'))
+    )
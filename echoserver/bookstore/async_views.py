@@ -0,0 +1,179 @@
+"""Асинхронные версии горячих страниц для работы под ASGI (uvicorn/daphne).
+
+Включаются настройкой ``ASYNC_VIEWS`` (по умолчанию — в asgi.py).
+Синхронные версии из views.py остаются для WSGI. Данные читаются через
+асинхронный ORM; шаблоны рендерятся уже без обращений к БД, поэтому
+пользователь и счётчик корзины вычисляются до рендеринга.
+"""
+from calendar import timegm
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth import get_user, login
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseNotAllowed
+from django.shortcuts import redirect, render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+
+from .archive import order_history
+from .cache import acatalog_version, aget_or_build, fragment_key
+from . import book_cache
+from .cart import asummarize_cart, get_cart
+from .conditional import catalog_etag, catalog_last_modified, order_list_etag
+from .facets import afacet_counts, filter_books, parse_filters
+from .forms import UserLoginForm
+from .models import Book
+from .pagination import InvalidCursor, KeysetPage, KeysetPaginator
+from .recommendations import afor_books
+
+
+async def aresolve_user(request):
+    """Загружает пользователя, сессию и корзину заранее, чтобы шаблон не обращался к БД.
+
+    В Django 4.2 у сессий нет асинхронного API: get_user загружает сессию
+    в потоке, дальше она читается из кеша объекта.
+    """
+    user = await sync_to_async(get_user)(request)
+    request.user = user
+    request.cart_badge_count = await get_cart(request).acount()
+    return user
+
+
+def alogin_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aresolve_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def acondition(etag_func=None, last_modified_func=None):
+    """Асинхронный аналог ``django.views.decorators.http.condition``."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            etag = None
+            last_modified = None
+            if request.method in ('GET', 'HEAD'):
+                if etag_func:
+                    etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+                    etag = quote_etag(etag) if etag else None
+                if last_modified_func:
+                    modified = await sync_to_async(last_modified_func)(request, *args, **kwargs)
+                    last_modified = timegm(modified.utctimetuple()) if modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
+
+
+class BookListView(View):
+    paginate_by = 5
+    template_name = 'bookstore/book_list.html'
+
+    async def get(self, request):
+        await aresolve_user(request)
+        respond = acondition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)(self.render_page)
+        return await respond(request)
+
+    async def render_page(self, request):
+        filters = parse_filters(request.GET)
+        paginator = KeysetPaginator(filter_books(Book.objects.all(), filters), self.paginate_by,
+                                    ordering=('-created_at', '-id'), count_approximately=True)
+        try:
+            cursor = paginator.normalize_cursor(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Неверный курсор страницы')
+        version = await acatalog_version()
+        facets = await aget_or_build(
+            fragment_key('facets', sorted(filters.items()), version=version), lambda: afacet_counts(filters),
+        )
+        paginator._approximate_count = facets['total']
+
+        async def build():
+            page = await paginator.apage(cursor)
+            return (page.object_list, page.has_next(), page.has_previous(),
+                    page.next_cursor, page.previous_cursor, await paginator.aapproximate_count())
+
+        object_list, has_next, has_previous, next_cursor, previous_cursor, count = await aget_or_build(
+            fragment_key('page', [self.paginate_by, cursor, *sorted(filters.items())], version=version), build,
+        )
+        paginator._approximate_count = count
+        page = KeysetPage(object_list, paginator, has_next, has_previous, next_cursor, previous_cursor)
+        return render(request, self.template_name, {
+            'books': page.object_list,
+            'object_list': page.object_list,
+            'page_obj': page,
+            'paginator': paginator,
+            'is_paginated': page.has_other_pages(),
+            'catalog_version': version,
+            'facets': facets,
+        })
+
+
+async def cart_view(request):
+    await aresolve_user(request)
+    quantities = await get_cart(request).aquantities()
+    cart_items, total_price = await asummarize_cart(quantities)
+    return render(request, 'bookstore/cart.html', {
+        'cart_items': cart_items,
+        'total_price': total_price,
+        'recommendations': await afor_books(list(quantities), limit=4, exclude=list(quantities)),
+    })
+
+
+async def add_to_cart(request, book_id):
+    # require_POST в Django 4.2 не умеет оборачивать корутины
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if await book_cache.aget(book_id) is None:
+        raise Http404('Книга не найдена')
+    await aresolve_user(request)
+    await get_cart(request).aadd(book_id)
+    return redirect('cart_view')
+
+
+async def user_login(request):
+    """Вход без блокировки цикла событий: пароль проверяется в пуле процессов."""
+    await aresolve_user(request)
+    status = 200
+    if request.method == 'POST':
+        form = UserLoginForm(request, data=request.POST)
+        if await form.ais_valid():
+            user = form.get_user()
+            # login() пишет в сессию и шлёт user_logged_in (слияние корзины)
+            await sync_to_async(login)(request, user)
+            messages.success(request, f'Добро пожаловать, {user.username}!')
+            return redirect('book_list')
+        if form.is_throttled():
+            status = 429
+    else:
+        form = UserLoginForm()
+    return render(request, 'bookstore/login.html', {'form': form}, status=status)
+
+
+@alogin_required
+@acondition(etag_func=order_list_etag)
+async def order_list(request):
+    archive = request.GET.get('archive') == '1'
+    orders = order_history(archive).filter(user=request.user)
+    paginator = KeysetPaginator(orders, 10, ordering=('-created_at', '-id'))
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Неверный курсор страницы')
+    return render(request, 'bookstore/order_list.html', {
+        'orders': page.object_list, 'page_obj': page, 'archive': archive,
+    })
@@ -0,0 +1,151 @@
+"""Вход по логину или email.
+
+Пользователь ищется одним запросом, пароль проверяется в пуле процессов
+(bookstore/hashing.py). Попытки ограничиваются token bucket'ами по IP и
+по учётной записи в общем для воркеров кэше ``LOGIN_THROTTLE_CACHE``, и
+отказ по лимиту происходит до хеширования. Пароль, сохранённый не
+основным хешером из ``PASSWORD_HASHERS``, перехешируется при успешном
+входе.
+"""
+import hashlib
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import _clean_credentials, _get_backends
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_login_failed
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+
+from .hashing import acheck_password, check_password, dummy_hash
+from .models import User
+from .throttle import TokenBucket
+
+
+class LoginThrottled(Exception):
+    pass
+
+
+def _candidates(login):
+    condition = Q(username=login)
+    if '@' in login:
+        condition |= Q(email=login)
+    return User.objects.filter(condition)[:2]
+
+
+def _pick(users, login):
+    # Если логин одного пользователя совпал с email другого, побеждает логин
+    for user in users:
+        if user.username == login:
+            return user
+    return users[0] if users else None
+
+
+def find_user(login):
+    return _pick(list(_candidates(login)), login)
+
+
+async def afind_user(login):
+    return _pick([user async for user in _candidates(login)], login)
+
+
+class EmailOrUsernameBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if not username or password is None:
+            return None
+        user = find_user(username)
+        if user is None:
+            # Время ответа не должно выдавать, существует ли пользователь
+            check_password(password, dummy_hash())
+            return None
+        valid, new_hash = check_password(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if new_hash:
+            User.objects.filter(pk=user.pk).update(password=new_hash)
+            user.password = new_hash
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if not username or password is None:
+            return None
+        user = await afind_user(username)
+        if user is None:
+            await acheck_password(password, dummy_hash())
+            return None
+        valid, new_hash = await acheck_password(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if new_hash:
+            await User.objects.filter(pk=user.pk).aupdate(password=new_hash)
+            user.password = new_hash
+        return user
+
+
+async def aauthenticate(request=None, **credentials):
+    """Асинхронный ``django.contrib.auth.authenticate``.
+
+    Обходит все ``AUTHENTICATION_BACKENDS``; у бэкенда без ``aauthenticate``
+    вызывается синхронный ``authenticate`` в потоке. Если не подошёл ни
+    один, отправляется ``user_login_failed``.
+    """
+    for backend, backend_path in _get_backends(return_tuples=True):
+        try:
+            inspect.signature(backend.authenticate).bind(request, **credentials)
+        except TypeError:
+            continue
+        try:
+            if hasattr(backend, 'aauthenticate'):
+                user = await backend.aauthenticate(request, **credentials)
+            else:
+                user = await sync_to_async(backend.authenticate)(request, **credentials)
+        except PermissionDenied:
+            break
+        if user is None:
+            continue
+        user.backend = backend_path
+        return user
+    # sender тот же, что у authenticate(): получатели сигнала не различают пути
+    await sync_to_async(user_login_failed.send)(
+        sender='django.contrib.auth', credentials=_clean_credentials(credentials), request=request,
+    )
+
+
+class LoginThrottle:
+    """Лимиты попыток входа: токен тратится только на неудачную попытку."""
+
+    def __init__(self, request, login):
+        limits = settings.LOGIN_THROTTLE
+        alias = settings.LOGIN_THROTTLE_CACHE
+        ip = request.META.get('REMOTE_ADDR', '') if request is not None else ''
+        account = hashlib.md5(login.strip().lower().encode()).hexdigest()
+        self.account = TokenBucket('login-account:' + account, *limits['account'], cache_alias=alias)
+        self.buckets = [TokenBucket('login-ip:' + ip, *limits['ip'], cache_alias=alias), self.account]
+
+    def check(self):
+        if not all(bucket.allows() for bucket in self.buckets):
+            raise LoginThrottled
+
+    async def acheck(self):
+        for bucket in self.buckets:
+            if not await bucket.aallows():
+                raise LoginThrottled
+
+    def failed(self):
+        for bucket in self.buckets:
+            bucket.consume()
+
+    async def afailed(self):
+        for bucket in self.buckets:
+            await bucket.aconsume()
+
+    def succeeded(self):
+        self.account.reset()
+
+    async def asucceeded(self):
+        await self.account.areset()
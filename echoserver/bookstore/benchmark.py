@@ -0,0 +1,394 @@
+"""Нагрузочный прогон маршрутов магазина внутри процесса, без сети.
+
+Каталог заполняется синтетическими данными, каждый маршрут вызывается
+через тестовый клиент Django из нескольких потоков (WSGI) или через
+AsyncClient из нескольких задач asyncio (ASGI), по задержкам считаются
+p50/p95/p99 и пропускная способность. Результат сохраняется в JSON и
+может сравниваться с сохранённым базовым прогоном.
+"""
+import asyncio
+import contextlib
+import contextvars
+import inspect
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, Client
+
+from . import facets
+from .models import Book, Order, OrderItem, User
+from .pagination import KeysetPaginator
+from .search import index_books
+
+WORDS = (
+    'война мир время море город история жизнь любовь ночь дорога дом сад '
+    'python django данные сеть алгоритм система код проект книга тайна'
+).split()
+
+
+def _phrase(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def seed(books, users, orders, batch_size=2000, with_search_index=True, stdout=None, seed_value=0):
+    """Заполняет пустую БД: книги, пользователи и заказы с позициями."""
+    rng = random.Random(seed_value)
+    authors = [f'{_phrase(rng, 1)} {_phrase(rng, 1)}' for _ in range(max(books // 20, 1))]
+
+    created = 0
+    while created < books:
+        size = min(batch_size, books - created)
+        with transaction.atomic():
+            batch = Book.objects.bulk_create([
+                Book(
+                    title=_phrase(rng, 3),
+                    author=rng.choice(authors),
+                    price=Decimal(rng.randint(100, 99999)) / 100,
+                    description=_phrase(rng, 12),
+                )
+                for _ in range(size)
+            ])
+            if with_search_index:
+                index_books(batch)
+            facets.record_added(batch)
+        created += size
+        if stdout:
+            stdout.write(f'  книг: {created}/{books}')
+
+    password = make_password('benchmark')
+    User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com', password=password)
+        for i in range(users)
+    ], batch_size=batch_size)
+
+    user_ids = list(User.objects.filter(username__startswith='bench').values_list('id', flat=True))
+    max_book = Book.objects.order_by('-id').values_list('id', flat=True).first()
+    min_book = Book.objects.order_by('id').values_list('id', flat=True).first()
+    made = 0
+    while made < orders:
+        size = min(batch_size, orders - made)
+        with transaction.atomic():
+            batch = Order.objects.bulk_create([
+                Order(user_id=rng.choice(user_ids), total_price=0, status=rng.choice('PC'))
+                for _ in range(size)
+            ])
+            items = []
+            for order in batch:
+                lines = [
+                    OrderItem(
+                        order_id=order.pk, book_id=rng.randint(min_book, max_book),
+                        quantity=rng.randint(1, 3), price=Decimal('9.99'),
+                    )
+                    for _ in range(rng.randint(1, 5))
+                ]
+                order.item_count = sum(line.quantity for line in lines)
+                items.extend(lines)
+            OrderItem.objects.bulk_create(items)
+            Order.objects.bulk_update(batch, ['item_count'])
+        made += size
+        if stdout:
+            stdout.write(f'  заказов: {made}/{orders}')
+
+
+class Scenario:
+    """Один замеряемый маршрут.
+
+    ``prepare(client, ctx)`` выполняется перед каждым запросом и не
+    попадает в замер; ``request(client, ctx)`` — замеряемый вызов.
+    Пишущие сценарии на SQLite выполняются по одному (вместе с подготовкой):
+    у SQLite один писатель, и параллельные транзакции иначе падают с
+    «database is locked».
+    """
+
+    def __init__(self, name, request, prepare=None, authenticated=False, writes=False):
+        self.name = name
+        self.request = request
+        self.prepare = prepare
+        self.authenticated = authenticated
+        self.writes = writes
+
+
+def _random_book(ctx):
+    return ctx['rng'].randint(ctx['min_book'], ctx['max_book'])
+
+
+def _fill_cart(client, ctx):
+    # Для AsyncClient вернёт корутины, их дождётся асинхронный прогон
+    return [client.post(f"/cart/add/{_random_book(ctx)}/") for _ in range(3)]
+
+
+def default_scenarios():
+    return [
+        Scenario('catalog', lambda c, ctx: c.get('/')),
+        Scenario('catalog_deep', lambda c, ctx: c.get('/', {'cursor': ctx['deep_cursor']})),
+        Scenario('search', lambda c, ctx: c.get('/search/', {'q': ctx['rng'].choice(WORDS)})),
+        # Корзина вошедшего пользователя хранится в БД, так что её наполнение — запись
+        Scenario('add_to_cart', lambda c, ctx: c.post(f'/cart/add/{_random_book(ctx)}/'), authenticated=True,
+                 writes=True),
+        Scenario('cart', lambda c, ctx: c.get('/cart/'), prepare=_fill_cart, authenticated=True, writes=True),
+        Scenario('checkout', lambda c, ctx: c.post('/checkout/'), prepare=_fill_cart, authenticated=True,
+                 writes=True),
+        Scenario('order_list', lambda c, ctx: c.get('/orders/'), authenticated=True),
+        Scenario('order_detail', lambda c, ctx: c.get(f"/orders/{ctx['rng'].choice(ctx['orders'])}/"),
+                 authenticated=True),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _context():
+    book_ids = Book.objects.order_by('id').values_list('id', flat=True)
+    total = Book.objects.count()
+    paginator = KeysetPaginator(Book.objects.all(), 5)
+    deep_book = Book.objects.order_by('-created_at', '-id')[total // 2] if total else None
+    return {
+        'min_book': book_ids.first() or 0,
+        'max_book': book_ids.last() or 0,
+        'deep_cursor': paginator.encode_cursor(deep_book, 'n') if deep_book else '',
+    }
+
+
+def _users_with_orders(count):
+    users = (
+        User.objects.filter(username__startswith='bench', order__isnull=False)
+        .distinct().order_by('id').values_list('id', flat=True)[:count]
+    )
+    return {
+        user_id: list(Order.objects.filter(user_id=user_id).values_list('id', flat=True)[:50])
+        for user_id in users
+    }
+
+
+def _login(client, ctx, scenario, user_items, number):
+    if scenario.authenticated and user_items:
+        user_id, orders = user_items[number % len(user_items)]
+        client.force_login(User.objects.get(pk=user_id))
+        ctx['orders'] = orders
+
+
+def _failure(stage, exc):
+    return f'{stage}: {exc!r}'
+
+
+def run_scenario(scenario, requests, concurrency, base_context, users):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [requests]
+    user_items = list(users.items())
+    writer_lock = threading.Lock() if scenario.writes and connection.vendor == 'sqlite' else None
+
+    def worker(number):
+        client = Client()
+        ctx = dict(base_context, rng=random.Random(number))
+        try:
+            try:
+                _login(client, ctx, scenario, user_items, number)
+            except Exception as exc:
+                # Без входа поток не может делать запросы; его долю заберут остальные
+                with lock:
+                    errors.append(_failure('login', exc))
+                return
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                with writer_lock or contextlib.nullcontext():
+                    try:
+                        if scenario.prepare:
+                            scenario.prepare(client, ctx)
+                    except Exception as exc:
+                        # Запрос не выполнен, но поток продолжает работу
+                        with lock:
+                            errors.append(_failure('prepare', exc))
+                        continue
+                    start = time.perf_counter()
+                    try:
+                        status = scenario.request(client, ctx).status_code
+                    except Exception as exc:
+                        status = repr(exc)
+                    elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if not isinstance(status, int) or status >= 400:
+                        errors.append(status)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return _summary(requests, latencies, errors, wall)
+
+
+def run_scenario_async(scenario, requests, concurrency, base_context, users):
+    latencies = []
+    errors = []
+    remaining = [requests]
+    user_items = list(users.items())
+
+    # Клиенты готовятся заранее: force_login обращается к БД синхронно
+    workers = []
+    for number in range(concurrency):
+        client = AsyncClient()
+        ctx = dict(base_context, rng=random.Random(number))
+        try:
+            _login(client, ctx, scenario, user_items, number)
+        except Exception as exc:
+            errors.append(_failure('login', exc))
+            continue
+        workers.append((client, ctx))
+
+    async def worker(client, ctx, writer_lock):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            async with writer_lock or contextlib.nullcontext():
+                try:
+                    if scenario.prepare:
+                        for pending in scenario.prepare(client, ctx):
+                            if inspect.isawaitable(pending):
+                                await pending
+                except Exception as exc:
+                    errors.append(_failure('prepare', exc))
+                    continue
+                start = time.perf_counter()
+                try:
+                    status = (await scenario.request(client, ctx)).status_code
+                except Exception as exc:
+                    status = repr(exc)
+                elapsed = time.perf_counter() - start
+            latencies.append(elapsed)
+            if not isinstance(status, int) or status >= 400:
+                errors.append(status)
+
+    async def main():
+        writer_lock = asyncio.Lock() if scenario.writes and connection.vendor == 'sqlite' else None
+        # Каждая задача — в чистом контексте, как отдельный запрос под ASGI-сервером,
+        # иначе все задачи делили бы соединения с БД, открытые при подготовке
+        loop = asyncio.get_running_loop()
+        tasks = [
+            contextvars.Context().run(loop.create_task, worker(client, ctx, writer_lock))
+            for client, ctx in workers
+        ]
+        await asyncio.gather(*tasks)
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    wall = time.perf_counter() - started
+    return _summary(requests, latencies, errors, wall)
+
+
+def _summary(requested, latencies, errors, wall):
+    """``requests`` — выполненные запросы; ``requested`` — сколько заказано.
+
+    В ``errors`` входят и сбои подготовки (вход, заполнение корзины): такие
+    запросы не выполнялись, поэтому ``requests`` может быть меньше ``requested``.
+    """
+    latencies.sort()
+    return {
+        'requested': requested,
+        'requests': len(latencies),
+        'errors': len(errors),
+        # Первые сообщения — чтобы причину сбоев было видно в отчёте
+        'error_samples': [str(error) for error in errors[:5]],
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def run(requests=200, concurrency=4, scenarios=None, only=None, stdout=None, asgi=False):
+    scenarios = scenarios or default_scenarios()
+    run_one = run_scenario_async if asgi else run_scenario
+    base_context = _context()
+    users = _users_with_orders(concurrency)
+    results = {}
+    for scenario in scenarios:
+        if only and scenario.name not in only:
+            continue
+        results[scenario.name] = run_one(scenario, requests, concurrency, base_context, users)
+        if stdout:
+            stats = results[scenario.name]
+            stdout.write(
+                f"{scenario.name:<14} {stats['throughput_rps']:>9.1f} rps  "
+                f"p50 {stats['p50_ms']:>8.2f}  p95 {stats['p95_ms']:>8.2f}  "
+                f"p99 {stats['p99_ms']:>8.2f} ms  выполнено {stats['requests']}/{stats['requested']}  "
+                f"ошибок {stats['errors']}"
+            )
+            for sample in stats['error_samples']:
+                stdout.write(f'    {sample}')
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'mode': 'asgi' if asgi else 'wsgi',
+            'async_views': settings.ASYNC_VIEWS,
+            'books': Book.objects.count(),
+            'requests': requests,
+            'concurrency': concurrency,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Список регрессий относительно базового прогона.
+
+    Регрессия — p95 выше базового более чем на ``tolerance`` (доля),
+    пропускная способность ниже на столько же или появились ошибки.
+    """
+    regressions = []
+    for name, stats in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {stats['p95_ms']} мс против {base['p95_ms']} мс")
+        if stats['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {stats['throughput_rps']} rps против {base['throughput_rps']} rps")
+        if stats['errors'] > base.get('errors', 0):
+            regressions.append(f"{name}: ошибок {stats['errors']} против {base.get('errors', 0)}")
+    return regressions
+
+
+def format_comparison(first, second):
+    rows = [f"{'сценарий':<14} {first['meta']['mode']:>22} {second['meta']['mode']:>22}"]
+    for name, stats in first['results'].items():
+        other = second['results'].get(name)
+        if not other:
+            continue
+        rows.append(
+            f"{name:<14} {stats['throughput_rps']:>8.1f} rps {stats['p95_ms']:>7.2f} ms"
+            f" {other['throughput_rps']:>8.1f} rps {other['p95_ms']:>7.2f} ms"
+        )
+    return '\n'.join(rows)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def save(report, path):
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
@@ -0,0 +1,218 @@
+"""Кэш кратких сводок книг для корзины: id, название, автор, цена, updated_at.
+
+Два уровня: ограниченный LRU в памяти процесса и общий кэш каталога
+(``CATALOG_CACHE_ALIAS``). Промахи обоих добираются из БД одним запросом
+на всю пачку. Сводка хранится под ``updated_at`` своей книги, а какой
+``updated_at`` сейчас актуален, говорит штамп книги в общем кэше. После
+коммита изменения книги штамп переписывается значением из БД (``touch``:
+сигналы post_save/post_delete, действие админки, импорт), и старые сводки
+во всех процессах перестают читаться; остальные книги не затрагиваются.
+При промахе читатель кладёт штамп через ``add``: прочитанное из БД до
+чужого коммита не перезапишет более новый штамп. Всё живёт не дольше
+``BOOK_CACHE_TIMEOUT``.
+
+Цены для оформления заказа берутся из БД (cart.place_order), сводки —
+только для показа и проверок.
+"""
+import datetime
+import threading
+from collections import Counter, OrderedDict
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import catalog_cache
+from .models import Book
+
+LRU_SIZE = getattr(settings, 'BOOK_CACHE_LRU_SIZE', 2048)
+TIMEOUT = getattr(settings, 'BOOK_CACHE_TIMEOUT', 3600)
+
+
+class BookSummary(NamedTuple):
+    id: int
+    title: str
+    author: str
+    price: Decimal
+    updated_at: datetime.datetime
+
+    @property
+    def pk(self):
+        return self.id
+
+
+SUMMARY_FIELDS = BookSummary._fields
+# Штамп несуществующей книги
+ABSENT = False
+
+
+class LRUCache:
+    """Потокобезопасный словарь, который вытесняет давно не читанные ключи."""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._data.get(key)
+                if value is not None:
+                    self._data.move_to_end(key)
+                    found[key] = value
+        return found
+
+    def set_many(self, mapping):
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_local = LRUCache(LRU_SIZE)
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(**events):
+    with _stats_lock:
+        _stats.update(events)
+
+
+def stats():
+    """Попадания в LRU и в общий кэш, промахи до БД — в этом процессе."""
+    with _stats_lock:
+        result = dict.fromkeys(('local_hits', 'shared_hits', 'misses'), 0)
+        result.update(_stats)
+    lookups = sum(result.values())
+    hits = result['local_hits'] + result['shared_hits']
+    result['hit_ratio'] = round(hits / lookups, 4) if lookups else None
+    result['lru_size'] = len(_local)
+    return result
+
+
+def _stamp_key(book_id):
+    return f'catalog:book:{book_id}:stamp'
+
+
+def _key(book_id, stamp):
+    return f'catalog:book:{book_id}:{stamp.isoformat()}'
+
+
+def _stamps(book_ids, cached):
+    return {book_id: cached[_stamp_key(book_id)] for book_id in book_ids if _stamp_key(book_id) in cached}
+
+
+def _from_local(book_ids, stamps):
+    """Сводки по штампам из LRU, ключи общего кэша для остальных и книги без штампа."""
+    found = {book_id: ABSENT for book_id, stamp in stamps.items() if stamp is ABSENT}
+    known = [(book_id, stamps[book_id]) for book_id in book_ids if stamps.get(book_id, ABSENT) is not ABSENT]
+    local = {book_id: summary for (book_id, _), summary in _local.get_many(known).items()}
+    keys = {_key(book_id, stamp): book_id for book_id, stamp in known if book_id not in local}
+    unknown = [book_id for book_id in book_ids if book_id not in stamps]
+    _count(local_hits=len(local), shared_hits=len(found))
+    return {**found, **local}, keys, unknown
+
+
+def _summaries(book_ids, rows):
+    summaries = {row[0]: BookSummary(*row) for row in rows}
+    return {book_id: summaries.get(book_id, ABSENT) for book_id in book_ids}
+
+
+def _existing(summaries):
+    return {book_id: summary for book_id, summary in summaries.items() if summary is not ABSENT}
+
+
+def _to_store(loaded):
+    """Ключи сводок и штампы для загруженных из БД книг."""
+    summaries = {_key(book_id, summary.updated_at): summary
+                 for book_id, summary in _existing(loaded).items()}
+    stamps = {_stamp_key(book_id): ABSENT if summary is ABSENT else summary.updated_at
+              for book_id, summary in loaded.items()}
+    return summaries, stamps
+
+
+def _remember(summaries):
+    _local.set_many({(book_id, summary.updated_at): summary
+                     for book_id, summary in _existing(summaries).items()})
+
+
+def get_many(book_ids):
+    """``{id: BookSummary}`` для существующих книг из ``book_ids``."""
+    book_ids = list(dict.fromkeys(book_ids))
+    if not book_ids:
+        return {}
+    cache = catalog_cache()
+    stamps = _stamps(book_ids, cache.get_many([_stamp_key(book_id) for book_id in book_ids]))
+    found, keys, unknown = _from_local(book_ids, stamps)
+    shared = {keys[key]: summary for key, summary in cache.get_many(list(keys)).items()} if keys else {}
+    unknown += [book_id for book_id in keys.values() if book_id not in shared]
+    loaded = {}
+    if unknown:
+        loaded = _summaries(unknown, Book.objects.filter(pk__in=unknown).values_list(*SUMMARY_FIELDS))
+        summaries, new_stamps = _to_store(loaded)
+        cache.set_many(summaries, TIMEOUT)
+        for key, stamp in new_stamps.items():
+            cache.add(key, stamp, TIMEOUT)
+    _count(shared_hits=len(shared), misses=len(unknown))
+    _remember({**shared, **loaded})
+    return _existing({**found, **shared, **loaded})
+
+
+async def aget_many(book_ids):
+    book_ids = list(dict.fromkeys(book_ids))
+    if not book_ids:
+        return {}
+    cache = catalog_cache()
+    stamps = _stamps(book_ids, await cache.aget_many([_stamp_key(book_id) for book_id in book_ids]))
+    found, keys, unknown = _from_local(book_ids, stamps)
+    shared = {keys[key]: summary for key, summary in (await cache.aget_many(list(keys))).items()} if keys else {}
+    unknown += [book_id for book_id in keys.values() if book_id not in shared]
+    loaded = {}
+    if unknown:
+        loaded = _summaries(unknown, [
+            row async for row in Book.objects.filter(pk__in=unknown).values_list(*SUMMARY_FIELDS)
+        ])
+        summaries, new_stamps = _to_store(loaded)
+        await cache.aset_many(summaries, TIMEOUT)
+        for key, stamp in new_stamps.items():
+            await cache.aadd(key, stamp, TIMEOUT)
+    _count(shared_hits=len(shared), misses=len(unknown))
+    _remember({**shared, **loaded})
+    return _existing({**found, **shared, **loaded})
+
+
+def get(book_id):
+    """Сводка книги или None, если её нет."""
+    return get_many([book_id]).get(book_id)
+
+
+async def aget(book_id):
+    return (await aget_many([book_id])).get(book_id)
+
+
+def touch(book_ids):
+    """После коммита переписывает штампы книг значениями из БД.
+
+    Вызывается в транзакции, изменившей или удалившей книги.
+    """
+    book_ids = list(book_ids)
+
+    def write():
+        stamps = dict.fromkeys(book_ids, ABSENT)
+        stamps.update(Book.objects.filter(pk__in=book_ids).values_list('pk', 'updated_at'))
+        catalog_cache().set_many({_stamp_key(book_id): stamp for book_id, stamp in stamps.items()}, TIMEOUT)
+    if book_ids:
+        transaction.on_commit(write)
@@ -0,0 +1,169 @@
+"""Кэш каталога: версионированные фрагменты карточек и страниц.
+
+Все ключи содержат версию каталога, которая меняется при любом изменении
+книг (сигналы post_save/post_delete, массовый импорт). После смены версии
+старые записи просто перестают читаться и вытесняются бэкендом по LRU/TTL.
+Холодный ключ пересобирает только один воркер, остальные ждут его результат.
+
+Версия живёт в кэше ``CATALOG_CACHE_ALIAS``, поэтому он должен быть общим
+для всех воркеров (file, redis): иначе смену версии увидит только воркер,
+изменивший книгу. Это проверяет ``manage.py check`` (bookstore/checks.py).
+"""
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+VERSION_KEY = 'catalog:version'
+# Когда версия сменилась последний раз — для Last-Modified страниц каталога
+MODIFIED_KEY = 'catalog:modified'
+
+_missing = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def catalog_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def cache_stats():
+    """Счётчики попаданий и промахов в этом процессе."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats.get('hits', 0) + stats.get('misses', 0)
+    stats['hit_ratio'] = round(stats.get('hits', 0) / lookups, 4) if lookups else None
+    return stats
+
+
+def _new_version():
+    # Случайная, а не incr: incr не атомарен в файловом кэше, и две
+    # одновременные смены могли бы дать одну и ту же версию
+    return uuid.uuid4().hex
+
+
+def catalog_version():
+    cache = catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Версия могла быть вытеснена: новая не совпадёт ни с одной из старых.
+        # Время изменения — не раньше настоящего
+        cache.add(VERSION_KEY, _new_version(), None)
+        cache.set(MODIFIED_KEY, timezone.now(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def catalog_state():
+    """``(версия, время изменения)`` каталога — обычно одно обращение к кэшу, без БД."""
+    values = catalog_cache().get_many([VERSION_KEY, MODIFIED_KEY])
+    if VERSION_KEY not in values:
+        version = catalog_version()
+        return version, catalog_cache().get(MODIFIED_KEY)
+    return values[VERSION_KEY], values.get(MODIFIED_KEY)
+
+
+async def acatalog_version():
+    cache = catalog_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, _new_version(), None)
+        await cache.aset(MODIFIED_KEY, timezone.now(), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = catalog_cache()
+    version = _new_version()
+    cache.set(VERSION_KEY, version, None)
+    # После версии: со старой версией время изменения никогда не окажется новым
+    cache.set(MODIFIED_KEY, timezone.now(), None)
+    return version
+
+
+def fragment_key(name, vary_on=(), version=None):
+    if version is None:
+        version = catalog_version()
+    digest = hashlib.md5(':'.join(str(value) for value in vary_on).encode()).hexdigest()
+    return f'catalog:{version}:{name}:{digest}'
+
+
+def get_or_build(key, builder, timeout=None):
+    """Значение из кэша или результат ``builder()`` с защитой от stampede."""
+    cache = catalog_cache()
+    timeout = timeout if timeout is not None else getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+    lock_timeout = getattr(settings, 'CATALOG_CACHE_LOCK_TIMEOUT', 5)
+
+    value = cache.get(key, _missing)
+    if value is not _missing:
+        _count('hits')
+        return value
+
+    lock_key = key + ':lock'
+    if cache.add(lock_key, 1, lock_timeout):
+        _count('misses')
+        try:
+            value = builder()
+            cache.set(key, value, timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    # Ключ уже пересобирает другой воркер — ждём его результат
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        value = cache.get(key, _missing)
+        if value is not _missing:
+            _count('hits')
+            _count('waits')
+            return value
+    _count('misses')
+    _count('lock_timeouts')
+    return builder()
+
+
+async def aget_or_build(key, builder, timeout=None):
+    """Асинхронный вариант ``get_or_build``; ``builder`` — корутинная функция."""
+    cache = catalog_cache()
+    timeout = timeout if timeout is not None else getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+    lock_timeout = getattr(settings, 'CATALOG_CACHE_LOCK_TIMEOUT', 5)
+
+    value = await cache.aget(key, _missing)
+    if value is not _missing:
+        _count('hits')
+        return value
+
+    lock_key = key + ':lock'
+    if await cache.aadd(lock_key, 1, lock_timeout):
+        _count('misses')
+        try:
+            value = await builder()
+            await cache.aset(key, value, timeout)
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+        value = await cache.aget(key, _missing)
+        if value is not _missing:
+            _count('hits')
+            _count('waits')
+            return value
+    _count('misses')
+    _count('lock_timeouts')
+    return await builder()
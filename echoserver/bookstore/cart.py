@@ -0,0 +1,389 @@
+"""Корзина покупателя.
+
+Анонимная корзина хранится в серверной сессии компактно — ``{"id книги":
+количество}``. Корзина вошедшего пользователя живёт в ``Cart``/``CartItem``,
+при входе анонимная корзина вливается в неё. Обе реализации дают один
+интерфейс, его возвращает ``get_cart(request)``.
+
+Для значка в шапке у ``Cart`` есть счётчик ``item_count``; он меняется в
+той же транзакции, что и позиции, а его значение кешируется по
+пользователю, так что обычная страница не делает запросов к корзине.
+Кэш ``CART_COUNT_CACHE`` общий для воркеров (bookstore/checks.py). После
+коммита записи в него кладётся значение счётчика из этой транзакции, а
+при чтении кэш заполняется только через ``add`` — значение, прочитанное
+из БД до чужого коммита, не перезапишет более новое. Остаётся окно между
+двумя одновременными изменениями одной корзины; его ограничивает
+``CART_COUNT_TIMEOUT``.
+"""
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from . import book_cache
+from .jobs import enqueue
+from .models import Book, Cart, CartItem, Order, OrderItem
+from .sales import record_order_placed
+
+CART_SESSION_ID = getattr(settings, 'CART_SESSION_ID', 'cart')
+CART_COUNT_CACHE = getattr(settings, 'CART_COUNT_CACHE', 'default')
+CART_COUNT_TIMEOUT = getattr(settings, 'CART_COUNT_TIMEOUT', 600)
+# Наибольшее количество одной книги в позиции корзины
+CART_MAX_QUANTITY = getattr(settings, 'CART_MAX_QUANTITY', 99)
+
+
+def count_key(user_id):
+    return f'cart-count:{user_id}'
+
+
+def _set_cached_count(user_id, count):
+    # После коммита: до него другой воркер ещё видит в БД старое значение
+    transaction.on_commit(
+        lambda: caches[CART_COUNT_CACHE].set(count_key(user_id), count, CART_COUNT_TIMEOUT)
+    )
+
+
+def forget_cached_counts(user_ids):
+    caches[CART_COUNT_CACHE].delete_many([count_key(user_id) for user_id in user_ids])
+
+
+def _quantities(session_cart):
+    quantities = {}
+    for book_id, item in session_cart.items():
+        # Старый формат хранил {quantity, price, title} на каждую строку
+        if isinstance(item, dict):
+            item = item.get('quantity')
+        try:
+            quantity = int(item)
+            if quantity > 0:
+                quantities[int(book_id)] = quantity
+        except (TypeError, ValueError):
+            continue
+    return quantities
+
+
+class SessionCart:
+    def __init__(self, session):
+        self.session = session
+
+    def quantities(self):
+        return _quantities(self.session.get(CART_SESSION_ID, {}))
+
+    async def aquantities(self):
+        # Сессия к этому моменту уже загружена в aresolve_user
+        return self.quantities()
+
+    def count(self):
+        return sum(self.quantities().values())
+
+    async def acount(self):
+        return self.count()
+
+    def _save(self, quantities):
+        if quantities:
+            self.session[CART_SESSION_ID] = {str(book_id): qty for book_id, qty in quantities.items()}
+        else:
+            self.session.pop(CART_SESSION_ID, None)
+
+    def add(self, book_id, quantity=1):
+        quantities = self.quantities()
+        quantities[book_id] = quantities.get(book_id, 0) + quantity
+        self._save(quantities)
+
+    async def aadd(self, book_id, quantity=1):
+        self.add(book_id, quantity)
+
+    def update(self, book_id, quantity):
+        quantities = self.quantities()
+        if quantity > 0:
+            quantities[book_id] = quantity
+        else:
+            quantities.pop(book_id, None)
+        self._save(quantities)
+
+    def remove(self, book_id):
+        quantities = self.quantities()
+        found = quantities.pop(book_id, None) is not None
+        self._save(quantities)
+        return found
+
+    def clear(self):
+        self._save({})
+
+    # Сессия одного браузера: блокировать нечего
+    locked_quantities = quantities
+
+
+class DatabaseCart:
+    """Корзина вошедшего пользователя: одна строка CartItem на книгу."""
+
+    def __init__(self, user):
+        self.user = user
+        self._quantities = None
+
+    def _items(self):
+        return CartItem.objects.filter(cart__user=self.user)
+
+    def quantities(self):
+        if self._quantities is None:
+            self._quantities = dict(self._items().values_list('book_id', 'quantity'))
+        return dict(self._quantities)
+
+    async def aquantities(self):
+        if self._quantities is None:
+            self._quantities = {book_id: quantity async for book_id, quantity
+                                in self._items().values_list('book_id', 'quantity')}
+        return dict(self._quantities)
+
+    def locked_quantities(self):
+        """Содержимое корзины с блокировкой позиций до конца транзакции.
+
+        Параллельное оформление той же корзины ждёт коммита и видит её уже
+        пустой. Блокируются только строки позиций, в том же порядке, что и
+        при изменении корзины (позиции, затем ``Cart``).
+        """
+        self._quantities = None
+        return dict(self._items().select_for_update(of=('self',)).values_list('book_id', 'quantity'))
+
+    def count(self):
+        if self._quantities is not None:
+            return sum(self._quantities.values())
+        cache = caches[CART_COUNT_CACHE]
+        count = cache.get(count_key(self.user.pk))
+        if count is None:
+            count = Cart.objects.filter(user=self.user).values_list('item_count', flat=True).first() or 0
+            cache.add(count_key(self.user.pk), count, CART_COUNT_TIMEOUT)
+        return count
+
+    async def acount(self):
+        if self._quantities is not None:
+            return sum(self._quantities.values())
+        cache = caches[CART_COUNT_CACHE]
+        count = await cache.aget(count_key(self.user.pk))
+        if count is None:
+            count = await Cart.objects.filter(user=self.user).values_list('item_count', flat=True).afirst() or 0
+            await cache.aadd(count_key(self.user.pk), count, CART_COUNT_TIMEOUT)
+        return count
+
+    def _cart(self):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        return cart
+
+    def _shift_count(self, delta):
+        """Вызывается в транзакции изменения позиций."""
+        if delta:
+            carts = Cart.objects.filter(user=self.user)
+            carts.update(item_count=F('item_count') + delta)
+            # Строка заблокирована этим UPDATE до коммита — значение точное
+            _set_cached_count(self.user.pk, carts.values_list('item_count', flat=True).first())
+
+    def _locked_quantity(self, book_id):
+        return self._items().select_for_update().filter(book_id=book_id).values_list('quantity', flat=True).first()
+
+    def add(self, book_id, quantity=1):
+        self._quantities = None
+        with transaction.atomic(savepoint=False):
+            cart = self._cart()
+            written = CartItem.objects.filter(cart=cart, book_id=book_id).update(quantity=F('quantity') + quantity)
+            if not written:
+                try:
+                    with transaction.atomic():
+                        CartItem.objects.create(cart=cart, book_id=book_id, quantity=quantity)
+                    written = 1
+                except IntegrityError:
+                    # Строку успел вставить параллельный запрос. Если и обновлять
+                    # нечего, ошибка была не в уникальности (книгу удалили) —
+                    # позиции нет, и счётчик не меняется
+                    written = CartItem.objects.filter(cart=cart, book_id=book_id).update(
+                        quantity=F('quantity') + quantity)
+            if written:
+                self._shift_count(quantity)
+        return bool(written)
+
+    async def aadd(self, book_id, quantity=1):
+        # Позиция и счётчик меняются в одной транзакции, а у асинхронного ORM их нет
+        return await sync_to_async(self.add)(book_id, quantity)
+
+    def update(self, book_id, quantity):
+        if quantity <= 0:
+            self.remove(book_id)
+            return
+        self._quantities = None
+        with transaction.atomic(savepoint=False):
+            current = self._locked_quantity(book_id)
+            if current is None:
+                self.add(book_id, quantity)
+                return
+            if self._items().filter(book_id=book_id).update(quantity=quantity):
+                self._shift_count(quantity - current)
+
+    def remove(self, book_id):
+        self._quantities = None
+        with transaction.atomic(savepoint=False):
+            current = self._locked_quantity(book_id)
+            if current is None:
+                return False
+            self._items().filter(book_id=book_id).delete()
+            self._shift_count(-current)
+        return True
+
+    def clear(self):
+        self._quantities = None
+        # savepoint=False: внутри place_order точка сохранения не нужна
+        with transaction.atomic(savepoint=False):
+            self._items().delete()
+            Cart.objects.filter(user=self.user).update(item_count=0)
+            _set_cached_count(self.user.pk, 0)
+
+    def merge(self, quantities):
+        """Добавляет количества из анонимной корзины: два-три запроса на любую корзину."""
+        if not quantities:
+            return
+        self._quantities = None
+        with transaction.atomic(savepoint=False):
+            cart = self._cart()
+            existing = {item.book_id: item for item in
+                        CartItem.objects.select_for_update().filter(cart=cart, book_id__in=list(quantities))}
+            for item in existing.values():
+                item.quantity += quantities[item.book_id]
+            CartItem.objects.bulk_update(existing.values(), ['quantity'])
+            # Книги, удалённые из каталога, пока товар лежал в анонимной корзине, пропускаем
+            available = Book.objects.filter(pk__in=[pk for pk in quantities if pk not in existing])
+            created = CartItem.objects.bulk_create([
+                CartItem(cart=cart, book_id=book_id, quantity=quantities[book_id])
+                for book_id in available.values_list('pk', flat=True)
+            ])
+            self._shift_count(sum(quantities[item.book_id] for item in [*existing.values(), *created]))
+
+
+def get_cart(request):
+    """Корзина текущего запроса; создаётся один раз на запрос."""
+    cart = getattr(request, '_cart', None)
+    user = getattr(request, 'user', None)
+    authenticated = user is not None and user.is_authenticated
+    if cart is None or isinstance(cart, DatabaseCart) != authenticated:
+        cart = DatabaseCart(user) if authenticated else SessionCart(request.session)
+        request._cart = cart
+    return cart
+
+
+def merge_session_cart(request, user):
+    """Переносит анонимную корзину из сессии в корзину пользователя."""
+    session_cart = SessionCart(request.session)
+    quantities = session_cart.quantities()
+    if quantities:
+        DatabaseCart(user).merge(quantities)
+        session_cart.clear()
+    request._cart = None
+
+
+def _actual_count():
+    quantities = (
+        CartItem.objects.filter(cart=OuterRef('pk'))
+        .values('cart')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return Coalesce(Subquery(quantities), 0)
+
+
+def repair_counts(batch_size=1000, dry_run=False):
+    """Сверяет ``Cart.item_count`` с позициями и исправляет расхождения.
+
+    Закешированные счётчики проверенных корзин сбрасываются. Возвращает
+    (проверено корзин, исправлено).
+    """
+    checked = fixed = 0
+    last = 0
+    while True:
+        rows = list(
+            Cart.objects.filter(pk__gt=last).order_by('pk').annotate(actual=_actual_count())
+            .values_list('pk', 'user_id', 'item_count', 'actual')[:batch_size]
+        )
+        if not rows:
+            break
+        last = rows[-1][0]
+        checked += len(rows)
+        wrong = [pk for pk, _, stored, actual in rows if stored != actual]
+        fixed += len(wrong)
+        if dry_run:
+            continue
+        if wrong:
+            # Пересчёт в самом UPDATE: изменения корзины между чтением и записью не теряются
+            Cart.objects.filter(pk__in=wrong).update(item_count=_actual_count())
+        forget_cached_counts([user_id for _, user_id, _, _ in rows])
+    return checked, fixed
+
+
+def resolve_cart(quantities):
+    """Строки корзины одним запросом к БД, с актуальными ценами.
+
+    Книги, которых больше нет в каталоге, пропускаются.
+    """
+    return _build_lines(quantities, Book.objects.in_bulk(list(quantities)))
+
+
+async def aresolve_cart(quantities):
+    return _build_lines(quantities, await Book.objects.ain_bulk(list(quantities)))
+
+
+def summarize_cart(quantities):
+    """Строки корзины для показа — из кэша сводок книг, обычно без запросов к БД."""
+    return _build_lines(quantities, book_cache.get_many(quantities))
+
+
+async def asummarize_cart(quantities):
+    return _build_lines(quantities, await book_cache.aget_many(quantities))
+
+
+def _build_lines(quantities, books):
+    lines = []
+    total = Decimal('0')
+    for book_id, quantity in quantities.items():
+        book = books.get(book_id)
+        if book is None or quantity <= 0:
+            continue
+        subtotal = book.price * quantity
+        lines.append({
+            'book': book,
+            'quantity': quantity,
+            'price': book.price,
+            'subtotal': subtotal,
+        })
+        total += subtotal
+    return lines, total
+
+
+def place_order(user, cart):
+    """Создаёт заказ со всеми позициями и очищает корзину в одной транзакции.
+
+    Цены берутся из БД, а не из корзины. Позиции читаются с блокировкой,
+    поэтому двойная отправка формы не создаст два заказа. Число запросов не
+    зависит от размера корзины: чтение позиций, выборка книг, вставка
+    заказа, один bulk_create, очистка корзины, по одному запросу на каждую
+    сводную таблицу продаж и постановка задачи рекомендаций. Возвращает
+    None, если корзина уже пуста или в ней не осталось доступных книг.
+    """
+    with transaction.atomic():
+        lines, total = resolve_cart(cart.locked_quantities())
+        cart.clear()
+        if not lines:
+            return None
+        order = Order.objects.create(
+            user=user,
+            total_price=total,
+            status='P',
+            item_count=sum(line['quantity'] for line in lines),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, book=line['book'], quantity=line['quantity'], price=line['price'])
+            for line in lines
+        ])
+        record_order_placed(order, lines)
+        # Рекомендации пополняются в фоне; задача станет видна воркеру после коммита
+        enqueue('fold_order_recommendations', order_id=order.pk)
+    return order
@@ -0,0 +1,182 @@
+"""Проверки ``manage.py check``: общие кэши и тяжёлая работа при импорте модулей.
+
+Версия каталога и другое общее состояние живут в кэше. При нескольких
+процессах-воркерах (``WORKER_PROCESSES``) этот кэш должен быть общим:
+locmem у каждого процесса свой, и изменение, сделанное одним воркером,
+остальные не увидят никогда.
+
+Код на верхнем уровне модуля (и в телах классов, декораторах, значениях
+аргументов по умолчанию) выполняется при импорте, то есть в каждом новом
+воркере до первого ответа, а запросы к БД до fork ещё и делят одно
+соединение между процессами. Проверка разбирает исходники приложений
+проекта и ищет там запросы к БД, кэшу, сети и файлам, рендеринг шаблонов и
+``reverse()``. Время импорта по модулям показывает команда profile_startup.
+"""
+import ast
+from importlib import import_module
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+# Методы менеджера/QuerySet, которые выполняют запрос
+QUERY_METHODS = {
+    'get', 'first', 'last', 'count', 'exists', 'aggregate', 'create', 'get_or_create',
+    'update_or_create', 'update', 'delete', 'in_bulk', 'bulk_create', 'earliest', 'latest', 'iterator',
+}
+# Встроенные функции, которые вычисляют переданный QuerySet
+EVALUATING = {'list', 'tuple', 'set', 'dict', 'len', 'sorted', 'sum', 'any', 'all'}
+CACHE_METHODS = {'get', 'set', 'add', 'get_many', 'set_many', 'incr', 'delete', 'get_or_set'}
+# Имя вызываемой функции -> что она делает
+HEAVY_CALLS = {
+    'cursor': 'запрос к БД',
+    'reverse': 'разрешение URL (используйте reverse_lazy)',
+    'get_template': 'загрузка шаблона',
+    'select_template': 'загрузка шаблона',
+    'render_to_string': 'рендеринг шаблона',
+    'open': 'чтение файла',
+    'urlopen': 'сетевой запрос',
+    'sleep': 'ожидание',
+}
+NETWORK_MODULES = {'requests', 'httpx', 'subprocess', 'socket'}
+# Настройки с алиасом кэша, который должен быть общим для всех воркеров
+SHARED_CACHE_SETTINGS = ('CATALOG_CACHE_ALIAS', 'CART_COUNT_CACHE', 'LOGIN_THROTTLE_CACHE')
+# Бэкенды, состояние которых не видно другим процессам
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+SKIP_DIRS = {'migrations', 'tests', '__pycache__'}
+
+
+def _chain(node):
+    """``Book.objects.filter(...).count`` -> ['Book', 'objects', 'filter', 'count']."""
+    names = []
+    while True:
+        if isinstance(node, ast.Attribute):
+            names.append(node.attr)
+            node = node.value
+        elif isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.Subscript):
+            node = node.value
+        elif isinstance(node, ast.Name):
+            names.append(node.id)
+            return names[::-1]
+        else:
+            return names[::-1]
+
+
+def heavy_call(call):
+    """Описание тяжёлой работы, которую делает вызов, или None."""
+    chain = _chain(call.func)
+    if not chain:
+        return None
+    name = chain[-1]
+    if 'objects' in chain[:-1] and name in QUERY_METHODS:
+        return 'запрос к БД'
+    if len(chain) == 1 and name in EVALUATING and any(
+        'objects' in _chain(argument) for argument in call.args
+    ):
+        return 'запрос к БД'
+    if chain[0] in ('cache', 'caches') and name in CACHE_METHODS:
+        return 'обращение к кэшу'
+    if chain[0] in NETWORK_MODULES and len(chain) > 1:
+        return f'вызов {chain[0]}'
+    return HEAVY_CALLS.get(name)
+
+
+class ImportTimeVisitor(ast.NodeVisitor):
+    """Обходит только то, что выполняется при импорте модуля."""
+
+    def __init__(self):
+        self.found = []
+
+    def visit_FunctionDef(self, node):
+        for child in (*node.decorator_list, *node.args.defaults, *filter(None, node.args.kw_defaults)):
+            self.visit(child)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        for child in (*node.args.defaults, *filter(None, node.args.kw_defaults)):
+            self.visit(child)
+
+    def visit_If(self, node):
+        test = node.test
+        if isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == '__name__':
+            # if __name__ == '__main__': — не при импорте
+            for child in node.orelse:
+                self.visit(child)
+            return
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        what = heavy_call(node)
+        if what:
+            self.found.append((node.lineno, what, ast.unparse(node.func)))
+        self.generic_visit(node)
+
+
+def scan_source(source, filename='<unknown>'):
+    """``[(строка, что, вызов)]`` — тяжёлые вызовы при импорте модуля."""
+    visitor = ImportTimeVisitor()
+    visitor.visit(ast.parse(source, filename))
+    return visitor.found
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs=None, **kwargs):
+    if getattr(settings, 'WORKER_PROCESSES', 1) <= 1:
+        return []
+    errors = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name, 'default')
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PROCESS_LOCAL_CACHES:
+            errors.append(Error(
+                f'{name} = {alias!r}: {backend.rsplit(".", 1)[-1]} не общий для '
+                f'{settings.WORKER_PROCESSES} процессов',
+                hint='Используйте file (одна машина) или redis: CATALOG_CACHE_BACKEND=file|redis.',
+                obj=name,
+                id='bookstore.E001',
+            ))
+    return errors
+
+
+def _project_dirs(app_configs):
+    base_dir = Path(settings.BASE_DIR).resolve()
+    if app_configs is None:
+        app_configs = apps.get_app_configs()
+        yield Path(import_module(settings.ROOT_URLCONF).__file__).resolve().parent
+    for app_config in app_configs:
+        path = Path(app_config.path).resolve()
+        if base_dir in path.parents:
+            yield path
+
+
+def _sources(directory):
+    for path in sorted(directory.rglob('*.py')):
+        if not SKIP_DIRS.intersection(path.relative_to(directory).parts[:-1]):
+            yield path
+
+
+@register('startup')
+def check_import_time_work(app_configs=None, **kwargs):
+    base_dir = Path(settings.BASE_DIR).resolve()
+    warnings = []
+    for directory in dict.fromkeys(_project_dirs(app_configs)):
+        for path in _sources(directory):
+            try:
+                found = scan_source(path.read_text(encoding='utf-8'), str(path))
+            except (SyntaxError, UnicodeDecodeError):
+                continue
+            for lineno, what, call in found:
+                warnings.append(Warning(
+                    f'{call}() при импорте модуля: {what}',
+                    hint='Перенесите вызов в функцию или выполните его лениво при первом использовании.',
+                    obj=f'{path.relative_to(base_dir)}:{lineno}',
+                    id='bookstore.W001',
+                ))
+    return warnings
@@ -0,0 +1,93 @@
+"""Валидаторы для условных GET (ETag/Last-Modified).
+
+Валидаторы считаются до рендеринга, так что при совпадении клиент получает
+304 без обращения к шаблонам. Для каталога это версия каталога из общего
+кэша (bookstore/cache.py) — без запросов к БД; для заказов — дешёвые запросы по
+индексам плюс та же версия, потому что на страницах заказов видны названия
+и авторы книг. В ETag входят части страницы, зависящие от пользователя
+(имя, роль, корзина, CSRF-токен).
+Если в сессии есть непоказанные сообщения, валидаторы не выдаются и
+страница рендерится целиком.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+
+from .cache import catalog_state
+from .cart import get_cart
+from .models import Order
+
+
+def _has_pending_messages(request):
+    return len(get_messages(request)) > 0
+
+
+def user_state(request):
+    user = request.user
+    # От корзины на страницах зависит только значок с числом товаров
+    return [
+        user.pk or '',
+        user.is_authenticated and user.is_admin(),
+        get_cart(request).count(),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+
+
+def _is_personalized(request):
+    return request.user.is_authenticated or get_cart(request).count() > 0
+
+
+def _etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _catalog_state(request):
+    if not hasattr(request, '_catalog_state'):
+        request._catalog_state = catalog_state()
+    return request._catalog_state
+
+
+def catalog_etag(request, *args, **kwargs):
+    if _has_pending_messages(request):
+        return None
+    version, _ = _catalog_state(request)
+    return _etag('catalog', version, request.GET.urlencode(), user_state(request))
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    # Last-Modified не учитывает пользователя, поэтому только для «обезличенных» страниц
+    if _has_pending_messages(request) or _is_personalized(request):
+        return None
+    return _catalog_state(request)[1]
+
+
+def live_order(request, order_id):
+    """``(updated_at, status)`` заказа пользователя из рабочей таблицы или None —
+    заказа там нет (в архиве или чужой). Валидатор и представление делят
+    один запрос на HTTP-запрос."""
+    if not hasattr(request, '_live_orders'):
+        request._live_orders = {}
+    if order_id not in request._live_orders:
+        request._live_orders[order_id] = (
+            Order.objects.filter(pk=order_id, user=request.user).values_list('updated_at', 'status').first()
+        )
+    return request._live_orders[order_id]
+
+
+def order_etag(request, order_id, *args, **kwargs):
+    if _has_pending_messages(request):
+        return None
+    row = live_order(request, order_id)
+    if row is None:
+        return None
+    return _etag('order', order_id, row, _catalog_state(request)[0], user_state(request))
+
+
+def order_list_etag(request, *args, **kwargs):
+    if _has_pending_messages(request):
+        return None
+    validators = Order.objects.filter(user=request.user).aggregate(last=Max('updated_at'), count=Count('id'))
+    return _etag('orders', validators['last'], validators['count'], _catalog_state(request)[0],
+                 request.GET.urlencode(), user_state(request))
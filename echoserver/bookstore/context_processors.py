@@ -0,0 +1,20 @@
+from .cart import get_cart
+
+
+def cart_badge(request):
+    """Число позиций в корзине для значка в шапке.
+
+    Асинхронные представления считают его заранее (``request.cart_badge_count``),
+    потому что шаблон в асинхронном контексте не может обращаться к БД.
+    Иначе значение вычисляется лениво — только если шаблон его выводит;
+    количества корзины кешируются на запросе, так что страница корзины
+    второй раз в БД не ходит.
+    """
+    count = getattr(request, 'cart_badge_count', None)
+    if count is not None:
+        return {'cart_badge_count': count}
+
+    def count_items():
+        return get_cart(request).count()
+
+    return {'cart_badge_count': count_items}
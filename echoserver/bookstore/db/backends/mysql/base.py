@@ -0,0 +1,10 @@
+"""MySQL с пулом соединений: ``'ENGINE': 'bookstore.db.backends.mysql'``."""
+from django.db.backends.mysql import base
+
+from ..pooled import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def check_pooled_connection(self, connection):
+        # mysqlclient: без SQL-запроса, одним пакетом COM_PING
+        connection.ping()
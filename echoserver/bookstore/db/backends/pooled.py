@@ -0,0 +1,75 @@
+"""Общая часть бэкендов с пулом соединений (см. bookstore/db/pool.py).
+
+Настройки пула — ключ ``POOL`` в ``DATABASES[alias]``::
+
+    'POOL': {'MIN_SIZE': 2, 'MAX_SIZE': 10, 'TIMEOUT': 5,
+             'MAX_AGE': 1800, 'MAX_IDLE': 300, 'CHECK_IDLE': 5}
+
+``CONN_MAX_AGE`` должен оставаться 0: Django «закрывает» соединение в
+конце запроса, и оно возвращается в пул, а не держится потоком.
+"""
+from functools import partial
+
+from ..pool import ConnectionPool, PoolTimeout, get_pool
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5.0,
+    'MAX_AGE': 1800.0,
+    'MAX_IDLE': 300.0,
+    'CHECK_IDLE': 5.0,
+}
+
+
+class PooledDatabaseWrapperMixin:
+    pool_entry = None
+    connection_pool = None
+
+    def _create_pool(self, conn_params):
+        options = {**POOL_DEFAULTS, **(self.settings_dict.get('POOL') or {})}
+        pool = ConnectionPool(
+            connect=partial(super().get_new_connection, conn_params),
+            check=self.check_pooled_connection,
+            close=lambda connection: connection.close(),
+            **{name.lower(): value for name, value in options.items()},
+        )
+        pool.fill()
+        return pool
+
+    def check_pooled_connection(self, connection):
+        """Проверка соединения перед выдачей из пула; исключение — соединение сломано."""
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def get_new_connection(self, conn_params):
+        self.connection_pool = get_pool(self.alias, conn_params, partial(self._create_pool, conn_params))
+        try:
+            self.pool_entry = self.connection_pool.acquire()
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+        return self.pool_entry.connection
+
+    def init_connection_state(self):
+        # Команды инициализации сессии — один раз на физическое соединение
+        if self.pool_entry is not None and self.pool_entry.initialized:
+            return
+        super().init_connection_state()
+        if self.pool_entry is not None:
+            self.pool_entry.initialized = True
+
+    def _close(self):
+        entry, self.pool_entry = self.pool_entry, None
+        if entry is None:
+            return super()._close()
+        # Закрытое посреди транзакции или после ошибки соединение в пул не возвращается
+        discard = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+        if not discard and not self.autocommit:
+            try:
+                self.connection.rollback()
+            except self.Database.Error:
+                discard = True
+        self.connection_pool.release(entry, discard=discard)
@@ -0,0 +1,238 @@
+"""Пул соединений с БД, общий для всех потоков процесса.
+
+Django держит по соединению на поток и без ``CONN_MAX_AGE`` закрывает его
+в конце каждого запроса. Обёртка бэкенда (bookstore/db/backends) вместо
+этого берёт соединение из пула при подключении и возвращает при закрытии,
+так что рукопожатие, авторизация и команды инициализации выполняются
+один раз на соединение, а их число ограничено ``MAX_SIZE`` на процесс.
+
+Пул ничего не знает о конкретной СУБД: открытие, проверка и закрытие
+соединения передаются функциями.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Свободное соединение не появилось за ``timeout`` секунд."""
+
+
+class PooledConnection:
+    __slots__ = ('connection', 'created_at', 'released_at', 'initialized')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = self.released_at = time.monotonic()
+        # Команды инициализации сессии уже выполнены
+        self.initialized = False
+
+
+class ConnectionPool:
+    """Ограниченный пул: ``min_size`` соединений держится открытыми,
+    больше ``max_size`` не открывается — лишние потоки ждут до ``timeout``.
+
+    Соединение старше ``max_age`` закрывается при возврате, простоявшее
+    дольше ``check_idle`` проверяется ``check()`` при выдаче, лишнее сверх
+    ``min_size`` закрывается, если простояло дольше ``max_idle``.
+    """
+
+    def __init__(self, connect, check, close, min_size=1, max_size=10, timeout=5.0,
+                 max_age=1800.0, max_idle=300.0, check_idle=5.0):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Нужно 0 <= MIN_SIZE <= MAX_SIZE и MAX_SIZE >= 1')
+        self._connect = connect
+        self._check = check
+        self._close = close
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.check_idle = check_idle
+        self._idle = []
+        self._size = 0
+        self._lock = threading.Condition()
+        self._stats = dict.fromkeys(
+            ('opened', 'closed', 'borrowed', 'waited', 'timeouts', 'failed_checks', 'recycled'), 0,
+        )
+        self._wait_time = 0.0
+        # Закрытый пул (сменились параметры подключения) не принимает соединения назад
+        self.closed = False
+
+    def _open(self):
+        try:
+            return PooledConnection(self._connect())
+        except BaseException:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+    def _discard(self, entry):
+        try:
+            self._close(entry.connection)
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._lock.notify()
+
+    def _expired(self, entry, now):
+        return self.max_age is not None and now - entry.created_at >= self.max_age
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            with self._lock:
+                entry = None
+                while entry is None:
+                    if self._idle:
+                        # LIFO: горячие соединения переиспользуются, хвост простаивает и закрывается
+                        entry = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        self._stats['opened'] += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats['timeouts'] += 1
+                            raise PoolTimeout(
+                                'Нет свободного соединения за %.1f с (занято %d)' % (self.timeout, self._size)
+                            )
+                        if not waited:
+                            waited = True
+                            self._stats['waited'] += 1
+                        started = time.monotonic()
+                        self._lock.wait(remaining)
+                        self._wait_time += time.monotonic() - started
+                stale = self._prune_idle()
+            for old in stale:
+                self._discard(old)
+            if entry is None:
+                entry = self._open()
+                self._count('borrowed')
+                return entry
+            now = time.monotonic()
+            if self._expired(entry, now):
+                self._count('recycled')
+                self._discard(entry)
+                continue
+            if now - entry.released_at >= self.check_idle:
+                try:
+                    self._check(entry.connection)
+                except Exception:
+                    self._count('failed_checks')
+                    self._discard(entry)
+                    continue
+            self._count('borrowed')
+            return entry
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _prune_idle(self):
+        # Вызывается под блокировкой; соединения закрываются уже без неё
+        if self.max_idle is None or self._size <= self.min_size:
+            return []
+        now = time.monotonic()
+        stale = []
+        # Самые давно простаивающие — в начале списка
+        while self._idle and self._size - len(stale) > self.min_size \
+                and now - self._idle[0].released_at >= self.max_idle:
+            stale.append(self._idle.pop(0))
+        return stale
+
+    def _busy(self):
+        return self._size - len(self._idle)
+
+    def release(self, entry, discard=False):
+        """Возвращает соединение; ``discard=True`` — соединение сломано и закрывается."""
+        now = time.monotonic()
+        if not discard and self._expired(entry, now):
+            self._count('recycled')
+            discard = True
+        if discard or self.closed:
+            self._discard(entry)
+            return
+        entry.released_at = now
+        with self._lock:
+            self._idle.append(entry)
+            self._lock.notify()
+
+    def fill(self):
+        """Открывает соединения до ``min_size`` — прогрев при старте."""
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+                self._stats['opened'] += 1
+            entry = self._open()
+            entry.released_at = time.monotonic()
+            with self._lock:
+                self._idle.append(entry)
+                self._lock.notify()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._discard(entry)
+
+    def close(self):
+        """Закрывает свободные соединения; выданные закроются при возврате."""
+        self.closed = True
+        self.close_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._busy(),
+                'max_size': self.max_size,
+                'wait_time': round(self._wait_time, 3),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def params_fingerprint(params):
+    """Отпечаток параметров подключения; пароль попадает в него только хешем."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def get_pool(alias, params, factory):
+    """Пул для алиаса БД в текущем процессе; после fork создаётся новый.
+
+    Пул открывает соединения с параметрами, с которыми был создан. Если
+    ``settings_dict`` алиаса изменился (другая база в тестах, новый пароль),
+    старый пул закрывается и создаётся новый.
+    """
+    key = (alias, os.getpid())
+    fingerprint = params_fingerprint(params)
+    current = _pools.get(key)
+    if current is None or current[0] != fingerprint:
+        with _pools_lock:
+            current = _pools.get(key)
+            if current is None or current[0] != fingerprint:
+                if current is not None:
+                    current[1].close()
+                current = _pools[key] = (fingerprint, factory())
+    return current[1]
+
+
+def pool_stats():
+    """Метрики пулов текущего процесса: ``{алиас: {...}}``."""
+    pid = os.getpid()
+    return {alias: pool.stats() for (alias, owner), (_, pool) in list(_pools.items()) if owner == pid}
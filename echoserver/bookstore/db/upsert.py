@@ -0,0 +1,41 @@
+"""Инкрементальные счётчики одним запросом: INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE."""
+from django.db import connections, router
+
+
+def upsert_increments(model, key_fields, counter_fields, deltas):
+    """Прибавляет ``deltas`` = {(ключ...): [счётчики]} к строкам ``model``.
+
+    Недостающие строки вставляются. По ``key_fields`` у модели должно быть
+    ограничение уникальности.
+    """
+    if not deltas:
+        return
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    fields = [opts.get_field(name) for name in (*key_fields, *counter_fields)]
+    columns = [qn(field.column) for field in fields]
+    key_columns = columns[:len(key_fields)]
+    counter_columns = columns[len(key_fields):]
+
+    row_sql = '(%s)' % ', '.join(['%s'] * len(fields))
+    params = []
+    for key, counters in deltas.items():
+        for field, value in zip(fields, (*key, *counters)):
+            params.append(field.get_db_prep_save(value, connection))
+
+    sql = 'INSERT INTO %s (%s) VALUES %s' % (
+        qn(opts.db_table), ', '.join(columns), ', '.join([row_sql] * len(deltas)),
+    )
+    if connection.vendor == 'mysql':
+        sql += ' ON DUPLICATE KEY UPDATE ' + ', '.join(
+            '%s = %s + VALUES(%s)' % (column, column, column) for column in counter_columns
+        )
+    else:
+        # PostgreSQL и SQLite 3.24+
+        sql += ' ON CONFLICT (%s) DO UPDATE SET ' % ', '.join(key_columns) + ', '.join(
+            '%s = %s.%s + EXCLUDED.%s' % (column, qn(opts.db_table), column, column)
+            for column in counter_columns
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
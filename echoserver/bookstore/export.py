@@ -0,0 +1,150 @@
+"""Потоковая выгрузка каталога и заказов в NDJSON/CSV.
+
+Строки читаются пачками по первичному ключу (``pk > последний`` + LIMIT),
+каждая пачка — через ``QuerySet.iterator(chunk_size=...)`` без кеша
+результатов. Так память не зависит от размера таблицы на любом бэкенде:
+mysqlclient, в отличие от psycopg, не умеет серверные курсоры и иначе
+забрал бы весь результат одного запроса в память клиента.
+
+Под ASGI Django 4.2 собирает синхронный итератор ответа в список целиком
+(``sync_to_async(list)``), поэтому там строки отдаются через ``aiter_lines()``:
+пачками строк, каждая пачка читается в потоке для синхронного кода.
+"""
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ArchivedOrderItem, Book, OrderItem
+
+BOOK_FIELDS = ('id', 'isbn', 'title', 'author', 'price', 'description',
+               'published_date', 'created_at', 'updated_at')
+DEFAULT_BOOK_FIELDS = ('id', 'isbn', 'title', 'author', 'price', 'published_date')
+
+ORDER_ITEM_FIELDS = {
+    'order_id': 'order_id',
+    'order_created_at': 'order__created_at',
+    'order_status': 'order__status',
+    'user_id': 'order__user_id',
+    'order_total': 'order__total_price',
+    'item_id': 'id',
+    'book_id': 'book_id',
+    'isbn': 'book__isbn',
+    'title': 'book__title',
+    'quantity': 'quantity',
+    'price': 'price',
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+# Строк на один переход в синхронный поток при отдаче под ASGI
+ASYNC_LINES = 500
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_fields(value, allowed=BOOK_FIELDS, default=DEFAULT_BOOK_FIELDS):
+    """``"id,title"`` -> ``('id', 'title')``; неизвестные поля — ExportError."""
+    if not value:
+        return tuple(default)
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ExportError('Неизвестные поля: %s' % ', '.join(unknown))
+    return fields or tuple(default)
+
+
+def iter_batches(queryset, chunk_size=DEFAULT_CHUNK_SIZE, key='pk'):
+    """Словари из ``queryset.values(...)`` пачками по возрастанию ``key``.
+
+    ``key`` должен входить в выбранные значения и быть уникальным.
+    """
+    last = None
+    while True:
+        batch = queryset.order_by(key)
+        if last is not None:
+            batch = batch.filter(**{'%s__gt' % key: last})
+        count = 0
+        for row in batch[:chunk_size].iterator(chunk_size=chunk_size):
+            count += 1
+            last = row[key]
+            yield row
+        if count < chunk_size:
+            return
+
+
+def book_rows(fields, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    queryset = Book.objects.all() if queryset is None else queryset
+    columns = tuple(dict.fromkeys(('id',) + tuple(fields)))
+    for row in iter_batches(queryset.values(*columns), chunk_size, key='id'):
+        yield {name: row[name] for name in fields}
+
+
+def order_item_rows(start=None, end=None, fields=tuple(ORDER_ITEM_FIELDS), chunk_size=DEFAULT_CHUNK_SIZE):
+    """Позиции заказов с данными заказа; ``start``/``end`` — границы created_at [start, end).
+
+    Сначала архивные заказы, потом рабочие: поля у них одинаковые.
+    """
+    lookups = [ORDER_ITEM_FIELDS[name] for name in fields]
+    columns = tuple(dict.fromkeys(['id'] + lookups))
+    for model in (ArchivedOrderItem, OrderItem):
+        queryset = model.objects.all()
+        if start is not None:
+            queryset = queryset.filter(order__created_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(order__created_at__lt=end)
+        for row in iter_batches(queryset.values(*columns), chunk_size, key='id'):
+            yield {name: row[lookup] for name, lookup in zip(fields, lookups)}
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[name] for name in fields])
+
+
+def encode(rows, fields, fmt):
+    if fmt == 'ndjson':
+        return ndjson_lines(rows)
+    if fmt == 'csv':
+        return csv_lines(rows, fields)
+    raise ExportError(f'Неизвестный формат: {fmt}')
+
+
+async def aiter_lines(lines, batch=None):
+    """Асинхронный итератор поверх синхронного генератора строк — для ASGI.
+
+    Генератор читает БД, поэтому продвигается только в потоке для
+    синхронного кода (thread_sensitive): там живёт его соединение и курсор.
+    """
+    lines = iter(lines)
+    batch = batch or ASYNC_LINES
+    next_chunk = sync_to_async(lambda: ''.join(itertools.islice(lines, batch)), thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk()
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        # Клиент отключился — генератор закрывается там же, где работал
+        await sync_to_async(getattr(lines, 'close', lambda: None), thread_sensitive=True)()
@@ -0,0 +1,236 @@
+"""Фасетная навигация по каталогу: автор, ценовой диапазон, год издания.
+
+``BookFacetCount`` — число книг для каждого сочетания (автор, диапазон,
+год). Таблица намного меньше ``Book``, и счётчики для боковой панели при
+любом наборе фильтров считаются по ней: по одному запросу на фасет, где
+действуют фильтры двух других фасетов. Сами книги выбираются по индексам
+``Book`` с той же keyset-пагинацией, что и весь каталог.
+
+Счётчики меняются в той же транзакции, что и книги: сигналы
+post_save/post_delete, массовый импорт и генерация тестовых данных.
+``QuerySet.update()`` их не меняет: массовую правку нужно окружить
+``current_keys()``/``record_updated()`` (так делает действие админки
+«Изменить цену»), иначе после неё нужна команда rebuild_book_facets.
+"""
+import datetime
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.http import urlencode
+
+from .db.upsert import upsert_increments
+from .models import Book, BookFacetCount
+
+# Нижние границы ценовых диапазонов, руб.
+PRICE_BANDS = tuple(getattr(settings, 'BOOK_PRICE_BANDS', (0, 200, 500, 1000, 2000)))
+# Сколько самых частых авторов показывать в панели
+AUTHOR_LIMIT = getattr(settings, 'FACET_AUTHOR_LIMIT', 20)
+# Год для книг без даты публикации: NULL в уникальном ключе не совпал бы сам с собой
+NO_YEAR = 0
+KEY_FIELDS = ('author', 'price', 'published_date')
+DIMENSIONS = ('author', 'price_band', 'year')
+# Имена GET-параметров фасетов
+PARAMS = {'author': 'author', 'price_band': 'price', 'year': 'year'}
+# Книг на один запрос при поправке счётчиков после массовой правки
+BATCH_SIZE = 1000
+
+
+def price_band(price):
+    """Нижняя граница диапазона, в который попадает цена."""
+    return PRICE_BANDS[max(bisect_right(PRICE_BANDS, price) - 1, 0)]
+
+
+def band_bounds(band):
+    """``(от, до)`` диапазона; у последнего верхней границы нет."""
+    index = PRICE_BANDS.index(band)
+    upper = PRICE_BANDS[index + 1] if index + 1 < len(PRICE_BANDS) else None
+    return band, upper
+
+
+def facet_key(author, price, published_date):
+    return author, price_band(price), published_date.year if published_date else NO_YEAR
+
+
+def book_key(book):
+    return facet_key(*(getattr(book, field) for field in KEY_FIELDS))
+
+
+def loaded_key(book):
+    """Ключ книги на момент загрузки из БД (или None для новой)."""
+    values = getattr(book, '_facet_values', None)
+    return facet_key(*values) if values else None
+
+
+def stored_key(book_id):
+    row = Book.objects.filter(pk=book_id).values_list(*KEY_FIELDS).first()
+    return facet_key(*row) if row else None
+
+
+def apply(deltas):
+    """Прибавляет ``deltas`` = Counter{(автор, диапазон, год): ±книг}."""
+    upsert_increments(
+        BookFacetCount, DIMENSIONS, ('books',),
+        {key: [delta] for key, delta in deltas.items() if delta},
+    )
+
+
+def record_added(books):
+    apply(Counter(book_key(book) for book in books))
+
+
+def record_saved(book, old_key):
+    deltas = Counter({book_key(book): 1})
+    if old_key is not None:
+        deltas[old_key] -= 1
+    apply(deltas)
+
+
+def record_deleted(book):
+    apply(Counter({loaded_key(book) or book_key(book): -1}))
+
+
+def current_keys(queryset):
+    """``{id: ключ}`` книг выборки — перед массовым UPDATE, в его транзакции."""
+    return {
+        pk: facet_key(*values)
+        for pk, *values in queryset.order_by().values_list('pk', *KEY_FIELDS).iterator(chunk_size=BATCH_SIZE)
+    }
+
+
+def record_updated(old_keys):
+    """Поправка счётчиков после массового UPDATE книг из ``current_keys()``."""
+    deltas = Counter()
+    ids = list(old_keys)
+    for start in range(0, len(ids), BATCH_SIZE):
+        rows = Book.objects.filter(pk__in=ids[start:start + BATCH_SIZE]).values_list('pk', *KEY_FIELDS)
+        for pk, *values in rows:
+            deltas[facet_key(*values)] += 1
+            deltas[old_keys[pk]] -= 1
+    apply(deltas)
+
+
+def rebuild(batch_size=5000):
+    """Пересчитывает все счётчики по таблице книг. Возвращает число сочетаний."""
+    totals = Counter(
+        facet_key(*row)
+        for row in Book.objects.order_by().values_list(*KEY_FIELDS).iterator(chunk_size=batch_size)
+    )
+    with transaction.atomic():
+        BookFacetCount.objects.all().delete()
+        BookFacetCount.objects.bulk_create([
+            BookFacetCount(author=author, price_band=band, year=year, books=books)
+            for (author, band, year), books in totals.items()
+        ], batch_size=batch_size)
+    return len(totals)
+
+
+def parse_filters(params):
+    """Фильтры из GET-параметров ``author``, ``price``, ``year``; некорректные пропускаются."""
+    filters = {}
+    author = params.get('author', '').strip()
+    if author:
+        filters['author'] = author
+    try:
+        price = Decimal(params.get('price', ''))
+    except InvalidOperation:
+        price = None
+    # Сравнение без int(): у Infinity это OverflowError, а 1e999999 строится
+    # в огромное целое секундами
+    if price is not None and price.is_finite() and price in PRICE_BANDS:
+        filters['price_band'] = int(price)
+    year = params.get('year', '')
+    if year.isdigit() and (int(year) == NO_YEAR or datetime.MINYEAR <= int(year) < datetime.MAXYEAR):
+        filters['year'] = int(year)
+    return filters
+
+
+def filter_books(queryset, filters):
+    """Условия по полям ``Book``: каждое попадает в свой индекс."""
+    if 'author' in filters:
+        queryset = queryset.filter(author=filters['author'])
+    if 'price_band' in filters:
+        lower, upper = band_bounds(filters['price_band'])
+        queryset = queryset.filter(price__gte=lower)
+        if upper is not None:
+            queryset = queryset.filter(price__lt=upper)
+    if 'year' in filters:
+        year = filters['year']
+        if year == NO_YEAR:
+            queryset = queryset.filter(published_date__isnull=True)
+        else:
+            queryset = queryset.filter(
+                published_date__gte=datetime.date(year, 1, 1),
+                published_date__lt=datetime.date(year + 1, 1, 1),
+            )
+    return queryset
+
+
+def _facet_querysets(filters):
+    for dimension in DIMENSIONS:
+        others = {name: value for name, value in filters.items() if name != dimension}
+        queryset = (
+            BookFacetCount.objects.filter(books__gt=0, **others)
+            .values_list(dimension).annotate(total=Sum('books'))
+        )
+        if dimension == 'author':
+            queryset = queryset.order_by('-total', 'author')[:AUTHOR_LIMIT]
+        else:
+            queryset = queryset.order_by(dimension)
+        yield dimension, queryset
+
+
+def filter_query(filters, **changes):
+    """Строка запроса для фильтров с изменениями; значение None снимает фильтр."""
+    merged = {**filters, **changes}
+    return urlencode([
+        (PARAMS[dimension], merged[dimension])
+        for dimension in DIMENSIONS if merged.get(dimension) is not None
+    ])
+
+
+def _item(filters, dimension, value, count):
+    selected = filters.get(dimension) == value
+    return {
+        'value': value,
+        'count': count,
+        'selected': selected,
+        # Повторный выбор снимает фильтр
+        'query': filter_query(filters, **{dimension: None if selected else value}),
+    }
+
+
+def _summarize(filters, rows):
+    facets = {
+        dimension: [_item(filters, dimension, value, count) for value, count in values]
+        for dimension, values in rows.items()
+    }
+    # Итог по всем фильтрам — из фасета цен: там учтены автор и год,
+    # а диапазонов немного
+    total = sum(
+        count for value, count in rows['price_band']
+        if filters.get('price_band') in (None, value)
+    )
+    if 'author' in filters and not any(item['selected'] for item in facets['author']):
+        # Выбранный автор не вошёл в топ — показываем его всё равно
+        facets['author'].insert(0, _item(filters, 'author', filters['author'], total))
+    for item in facets['price_band']:
+        item['upper'] = band_bounds(item['value'])[1]
+    return {'facets': facets, 'total': total, 'query': filter_query(filters)}
+
+
+def facet_counts(filters):
+    """``{'facets': {фасет: [{value, count, selected, query}]}, 'total': книг,
+    'query': строка запроса текущих фильтров}`` — три запроса."""
+    return _summarize(filters, {
+        dimension: list(queryset) for dimension, queryset in _facet_querysets(filters)
+    })
+
+
+async def afacet_counts(filters):
+    return _summarize(filters, {
+        dimension: [row async for row in queryset] for dimension, queryset in _facet_querysets(filters)
+    })
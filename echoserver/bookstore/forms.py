@@ -1,9 +1,11 @@
 from django import forms
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from .auth import LoginThrottle, LoginThrottled, aauthenticate
+from .hashing import HashingBusy
 from .models import Book, User
 from django.contrib.auth.password_validation import validate_password
-from django.core.exceptions import ValidationError
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 
 User = get_user_model()
 
@@ -15,11 +17,15 @@ class UserProfileForm(forms.ModelForm):
 class BookForm(forms.ModelForm):
     class Meta:
         model = Book
-        fields = ['title', 'author', 'price', 'description', 'published_date']
+        fields = ['title', 'author', 'isbn', 'price', 'description', 'published_date']
         widgets = {
             'published_date': forms.DateInput(attrs={'type': 'date'}),
         }
 
+    def clean_isbn(self):
+        # Пустой ISBN храним как NULL, иначе уникальный индекс не даст сохранить вторую книгу без ISBN
+        return self.cleaned_data.get('isbn') or None
+
 
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -47,28 +53,60 @@ class UserRegistrationForm(UserCreationForm):
 class UserLoginForm(AuthenticationForm):
     username = forms.CharField(label='Логин или Email')
 
+    error_messages = {
+        **AuthenticationForm.error_messages,
+        'throttled': 'Слишком много попыток входа. Попробуйте позже.',
+        'busy': 'Сервер перегружен, попробуйте войти через несколько секунд.',
+    }
+
+    # Асинхронное представление проверяет пароль само, в ais_valid()
+    authenticate_in_clean = True
+
     def clean(self):
         username = self.cleaned_data.get('username')
         password = self.cleaned_data.get('password')
 
-        if username is not None and password:
-            # Пытаемся аутентифицировать по email, если username содержит @
-            if '@' in username:
-                try:
-                    user = User.objects.get(email=username)
-                    username = user.username
-                except User.DoesNotExist:
-                    pass
-
-            self.user_cache = authenticate(
-                self.request,
-                username=username,
-                password=password,
-            )
+        if self.authenticate_in_clean and username is not None and password:
+            # Поиск по логину и email — одним запросом в EmailOrUsernameBackend
+            throttle = LoginThrottle(self.request, username)
+            try:
+                throttle.check()
+                self.user_cache = authenticate(self.request, username=username, password=password)
+            except LoginThrottled:
+                raise ValidationError(self.error_messages['throttled'], code='throttled')
+            except HashingBusy:
+                raise ValidationError(self.error_messages['busy'], code='busy')
 
             if self.user_cache is None:
+                throttle.failed()
                 raise self.get_invalid_login_error()
-            else:
-                self.confirm_login_allowed(self.user_cache)
+            self.confirm_login_allowed(self.user_cache)
+            throttle.succeeded()
+
+        return self.cleaned_data
+
+    async def ais_valid(self):
+        self.authenticate_in_clean = False
+        if not self.is_valid():
+            return False
+        username = self.cleaned_data['username']
+        throttle = LoginThrottle(self.request, username)
+        try:
+            await throttle.acheck()
+            self.user_cache = await aauthenticate(self.request, username=username,
+                                                  password=self.cleaned_data['password'])
+            if self.user_cache is None:
+                await throttle.afailed()
+                raise self.get_invalid_login_error()
+            self.confirm_login_allowed(self.user_cache)
+            await throttle.asucceeded()
+        except LoginThrottled:
+            self.add_error(None, ValidationError(self.error_messages['throttled'], code='throttled'))
+        except HashingBusy:
+            self.add_error(None, ValidationError(self.error_messages['busy'], code='busy'))
+        except ValidationError as error:
+            self.add_error(None, error)
+        return not self.errors
 
-        return self.cleaned_data
\ No newline at end of file
+    def is_throttled(self):
+        return self.has_error(NON_FIELD_ERRORS, 'throttled')
@@ -0,0 +1,118 @@
+"""Проверка паролей в отдельном пуле процессов.
+
+Хеширование (PBKDF2/scrypt) съедает CPU. Если считать его в потоке
+веб-воркера, при всплеске входов или переборе паролей каталог ждёт в
+очереди за логинами. Здесь проверка идёт в ограниченном пуле из
+``PASSWORD_HASH_WORKERS`` процессов. Когда в очереди пула больше
+``PASSWORD_HASH_MAX_PENDING`` задач, новый вход сразу получает отказ,
+а не встаёт в очередь. Ответа пула ждут не дольше
+``PASSWORD_HASH_TIMEOUT`` секунд: зависший или перегруженный пул не
+держит поток воркера без конца.
+
+Модуль не импортирует модели: процессы пула (spawn) импортируют его до
+настройки приложений Django.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, make_password
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = None
+_dummy = None
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def verify(password, encoded):
+    """``(пароль верен, новый хеш или None)``.
+
+    Новый хеш считается, если пароль верен, но сохранён не основным хешером
+    из ``PASSWORD_HASHERS`` или с устаревшими параметрами.
+    """
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False, None
+    if not hasher.verify(password, encoded):
+        return False, None
+    preferred = get_hasher('default')
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        return True, make_password(password, hasher=preferred)
+    return True, None
+
+
+def _get_pool():
+    global _pool, _pending
+    with _pool_lock:
+        if _pool is None:
+            workers = settings.PASSWORD_HASH_WORKERS
+            _pending = threading.BoundedSemaphore(workers + settings.PASSWORD_HASH_MAX_PENDING)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _discard_pool(pool):
+    # Процесс пула убит (OOM и т.п.) — следующий вход создаст пул заново
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _submit(password, encoded):
+    pool = _get_pool()
+    if not _pending.acquire(blocking=False):
+        raise HashingBusy
+    try:
+        future = pool.submit(verify, password, encoded)
+    except BrokenProcessPool:
+        _pending.release()
+        _discard_pool(pool)
+        raise HashingBusy
+    future.add_done_callback(lambda _: _pending.release())
+    return pool, future
+
+
+def check_password(password, encoded):
+    if not settings.PASSWORD_HASH_WORKERS:
+        return verify(password, encoded)
+    pool, future = _submit(password, encoded)
+    try:
+        return future.result(timeout=settings.PASSWORD_HASH_TIMEOUT)
+    except TimeoutError:
+        # Ещё не начатая проверка снимается с очереди пула
+        future.cancel()
+        raise HashingBusy
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise HashingBusy
+
+
+async def acheck_password(password, encoded):
+    if not settings.PASSWORD_HASH_WORKERS:
+        return verify(password, encoded)
+    pool, future = _submit(password, encoded)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), settings.PASSWORD_HASH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HashingBusy
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise HashingBusy
+
+
+def dummy_hash():
+    """Хеш для выравнивания времени ответа, когда пользователь не найден."""
+    global _dummy
+    if _dummy is None:
+        _dummy = make_password('dummy-password')
+    return _dummy
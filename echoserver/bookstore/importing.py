@@ -0,0 +1,171 @@
+"""Потоковый импорт книг пачками и генерация синтетического каталога."""
+import csv
+import datetime
+import json
+import random
+from collections import Counter
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Max, Q
+
+from . import book_cache, facets
+from .cache import bump_catalog_version
+from .models import Book
+from .search import index_books
+
+UPDATE_FIELDS = ['title', 'author', 'price', 'description', 'published_date', 'updated_at']
+_PRICE = Book._meta.get_field('price')
+# Шаг и предел цены по DecimalField: строка с большей ценой уронила бы всю пачку на MySQL
+PRICE_STEP = Decimal(1).scaleb(-_PRICE.decimal_places)
+MAX_PRICE = Decimal(10) ** (_PRICE.max_digits - _PRICE.decimal_places) - PRICE_STEP
+ISBN_LENGTH = Book._meta.get_field('isbn').max_length
+
+
+class RowError(ValueError):
+    pass
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+def parse_price(value):
+    """Цена из строки файла, округлённая до копеек; вне ``0..MAX_PRICE`` — RowError."""
+    try:
+        price = Decimal(str(value).strip())
+        if price.is_finite():
+            price = price.quantize(PRICE_STEP, rounding=ROUND_HALF_UP)
+        if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+            raise InvalidOperation
+        # -0.001 округляется до -0.00
+        return price.copy_abs() if price.is_zero() else price
+    except InvalidOperation as exc:
+        raise RowError(f'некорректная цена: {value!r}') from exc
+
+
+def build_book(row):
+    if row.get('price') is None:
+        raise RowError('нет цены')
+    price = parse_price(row['price'])
+    title = (row.get('title') or '').strip()
+    author = (row.get('author') or '').strip()
+    if not title or not author:
+        raise RowError('нет названия или автора')
+    published = row.get('published_date') or None
+    if isinstance(published, str):
+        try:
+            published = datetime.date.fromisoformat(published)
+        except ValueError as exc:
+            raise RowError(f'некорректная дата: {published!r}') from exc
+    isbn = (row.get('isbn') or '').strip() or None
+    if isbn is not None and len(isbn) > ISBN_LENGTH:
+        raise RowError(f'слишком длинный ISBN: {isbn!r}')
+    return Book(
+        title=title[:200],
+        author=author[:100],
+        price=price,
+        description=row.get('description') or '',
+        published_date=published,
+        isbn=isbn,
+    )
+
+
+def generate_rows(seed, count):
+    """Синтетические книги; вызывается в дочерних процессах пула."""
+    try:
+        from faker import Faker
+    except ImportError:
+        Faker = None
+
+    rng = random.Random(seed)
+    if Faker is None:
+        words = 'война мир время море город история жизнь любовь ночь дорога дом сад'.split()
+        return [{
+            'title': ' '.join(rng.choice(words) for _ in range(3)).capitalize(),
+            'author': ' '.join(rng.choice(words) for _ in range(2)).title(),
+            'price': Decimal(rng.randint(100, 99999)) / 100,
+            'description': ' '.join(rng.choice(words) for _ in range(20)),
+            'published_date': datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randint(0, 9000)),
+        } for _ in range(count)]
+
+    fake = Faker('ru_RU')
+    fake.seed_instance(seed)
+    return [{
+        'title': fake.catch_phrase(),
+        'author': fake.name(),
+        'price': Decimal(fake.random_number(digits=3)),
+        'description': fake.text(),
+        'published_date': fake.date_between(start_date='-10y', end_date='today'),
+    } for _ in range(count)]
+
+
+def unique_by_isbn(books):
+    """Книги с повторяющимся ISBN схлопываются в последнюю, как при записи по одной."""
+    by_isbn = {}
+    for book in books:
+        if book.isbn:
+            by_isbn[book.isbn] = book
+    return [book for book in books if not book.isbn or by_isbn[book.isbn] is book]
+
+
+def write_chunk(books, upsert=False, batch_size=1000, with_search_index=True):
+    """Пишет пачку книг в одной транзакции. Возвращает число строк.
+
+    Повторы ISBN внутри пачки отбрасываются до записи: иначе одна книга
+    обновилась бы дважды, а её счётчик фасетов вырос бы на два.
+    """
+    books = unique_by_isbn(books)
+    keyed = [book for book in books if upsert and book.isbn]
+    plain = [book for book in books if not (upsert and book.isbn)]
+    with transaction.atomic():
+        watermark = Book.objects.aggregate(last=Max('id'))['last'] or 0
+        # Счётчики фасетов: новые значения плюс, прежние значения обновляемых книг минус
+        facet_deltas = Counter(facets.book_key(book) for book in books)
+        if keyed:
+            facet_deltas.subtract(
+                facets.facet_key(*row) for row in
+                Book.objects.filter(isbn__in=[book.isbn for book in keyed]).values_list(*facets.KEY_FIELDS)
+            )
+        if plain:
+            Book.objects.bulk_create(plain, batch_size=batch_size)
+        if keyed:
+            options = {'update_conflicts': True, 'update_fields': UPDATE_FIELDS}
+            if connection.features.supports_update_conflicts_with_target:
+                options['unique_fields'] = ['isbn']
+            Book.objects.bulk_create(keyed, batch_size=batch_size, **options)
+
+        if with_search_index:
+            # bulk_create не шлёт post_save, поэтому индекс обновляем сами.
+            # MySQL не возвращает id вставленных строк — добираем их запросом.
+            indexed = [book for book in plain if book.pk is not None]
+            if len(indexed) < len(plain):
+                indexed = list(Book.objects.filter(pk__gt=watermark))
+            if keyed:
+                indexed += list(Book.objects.filter(isbn__in=[book.isbn for book in keyed]))
+            index_books({book.pk: book for book in indexed}.values())
+        facets.apply(facet_deltas)
+        transaction.on_commit(bump_catalog_version)
+        # Новые книги тоже: их id могли закэшировать как несуществующие
+        book_cache.touch(Book.objects.filter(
+            Q(pk__gt=watermark) | Q(isbn__in=[book.isbn for book in keyed])
+        ).values_list('pk', flat=True))
+    return len(books)
@@ -0,0 +1,174 @@
+"""Очередь фоновых задач в таблице ``Job`` — без брокера.
+
+Задача — функция, зарегистрированная декоратором ``@job('имя')``; она
+получает ``JobContext`` и аргументы из ``payload``. Представление ставит
+задачу через ``enqueue()`` и сразу отвечает, выполняет её воркер
+``manage.py run_jobs``. Воркер забирает задачи через
+``SELECT ... FOR UPDATE SKIP LOCKED`` (MySQL 8, PostgreSQL), а на SQLite —
+условным UPDATE по статусу, так что одну задачу не возьмут двое.
+"""
+import datetime
+import logging
+import time
+import traceback
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('bookstore.jobs')
+
+_registry = {}
+
+# Пауза перед повтором: 10 с, 40 с, 90 с...
+RETRY_DELAY = 10
+# Как часто воркер отмечает свои выполняемые задачи (updated_at)
+HEARTBEAT_INTERVAL = 30
+
+
+class UnknownJob(LookupError):
+    pass
+
+
+def job(name, max_attempts=3):
+    """Регистрирует функцию ``func(ctx, **payload)`` как задачу с именем ``name``."""
+    def decorator(func):
+        func.job_name = name
+        func.max_attempts = max_attempts
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def registered_jobs():
+    _load_tasks()
+    return dict(_registry)
+
+
+def _load_tasks():
+    from . import tasks  # noqa: F401  регистрирует задачи магазина
+
+
+def enqueue(name, **payload):
+    """Ставит задачу в очередь; в транзакции она станет видна воркеру после коммита."""
+    _load_tasks()
+    if name not in _registry:
+        raise UnknownJob(name)
+    return Job.objects.create(name=name, payload=payload, max_attempts=_registry[name].max_attempts)
+
+
+class JobContext:
+    """Передаётся в задачу: прогресс пишется в строку Job не чаще раза в секунду.
+
+    Запись прогресса обновляет и ``updated_at`` — это тоже признак жизни задачи.
+    """
+
+    def __init__(self, job, min_interval=1.0):
+        self.job = job
+        self.min_interval = min_interval
+        self._reported = 0.0
+
+    def progress(self, done, total=None, message=''):
+        now = time.monotonic()
+        if now - self._reported < self.min_interval and (total is None or done < total):
+            return
+        self._reported = now
+        percent = min(int(done * 100 / total), 100) if total else 0
+        _owned(self.job).update(
+            progress=percent, progress_message=str(message)[:200], updated_at=timezone.now(),
+        )
+
+
+def _owned(job):
+    # Строка задачи, пока её держит тот же воркер: после requeue_stale её мог забрать другой
+    return Job.objects.filter(pk=job.pk, status='R', locked_by=job.locked_by)
+
+
+def heartbeat(worker_id, job_ids):
+    """Отмечает, что задачи ``job_ids`` ещё выполняются этим воркером."""
+    if not job_ids:
+        return 0
+    return Job.objects.filter(pk__in=list(job_ids), status='R', locked_by=worker_id).update(
+        updated_at=timezone.now(),
+    )
+
+
+def requeue_stale(older_than):
+    """Возвращает в очередь задачи упавших воркеров.
+
+    Брошенной считается задача в статусе R, о которой дольше ``older_than``
+    не было вестей: ни прогресса, ни heartbeat() воркера. Время выполнения
+    само по себе не важно — долгий импорт с живым воркером не перезапускается.
+    """
+    cutoff = timezone.now() - older_than
+    return Job.objects.filter(status='R', updated_at__lt=cutoff).update(
+        status='Q', locked_by='', locked_at=None, updated_at=timezone.now(),
+    )
+
+
+def claim(worker_id, limit):
+    """Забирает до ``limit`` готовых к запуску задач и помечает их выполняемыми."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    ready = Job.objects.filter(status='Q', run_after__lte=now).order_by('run_after', 'id')
+    claimed = {'status': 'R', 'locked_by': worker_id, 'locked_at': now,
+               'attempts': F('attempts') + 1, 'updated_at': now}
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(ready.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claimed)
+        else:
+            # Без SKIP LOCKED: задачу получает тот, чей UPDATE ещё застал статус Q
+            ids = [
+                pk for pk in ready.values_list('pk', flat=True)[:limit]
+                if Job.objects.filter(pk=pk, status='Q').update(**claimed)
+            ]
+    return ids
+
+
+def run_job(job_id):
+    """Выполняет одну задачу; вызывается в потоке или процессе воркера."""
+    job = Job.objects.get(pk=job_id)
+    func = registered_jobs().get(job.name)
+    started = time.monotonic()
+    try:
+        if func is None:
+            raise UnknownJob(job.name)
+        result = func(JobContext(job), **job.payload)
+    except Exception as exc:
+        _fail(job, exc)
+        return False
+    finally:
+        # Соединение потока/процесса пула переиспользуется между задачами
+        connection.close_if_unusable_or_obsolete()
+    finished = _owned(job).update(
+        status='D', progress=100, result=result, error='', locked_by='', updated_at=timezone.now(),
+    )
+    if not finished:
+        logger.warning('%s: задачу вернули в очередь во время выполнения, результат не записан', job)
+        return False
+    logger.info('%s выполнена за %.1f с', job, time.monotonic() - started)
+    return True
+
+
+def _fail(job, exc):
+    error = ''.join(traceback.format_exception(exc))
+    fields = {'error': error[-10000:], 'locked_by': '', 'updated_at': timezone.now()}
+    if job.attempts < job.max_attempts and not isinstance(exc, UnknownJob):
+        delay = datetime.timedelta(seconds=RETRY_DELAY * job.attempts ** 2)
+        fields.update(status='Q', run_after=timezone.now() + delay)
+        logger.warning('%s: попытка %d не удалась, повтор через %s', job, job.attempts, delay)
+    else:
+        fields['status'] = 'F'
+        logger.error('%s: ошибка после %d попыток', job, job.attempts)
+    _owned(job).update(**fields)
+
+
+def retry(queryset):
+    """Ставит упавшие задачи в очередь заново, со сброшенным счётчиком попыток."""
+    return queryset.filter(status='F').update(
+        status='Q', attempts=0, run_after=timezone.now(), error='', progress=0, updated_at=timezone.now(),
+    )
@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bookstore.archive import ARCHIVE_AFTER_DAYS, archivable, archive_orders
+
+
+class Command(BaseCommand):
+    help = ('Переносит выполненные заказы старше срока в архив (ArchivedOrder/ArchivedOrderItem) '
+            'пачками, каждая в своей транзакции')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                            help='Архивировать заказы старше этого числа дней')
+        parser.add_argument('--before', help='Или старше даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Заказов в одной транзакции')
+        parser.add_argument('--limit', type=int, help='Не больше стольких заказов за запуск')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать число заказов')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                day = datetime.date.fromisoformat(options['before'])
+            except ValueError:
+                raise CommandError(f'Некорректная дата: {options["before"]}')
+            before = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+        else:
+            before = timezone.now() - datetime.timedelta(days=options['days'])
+
+        if options['dry_run']:
+            count = archivable(before).count()
+            self.stdout.write(f'Заказов к архивации (до {before:%Y-%m-%d %H:%M}): {count}')
+            return
+        moved = archive_orders(
+            before, batch_size=options['batch_size'], limit=options['limit'],
+            progress=lambda total: self.stdout.write(f'  перенесено: {total}'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Готово, в архив перенесено заказов: {moved}'))
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from bookstore import benchmark
+from bookstore.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон всех маршрутов магазина в процессе, без сети. '
+        'Запускать на SQLite: --settings=bookstore_project.settings_bench'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000, help='Размер каталога при заполнении')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--reseed', action='store_true', help='Заполнить БД заново, даже если данные уже есть')
+        parser.add_argument('--no-search-index', action='store_true')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый маршрут')
+        parser.add_argument('--concurrency', type=int, default=4, help='Число параллельных потоков')
+        parser.add_argument('--only', nargs='*', help='Прогнать только указанные сценарии')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Гонять запросы через AsyncClient (ASGI) вместо тестового клиента WSGI')
+        parser.add_argument('--compare-modes', action='store_true',
+                            help='Прогнать WSGI с синхронными и ASGI с асинхронными представлениями и сравнить')
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--baseline', help='JSON базового прогона для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимое ухудшение относительно базового прогона (доля)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                'Бенчмарк заполняет БД синтетическими данными и запускается только на SQLite. '
+                'Используйте --settings=bookstore_project.settings_bench'
+            )
+        call_command('migrate', verbosity=0)
+
+        if options['reseed']:
+            Book.objects.all().delete()
+            benchmark.User.objects.filter(username__startswith='bench').delete()
+        if not Book.objects.exists():
+            self.stdout.write('Заполнение БД...')
+            benchmark.seed(
+                options['books'], options['users'], options['orders'],
+                with_search_index=not options['no_search_index'], stdout=self.stdout,
+            )
+
+        report = benchmark.run(
+            requests=options['requests'], concurrency=options['concurrency'],
+            only=options['only'], stdout=self.stdout, asgi=options['asgi'],
+        )
+        benchmark.save(report, options['output'])
+        self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+        if options['compare_modes']:
+            self._compare_modes(report, options)
+
+        if options['baseline']:
+            regressions = benchmark.compare(report, benchmark.load(options['baseline']), options['tolerance'])
+            if regressions:
+                raise CommandError('Регрессии производительности:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базового прогона нет'))
+
+    def _compare_modes(self, report, options):
+        # Набор представлений выбирается при импорте urls.py, поэтому
+        # асинхронный режим запускается отдельным процессом
+        output = os.path.splitext(options['output'])[0] + '-asgi.json'
+        command = [
+            sys.executable, os.path.abspath(sys.argv[0]), 'benchmark', '--asgi',
+            '--settings', os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE),
+            '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+            '--output', output,
+        ]
+        if options['only']:
+            command += ['--only', *options['only']]
+        self.stdout.write('Асинхронный режим (ASGI)...')
+        subprocess.run(command, check=True, env=dict(os.environ, BOOKSTORE_ASYNC_VIEWS='1'))
+        self.stdout.write(benchmark.format_comparison(report, benchmark.load(output)))
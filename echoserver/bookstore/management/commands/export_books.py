@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookstore.export import BOOK_FIELDS, DEFAULT_CHUNK_SIZE, FORMATS, ExportError, book_rows, encode, parse_fields
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка всего каталога в NDJSON или CSV (в файл или stdout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+        parser.add_argument('--fields', help='Поля через запятую: %s' % ','.join(BOOK_FIELDS))
+        parser.add_argument('--output', '-o', default='-', help='Путь к файлу; "-" — stdout')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Строк в одном запросе')
+
+    def handle(self, *args, **options):
+        try:
+            fields = parse_fields(options['fields'])
+        except ExportError as exc:
+            raise CommandError(str(exc))
+
+        lines = encode(book_rows(fields, chunk_size=options['chunk_size']), fields, options['format'])
+        if options['output'] == '-':
+            total = self._write(lines, sys.stdout, options['format'])
+        else:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+                total = self._write(lines, stream, options['format'])
+        self.stderr.write(self.style.SUCCESS(f'Выгружено книг: {total}'))
+
+    def _write(self, lines, stream, fmt):
+        # у CSV первая строка — заголовок
+        total = -1 if fmt == 'csv' else 0
+        for line in lines:
+            stream.write(line)
+            total += 1
+        return total
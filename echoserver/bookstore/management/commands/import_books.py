@@ -0,0 +1,89 @@
+import io
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from bookstore.importing import RowError, build_book, chunks, generate_rows, read_rows, write_chunk
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт книг из CSV/JSONL (файлы или stdin) пачками через bulk_create, '
+        'либо генерация синтетического каталога в пуле процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Файлы .csv/.jsonl; "-" — stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Формат входных данных (по умолчанию — по расширению, для stdin — jsonl)')
+        parser.add_argument('--synthetic', type=int, default=0, help='Сгенерировать N синтетических книг')
+        parser.add_argument('--workers', type=int, default=4, help='Процессов для генерации')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одном INSERT')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Строк в одной транзакции')
+        parser.add_argument('--upsert', action='store_true',
+                            help='Обновлять существующие книги с тем же ISBN вместо вставки дублей')
+        parser.add_argument('--no-search-index', action='store_true',
+                            help='Не обновлять поисковый индекс (потом: rebuild_search_index)')
+
+    def handle(self, *args, **options):
+        if not options['paths'] and not options['synthetic']:
+            raise CommandError('Укажите файлы, "-" для stdin или --synthetic N')
+
+        self.options = options
+        self.total = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+        for path in options['paths']:
+            self._import_stream(path)
+        if options['synthetic']:
+            self._import_synthetic(options['synthetic'])
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {self.total} книг за {elapsed:.1f} с '
+            f'({self.total / elapsed if elapsed else 0:.0f} строк/с), пропущено {self.skipped}'
+        ))
+
+    def _import_stream(self, path):
+        fmt = self.options['format']
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+            fmt = fmt or 'jsonl'
+        else:
+            stream = open(path, encoding='utf-8', newline='')
+            fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+        with stream:
+            for rows in chunks(read_rows(stream, fmt), self.options['chunk_size']):
+                books = []
+                for number, row in enumerate(rows, start=self.total + self.skipped + 1):
+                    try:
+                        books.append(build_book(row))
+                    except RowError as exc:
+                        self.skipped += 1
+                        self.stderr.write(f'{path}: строка {number} пропущена: {exc}')
+                self._write(books)
+
+    def _import_synthetic(self, count):
+        chunk_size = self.options['chunk_size']
+        sizes = [min(chunk_size, count - offset) for offset in range(0, count, chunk_size)]
+        # Дочерним процессам соединения с БД не нужны, не отдаём им открытые сокеты
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=self.options['workers']) as pool:
+            for rows in pool.map(generate_rows, range(len(sizes)), sizes):
+                self._write([build_book(row) for row in rows])
+
+    def _write(self, books):
+        if not books:
+            return
+        self.total += write_chunk(
+            books,
+            upsert=self.options['upsert'],
+            batch_size=self.options['batch_size'],
+            with_search_index=not self.options['no_search_index'],
+        )
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'  {self.total} строк, {self.total / elapsed if elapsed else 0:.0f} строк/с')
@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в отдельном интерпретаторе: в этом процессе всё уже импортировано
+SCRIPT = '''
+import json, time
+started = time.perf_counter()
+phases = []
+
+def mark(name):
+    global started
+    now = time.perf_counter()
+    phases.append((name, now - started))
+    started = now
+
+import django
+django.setup()
+mark('django.setup')
+from django.core.{kind} import get_{kind}_application
+application = get_{kind}_application()
+mark('{kind} application')
+from bookstore.warmup import warm_up
+phases.extend(('warmup: ' + name, seconds) for name, seconds in warm_up(freeze=False))
+print(json.dumps(phases))
+'''
+
+
+def parse_importtime(stderr):
+    """Строки ``python -X importtime`` -> [(модуль, self мкс, cumulative мкс)]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return rows
+
+
+class Command(BaseCommand):
+    help = ('Профилирует запуск воркера в отдельном процессе: время импорта по модулям '
+            '(python -X importtime), django.setup(), создание приложения и шаги прогрева, '
+            'которые без BOOKSTORE_WARMUP выполнил бы первый запрос')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help='Сколько модулей показать')
+        parser.add_argument('--sort', choices=('cumulative', 'self'), default='cumulative')
+        parser.add_argument('--by-package', action='store_true',
+                            help='Суммировать собственное время по пакетам верхнего уровня')
+        parser.add_argument('--asgi', action='store_true', help='Создавать ASGI-приложение вместо WSGI')
+
+    def handle(self, *args, **options):
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'bookstore_project.settings'),
+            'PYTHONPATH': os.pathsep.join(filter(None, sys.path)),
+            # Прогрев запускает сама команда, с замером шагов
+            'BOOKSTORE_WARMUP': '',
+        }
+        script = SCRIPT.format(kind='asgi' if options['asgi'] else 'wsgi')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            # В stderr вперемешку строки importtime и traceback
+            raise CommandError('\n'.join(
+                line for line in result.stderr.splitlines() if not line.startswith('import time:')
+            ) or 'ошибка запуска')
+
+        rows = parse_importtime(result.stderr)
+        if options['by_package']:
+            totals = Counter()
+            for module, own, _ in rows:
+                totals[module.split('.')[0]] += own
+            self.stdout.write(f'{"мс":>9}  пакет')
+            for package, own in totals.most_common(options['limit']):
+                self.stdout.write(f'{own / 1000:9.1f}  {package}')
+        else:
+            column = 2 if options['sort'] == 'cumulative' else 1
+            self.stdout.write(f'{"self, мс":>9} {"всего, мс":>10}  модуль')
+            for module, own, cumulative in sorted(rows, key=lambda row: row[column], reverse=True)[:options['limit']]:
+                self.stdout.write(f'{own / 1000:9.1f} {cumulative / 1000:10.1f}  {module}')
+        self.stdout.write(f'Импортировано модулей: {len(rows)}, '
+                          f'всего {sum(own for _, own, _ in rows) / 1000:.1f} мс')
+
+        self.stdout.write('')
+        for name, seconds in json.loads(result.stdout.strip().splitlines()[-1]):
+            self.stdout.write(f'{seconds * 1000:9.1f} мс  {name}')
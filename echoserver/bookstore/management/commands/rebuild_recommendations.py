@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from bookstore.recommendations import TOP_N, rebuild
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает матрицу совместных покупок и рекомендации «с этой книгой покупают» '
+            '(SciPy, если установлен, иначе агрегатом в БД)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=TOP_N, help='Соседей на книгу')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        result = rebuild(options['top_n'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Книг: {books}, рекомендаций: {recommendations} ({engine})'.format(**result)
+        ))
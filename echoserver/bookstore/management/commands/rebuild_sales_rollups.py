@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookstore.sales import order_days, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводные таблицы продаж по дням из заказов (полностью или за период)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help='Первый день, YYYY-MM-DD')
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help='Последний день, YYYY-MM-DD')
+        parser.add_argument('--window', type=int, default=7, help='Дней в одной транзакции')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if not (start and end):
+            # Границы по умолчанию — и по архиву: там могут быть дни без рабочих заказов
+            days = order_days()
+            if days is None:
+                self.stdout.write('Заказов нет')
+                return
+            start, end = start or days[0], end or days[1]
+        if start > end:
+            raise CommandError('--start позже --end')
+
+        window = datetime.timedelta(days=max(options['window'], 1))
+        day = start
+        total = 0
+        while day <= end:
+            last = min(day + window - datetime.timedelta(days=1), end)
+            total += rebuild(day, last, batch_size=options['batch_size'])
+            self.stdout.write(f'{day} — {last}: строк в сводках {total}')
+            day = last + datetime.timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Готово, всего строк: {total}'))
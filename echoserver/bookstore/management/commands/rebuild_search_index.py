@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from bookstore.models import Book
+from bookstore.search import index_books
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает поисковый индекс по книгам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(Book.objects.filter(pk__gt=last_id).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            index_books(batch)
+            last_id = batch[-1].pk
+            total += len(batch)
+            self.stdout.write(f'Проиндексировано книг: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Готово, всего {total}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from bookstore.cart import repair_counts
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики корзин (Cart.item_count) с позициями и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Корзин в одном запросе')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать число расхождений')
+
+    def handle(self, *args, **options):
+        checked, fixed = repair_counts(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        verb = 'Расходится' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f'Проверено корзин: {checked}; {verb}: {fixed}'))
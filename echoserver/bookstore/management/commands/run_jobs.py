@@ -0,0 +1,88 @@
+import datetime
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+# Модели здесь не импортируются: процессы пула (spawn) импортируют этот
+# модуль до django.setup(), чтобы найти _init_process и _run_in_process
+
+
+def _init_process():
+    # Процессы запускаются через spawn и не наследуют сокеты соединений с БД
+    django.setup()
+
+
+def _run_in_process(job_id):
+    from bookstore.jobs import run_job
+    return run_job(job_id)
+
+
+def _run_in_thread(job_id):
+    from bookstore.jobs import run_job
+    try:
+        return run_job(job_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых задач: забирает задачи из таблицы Job и выполняет их в пуле потоков или процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Задач одновременно')
+        parser.add_argument('--processes', action='store_true',
+                            help='Пул процессов вместо потоков (для задач, нагружающих CPU)')
+        parser.add_argument('--poll', type=float, default=1.0, help='Пауза при пустой очереди, с')
+        parser.add_argument('--stale-after', type=int, default=3600,
+                            help='Через сколько секунд без прогресса и heartbeat задача в статусе R '
+                                 'считается брошенной')
+        parser.add_argument('--once', action='store_true', help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        from bookstore.jobs import HEARTBEAT_INTERVAL, claim, heartbeat, registered_jobs, requeue_stale
+
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        workers = max(options['workers'], 1)
+        stale_after = datetime.timedelta(seconds=options['stale_after'])
+        self.stdout.write(f'Воркер {worker_id}: задачи {", ".join(sorted(registered_jobs()))}')
+
+        if options['processes']:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_process)
+            target = _run_in_process
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+            target = _run_in_thread
+
+        running = {}
+        beat = time.monotonic()
+        try:
+            with pool:
+                while True:
+                    # Долгие задачи без прогресса не должны выглядеть брошенными
+                    if running and time.monotonic() - beat >= min(HEARTBEAT_INTERVAL, stale_after.total_seconds() / 4):
+                        heartbeat(worker_id, running.values())
+                        beat = time.monotonic()
+                    if requeue_stale(stale_after):
+                        self.stderr.write('Брошенные задачи возвращены в очередь')
+                    for job_id in claim(worker_id, workers - len(running)):
+                        running[pool.submit(target, job_id)] = job_id
+                    if not running:
+                        if options['once']:
+                            return
+                        time.sleep(options['poll'])
+                        continue
+                    done, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job_id = running.pop(future)
+                        ok = future.exception() is None and future.result()
+                        self.stdout.write(f'Задача #{job_id}: {"готово" if ok else "ошибка"}')
+        except KeyboardInterrupt:
+            # Незавершённые задачи вернёт в очередь requeue_stale на следующем запуске
+            self.stderr.write('Остановка воркера')
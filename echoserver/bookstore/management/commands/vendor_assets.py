@@ -0,0 +1,83 @@
+import hashlib
+import urllib.request
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+VENDOR_DIR = Path(__file__).resolve().parents[2] / 'static' / 'vendor'
+LOCK_FILE = VENDOR_DIR / 'SHA256SUMS'
+
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/'
+BOOTSTRAP_ICONS = 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/'
+POPPER = 'https://cdn.jsdelivr.net/npm/@popperjs/core@2.11.8/dist/umd/'
+
+# Путь в static/vendor -> URL. Карты (.map) и шрифты нужны: на них ссылаются
+# CSS/JS, и collectstatic без них не соберёт манифест. Popper подключается
+# отдельным файлом перед bootstrap.min.js — то же, что bootstrap.bundle.min.js
+ASSETS = {
+    'bootstrap/css/bootstrap.min.css': BOOTSTRAP + 'css/bootstrap.min.css',
+    'bootstrap/css/bootstrap.min.css.map': BOOTSTRAP + 'css/bootstrap.min.css.map',
+    'bootstrap/js/bootstrap.min.js': BOOTSTRAP + 'js/bootstrap.min.js',
+    'bootstrap/js/bootstrap.min.js.map': BOOTSTRAP + 'js/bootstrap.min.js.map',
+    'popper/umd/popper.min.js': POPPER + 'popper.min.js',
+    'popper/umd/popper.min.js.map': POPPER + 'popper.min.js.map',
+    'bootstrap-icons/font/bootstrap-icons.css': BOOTSTRAP_ICONS + 'bootstrap-icons.css',
+    'bootstrap-icons/font/fonts/bootstrap-icons.woff2': BOOTSTRAP_ICONS + 'fonts/bootstrap-icons.woff2',
+    'bootstrap-icons/font/fonts/bootstrap-icons.woff': BOOTSTRAP_ICONS + 'fonts/bootstrap-icons.woff',
+}
+
+
+def read_lock():
+    if not LOCK_FILE.exists():
+        return {}
+    sums = {}
+    for line in LOCK_FILE.read_text().splitlines():
+        digest, _, name = line.partition('  ')
+        if name:
+            sums[name] = digest
+    return sums
+
+
+class Command(BaseCommand):
+    help = ('Скачивает Bootstrap, Popper и Bootstrap Icons в bookstore/static/vendor и сверяет их '
+            'с SHA256SUMS (обновление версий). Суммы без записи в SHA256SUMS принимаются только с --update-lock, '
+            'после ручной сверки с опубликованными; файлы и SHA256SUMS коммитятся вместе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Скачать заново уже имеющиеся файлы')
+        parser.add_argument('--update-lock', action='store_true',
+                            help='Принять новые контрольные суммы (первая загрузка, смена версий)')
+
+    def handle(self, *args, **options):
+        lock = read_lock()
+        downloaded = {}
+        for name, url in ASSETS.items():
+            target = VENDOR_DIR / name
+            if target.exists() and not options['force']:
+                content = target.read_bytes()
+            else:
+                try:
+                    with urllib.request.urlopen(url, timeout=30) as response:
+                        content = response.read()
+                except OSError as exc:
+                    raise CommandError(f'{url}: {exc}')
+            digest = hashlib.sha256(content).hexdigest()
+            if not options['update_lock']:
+                if name not in lock:
+                    raise CommandError(f'{name}: нет в SHA256SUMS; проверьте файл и запустите с --update-lock')
+                if lock[name] != digest:
+                    raise CommandError(f'{name}: контрольная сумма не совпадает с SHA256SUMS')
+            downloaded[name] = (content, digest)
+
+        # Файлы пишутся только после проверки всех: без наполовину обновлённого каталога
+        for name, (content, digest) in downloaded.items():
+            target = VENDOR_DIR / name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+            lock[name] = digest
+            self.stdout.write(f'{name}: {len(content)} байт, sha256 {digest}')
+        if options['update_lock']:
+            LOCK_FILE.write_text(''.join(f'{digest}  {name}\n' for name, digest in sorted(lock.items())))
+        self.stdout.write(self.style.SUCCESS(
+            'Готово; закоммитьте bookstore/static/vendor вместе с SHA256SUMS'
+        ))
@@ -0,0 +1,327 @@
+import contextvars
+import json
+import logging
+import mimetypes
+import os
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse, HttpResponse
+
+from . import routing
+
+logger = logging.getLogger('bookstore.queries')
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+# Управление транзакцией: внешний atomic() на MySQL идёт мимо курсора, а
+# в тестах (TestCase, вложенный atomic) становится SAVEPOINT — не считаем
+_TRANSACTION_RE = re.compile(r'\s*(?:BEGIN|COMMIT|ROLLBACK|(?:RELEASE )?SAVEPOINT)\b', re.IGNORECASE)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    # Запросы, отличающиеся только параметрами (в т.ч. длиной IN (...)), имеют одну форму
+    return _IN_LIST_RE.sub('IN (...)', sql)
+
+
+# Записи активных регистраторов в текущем контексте. Под ASGI одно соединение
+# может обслуживать несколько запросов, и обёртки разных запросов оказываются
+# на нём одновременно — каждая учитывает только запросы своего контекста.
+_active_recorders = contextvars.ContextVar('active_query_recorders', default=())
+
+
+class QueryRecorder:
+    """Записывает все SQL-запросы, выполненные внутри ``capture()``."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if self not in _active_recorders.get() or _TRANSACTION_RE.match(sql):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def start(self):
+        _active_recorders.set(_active_recorders.get() + (self,))
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+
+    def stop(self):
+        self._stack.close()
+        _active_recorders.set(tuple(r for r in _active_recorders.get() if r is not self))
+
+    @contextmanager
+    def capture(self):
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold):
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+
+class QueryReport:
+    def __init__(self, view, recorder, budget, threshold):
+        self.view = view
+        self.count = recorder.count
+        self.duration = recorder.duration
+        self.budget = budget
+        self.repeated = recorder.repeated(threshold)
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+    def problems(self):
+        problems = []
+        if self.over_budget:
+            problems.append(f'{self.view}: {self.count} запросов при бюджете {self.budget}')
+        for shape, count in self.repeated:
+            problems.append(f'{self.view}: возможный N+1, {count} раз: {shape}')
+        return problems
+
+
+def query_budget(view_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(
+        view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+    )
+
+
+class QueryInspectorMiddleware:
+    """Считает SQL-запросы и время БД на каждый запрос.
+
+    Пишет итог в лог ``bookstore.queries``, добавляет заголовок
+    ``Server-Timing`` и отчёт ``response.query_report``. Повторяющиеся
+    запросы одной формы помечаются как возможный N+1. При
+    ``QUERY_BUDGET_STRICT = True`` превышение бюджета или N+1 — исключение.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        with recorder.capture():
+            response = self.get_response(request)
+        return self.process(request, response, recorder)
+
+    async def __acall__(self, request):
+        # Асинхронный ORM ходит в БД из потока sync_to_async со своими
+        # соединениями, поэтому обёртки ставятся в том же контексте
+        recorder = QueryRecorder()
+        await sync_to_async(recorder.start)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recorder.stop)()
+        return self.process(request, response, recorder)
+
+    def process(self, request, response, recorder):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        report = QueryReport(
+            view, recorder, query_budget(view),
+            getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5),
+        )
+        response.query_report = report
+        response['Server-Timing'] = 'db;dur=%.1f;desc="%d queries"' % (report.duration * 1000, report.count)
+
+        problems = report.problems()
+        logger.log(
+            logging.WARNING if problems else logging.DEBUG,
+            '%s %s: %d запросов, %.1f мс в БД',
+            request.method, view, report.count, report.duration * 1000,
+        )
+        for problem in problems:
+            logger.warning(problem)
+        if problems and getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded('; '.join(problems))
+        return response
+
+
+class ReadYourWritesMiddleware:
+    """Закрепляет чтения за основной базой после записи (см. bookstore/routing.py).
+
+    Если в запросе были записи каталога или заказов, ставит cookie, и
+    следующие ``REPLICA_STICKY_SECONDS`` секунд этот клиент читает из
+    основной базы, а не с реплики, которая могла ещё не догнать запись.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = routing.begin_request(request.COOKIES.get(routing.STICKY_COOKIE))
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.end_request(token)
+        return self.process(state, response)
+
+    async def __acall__(self, request):
+        state, token = routing.begin_request(request.COOKIES.get(routing.STICKY_COOKIE))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing.end_request(token)
+        return self.process(state, response)
+
+    def process(self, state, response):
+        if state.wrote:
+            window = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+            response.set_cookie(
+                routing.STICKY_COOKIE, '%.0f' % (time.time() + window),
+                max_age=window, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Файлы без хеша в имени (favicon и т.п.) могут смениться при выкладке
+MUTABLE_CACHE_CONTROL = 'public, max-age=300'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticAsset:
+    __slots__ = ('path', 'name', 'content_type', 'variants', 'immutable')
+
+    def __init__(self, path, immutable):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.variants = {
+            encoding: path + suffix for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)
+        }
+        self.immutable = immutable
+
+
+def static_index(root):
+    """``{путь относительно STATIC_URL: StaticAsset}`` по содержимому ``STATIC_ROOT``."""
+    if not root or not os.path.isdir(root):
+        return {}
+    try:
+        with open(os.path.join(root, 'staticfiles.json'), encoding='utf-8') as manifest:
+            hashed = set(json.load(manifest).get('paths', {}).values())
+    except (OSError, ValueError):
+        hashed = set()
+    index = {}
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            if filename.endswith(('.gz', '.br')):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            index[name] = StaticAsset(path, immutable=name in hashed)
+    return index
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        try:
+            quality = float(params.replace(' ', '').partition('q=')[2] or 1)
+        except ValueError:
+            quality = 1
+        if quality > 0:  # q=0 — кодировка запрещена
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def asset_response(request, asset, stream=True):
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    encoding = next((name for name, _ in ENCODINGS if name in accepted and name in asset.variants), None)
+    path = asset.variants[encoding] if encoding else asset.path
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=asset.content_type)
+        response['Content-Length'] = os.path.getsize(path)
+    elif stream:
+        response = FileResponse(open(path, 'rb'), content_type=asset.content_type, filename=asset.name)
+    else:
+        with open(path, 'rb') as file:
+            response = HttpResponse(file.read(), content_type=asset.content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if asset.variants:
+        response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if asset.immutable else MUTABLE_CACHE_CONTROL
+    return response
+
+
+class StaticAssetMiddleware:
+    """Отдаёт собранную статику из ``STATIC_ROOT`` до остальной обработки запроса.
+
+    Выбирает сжатую копию (.br, .gz) по ``Accept-Encoding``; файлам с хешем
+    в имени (из манифеста) ставит ``Cache-Control: immutable`` на год.
+    Список файлов читается при старте; если ``collectstatic`` не
+    выполнялся, запросы проходят дальше к django.contrib.staticfiles.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else None
+        self.index = static_index(settings.STATIC_ROOT) if self.prefix else {}
+
+    def find(self, request):
+        if not self.index or request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return None
+        return self.index.get(request.path[len(self.prefix):])
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        asset = self.find(request)
+        if asset is None:
+            return self.get_response(request)
+        return asset_response(request, asset)
+
+    async def __acall__(self, request):
+        asset = self.find(request)
+        if asset is None:
+            return await self.get_response(request)
+        # Под ASGI файл читается целиком в потоке: статика небольшая, а
+        # синхронный FileResponse сервер дочитывал бы с предупреждением
+        return await sync_to_async(asset_response, thread_sensitive=False)(request, asset, stream=False)
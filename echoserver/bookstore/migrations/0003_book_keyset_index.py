@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0002_cart_order_orderitem_cartitem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-created_at', '-id'], name='book_created_id_idx'),
+        ),
+    ]
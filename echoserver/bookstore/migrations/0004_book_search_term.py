@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:30
+
+import re
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копия токенизатора и весов из bookstore/search.py на момент миграции
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+FIELD_WEIGHTS = (
+    ('title', 5),
+    ('author', 3),
+    ('description', 1),
+)
+BATCH_SIZE = 500
+
+
+def book_terms(book):
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for token in TOKEN_RE.findall((getattr(book, field) or '').lower()):
+            if len(token) >= MIN_TERM_LENGTH:
+                weights[token[:MAX_TERM_LENGTH]] += weight
+    return weights
+
+
+def backfill_search_terms(apps, schema_editor):
+    """Индекс для уже существующих книг, пачками по первичному ключу."""
+    Book = apps.get_model('bookstore', 'Book')
+    BookSearchTerm = apps.get_model('bookstore', 'BookSearchTerm')
+    last_id = 0
+    while True:
+        batch = list(
+            Book.objects.filter(pk__gt=last_id).order_by('pk')
+            .only('pk', *(field for field, _ in FIELD_WEIGHTS))[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        BookSearchTerm.objects.bulk_create([
+            BookSearchTerm(term=term, book_id=book.pk, weight=weight)
+            for book in batch
+            for term, weight in book_terms(book).items()
+        ], batch_size=1000)
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0003_book_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='bookstore.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='booksearchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'book'), name='search_term_book_uniq'),
+        ),
+        migrations.RunPython(backfill_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:31
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_item_count(apps, schema_editor):
+    Order = apps.get_model('bookstore', 'Order')
+    OrderItem = apps.get_model('bookstore', 'OrderItem')
+    quantities = (
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    Order.objects.update(item_count=Coalesce(Subquery(quantities), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0004_book_search_term'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+        migrations.RunPython(backfill_item_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0005_order_item_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='isbn',
+            field=models.CharField(blank=True, max_length=20, null=True, unique=True, verbose_name='ISBN'),
+        ),
+    ]
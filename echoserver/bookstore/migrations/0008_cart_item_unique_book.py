@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0007_order_updated_at_book_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'book'), name='cart_item_book_uniq'),
+        ),
+    ]
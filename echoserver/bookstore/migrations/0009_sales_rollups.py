@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0008_cart_item_unique_book'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAuthorSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('author', models.CharField(max_length=100)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('completed_quantity', models.IntegerField(default=0)),
+                ('completed_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyBookSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('completed_quantity', models.IntegerField(default=0)),
+                ('completed_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='bookstore.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyauthorsales',
+            constraint=models.UniqueConstraint(fields=('day', 'author'), name='daily_author_sales_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailybooksales',
+            constraint=models.UniqueConstraint(fields=('day', 'book'), name='daily_book_sales_uniq'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:01
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_item_count(apps, schema_editor):
+    Cart = apps.get_model('bookstore', 'Cart')
+    CartItem = apps.get_model('bookstore', 'CartItem')
+    quantities = (
+        CartItem.objects.filter(cart=OuterRef('pk'))
+        .values('cart')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    Cart.objects.update(item_count=Coalesce(Subquery(quantities), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0011_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_item_count, migrations.RunPython.noop),
+    ]
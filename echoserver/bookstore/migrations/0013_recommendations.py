@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0012_cart_item_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='bookstore.book')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookstore.book')),
+            ],
+            options={
+                'ordering': ['book', 'rank'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.IntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookstore.book')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookstore.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bookrecommendation',
+            constraint=models.UniqueConstraint(fields=('book', 'rank'), name='book_recommendation_rank_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcooccurrence',
+            index=models.Index(fields=['book', '-orders'], name='book_cooccurrence_top_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookcooccurrence',
+            constraint=models.UniqueConstraint(fields=('book', 'other'), name='book_cooccurrence_uniq'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:07
+
+from bisect import bisect_right
+from collections import Counter
+
+from django.db import migrations, models
+
+# Копия ключа из bookstore/facets.py на момент миграции: код приложения и
+# настройки могут поменяться, а миграция должна давать тот же результат.
+# Если BOOK_PRICE_BANDS в настройках другие, после migrate нужен
+# manage.py rebuild_book_facets
+PRICE_BANDS = (0, 200, 500, 1000, 2000)
+NO_YEAR = 0
+
+
+def facet_key(author, price, published_date):
+    band = PRICE_BANDS[max(bisect_right(PRICE_BANDS, price) - 1, 0)]
+    return author, band, published_date.year if published_date else NO_YEAR
+
+
+def backfill_facets(apps, schema_editor):
+    Book = apps.get_model('bookstore', 'Book')
+    BookFacetCount = apps.get_model('bookstore', 'BookFacetCount')
+    totals = Counter(
+        facet_key(*row)
+        for row in Book.objects.order_by().values_list('author', 'price', 'published_date').iterator()
+    )
+    BookFacetCount.objects.bulk_create([
+        BookFacetCount(author=author, price_band=band, year=year, books=books)
+        for (author, band, year), books in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0013_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.CharField(max_length=100)),
+                ('price_band', models.PositiveIntegerField()),
+                ('year', models.PositiveSmallIntegerField()),
+                ('books', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='book_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price'], name='book_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_date'], name='book_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookfacetcount',
+            index=models.Index(fields=['price_band', 'year'], name='book_facet_band_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookfacetcount',
+            index=models.Index(fields=['year', 'price_band'], name='book_facet_year_band_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookfacetcount',
+            constraint=models.UniqueConstraint(fields=('author', 'price_band', 'year'), name='book_facet_uniq'),
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
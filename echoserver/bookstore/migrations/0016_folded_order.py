@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0015_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoldedOrder',
+            fields=[
+                ('order_id', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
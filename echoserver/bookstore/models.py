@@ -24,40 +24,259 @@ class Book(models.Model):
                                 validators=[MinValueValidator(0)])
     description = models.TextField(blank=True, verbose_name='Описание')
     published_date = models.DateField(null=True, blank=True, verbose_name='Дата публикации')
+    isbn = models.CharField(max_length=20, unique=True, null=True, blank=True, verbose_name='ISBN')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.title} ({self.author})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Поля фасетов на момент загрузки: при сохранении счётчик старого
+        # сочетания уменьшается (bookstore/facets.py)
+        loaded = instance.__dict__
+        if all(field in loaded for field in ('author', 'price', 'published_date')):
+            instance._facet_values = (loaded['author'], loaded['price'], loaded['published_date'])
+        return instance
+
     class Meta:
         verbose_name = 'Книга'
         verbose_name_plural = 'Книги'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='book_created_id_idx'),
+            models.Index(fields=['updated_at'], name='book_updated_idx'),
+            # Фильтры фасетной навигации; автор — вместе с порядком каталога
+            models.Index(fields=['author', '-created_at', '-id'], name='book_author_created_idx'),
+            models.Index(fields=['price'], name='book_price_idx'),
+            models.Index(fields=['published_date'], name='book_published_idx'),
+        ]
+
+
+class BookFacetCount(models.Model):
+    """Число книг с данным автором, ценовым диапазоном и годом издания.
+
+    Обновляется инкрементально (bookstore/facets.py), пересобирается
+    командой rebuild_book_facets. Год 0 — книги без даты публикации.
+    """
+    author = models.CharField(max_length=100)
+    price_band = models.PositiveIntegerField()
+    year = models.PositiveSmallIntegerField()
+    books = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'price_band', 'year'], name='book_facet_uniq'),
+        ]
+        # Уникальный индекс покрывает фильтр по автору; эти два — по диапазону и году
+        indexes = [
+            models.Index(fields=['price_band', 'year'], name='book_facet_band_year_idx'),
+            models.Index(fields=['year', 'price_band'], name='book_facet_year_band_idx'),
+        ]
 
 User = get_user_model()
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Сумма количеств позиций — для значка в шапке без COUNT по CartItem.
+    # Меняется в одной транзакции с позициями (bookstore/cart.py), сверка —
+    # manage.py repair_cart_counts
+    item_count = models.IntegerField(default=0)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     book = models.ForeignKey('Book', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'book'], name='cart_item_book_uniq'),
+        ]
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     STATUS_CHOICES = [
         ('P', 'Pending'),
         ('C', 'Completed'),
     ]
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='P')
+    # Денормализованное число книг в заказе, чтобы список заказов не считал позиции
+    item_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Для списка и фильтра по статусу в админке
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус на момент загрузки, чтобы заметить переход P -> C при сохранении
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     book = models.ForeignKey('Book', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
-    price = models.DecimalField(max_digits=6, decimal_places=2)
\ No newline at end of file
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+
+class ArchivedOrder(models.Model):
+    """Выполненный заказ, перенесённый из ``Order`` командой archive_orders.
+
+    id тот же, что был у заказа, поэтому старые ссылки продолжают работать.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, related_name='archived_orders', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=1, choices=Order.STATUS_CHOICES)
+    item_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='archived_order_user_idx'),
+            # Для списка в админке
+            models.Index(fields=['-created_at', '-id'], name='archived_order_created_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='items', on_delete=models.CASCADE)
+    book = models.ForeignKey('Book', related_name='+', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+class BookSearchTerm(models.Model):
+    """Инвертированный индекс для поиска по книгам: терм -> книга с весом."""
+    term = models.CharField(max_length=64)
+    book = models.ForeignKey(Book, related_name='search_terms', on_delete=models.CASCADE)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'book'], name='search_term_book_uniq'),
+        ]
+
+
+class DailyBookSales(models.Model):
+    """Продажи книги за день (по дате создания заказа).
+
+    Обновляется инкрементально при оформлении и выполнении заказов,
+    пересобирается командой rebuild_sales_rollups. Счётчики знаковые:
+    отмена выполнения вставляет отрицательную дельту.
+    """
+    day = models.DateField()
+    book = models.ForeignKey(Book, related_name='daily_sales', on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    completed_quantity = models.IntegerField(default=0)
+    completed_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'book'], name='daily_book_sales_uniq'),
+        ]
+
+class DailyAuthorSales(models.Model):
+    """Продажи автора за день; автор — строка из Book.author."""
+    day = models.DateField()
+    author = models.CharField(max_length=100)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    completed_quantity = models.IntegerField(default=0)
+    completed_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'author'], name='daily_author_sales_uniq'),
+        ]
+
+
+class Job(models.Model):
+    """Фоновая задача для воркера ``manage.py run_jobs`` (см. bookstore/jobs.py)."""
+    STATUS_CHOICES = [
+        ('Q', 'В очереди'),
+        ('R', 'Выполняется'),
+        ('D', 'Готово'),
+        ('F', 'Ошибка'),
+    ]
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='Q', verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name='Прогресс, %')
+    progress_message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_after', 'id'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
+
+
+class BookCooccurrence(models.Model):
+    """Разреженная матрица «книги в одном заказе»: число заказов с обеими книгами.
+
+    Диагональ (book == other) — число заказов с книгой. Пополняется после
+    каждого заказа, пересобирается командой rebuild_recommendations.
+    """
+    book = models.ForeignKey(Book, related_name='+', on_delete=models.CASCADE)
+    other = models.ForeignKey(Book, related_name='+', on_delete=models.CASCADE)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'other'], name='book_cooccurrence_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['book', '-orders'], name='book_cooccurrence_top_idx'),
+        ]
+
+
+class FoldedOrder(models.Model):
+    """Заказ, уже учтённый в ``BookCooccurrence``.
+
+    Пишется в одной транзакции с матрицей: повтор задачи дообучения не
+    прибавит заказ второй раз. id тот же, что у заказа и его архивной копии.
+    """
+    order_id = models.BigIntegerField(primary_key=True)
+
+
+class BookRecommendation(models.Model):
+    """Топ-N «с этой книгой покупают», готовый к показу одним запросом."""
+    book = models.ForeignKey(Book, related_name='recommendations', on_delete=models.CASCADE)
+    recommended = models.ForeignKey(Book, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='book_recommendation_rank_uniq'),
+        ]
@@ -0,0 +1,225 @@
+import base64
+import datetime
+import decimal
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _encode_value(value):
+    # DjangoJSONEncoder обрезает микросекунды, а для курсора нужна полная точность
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(repr(value))
+
+
+def estimate_count(model, using='default'):
+    """Приблизительное число строк в таблице по статистике СУБД.
+
+    Для MySQL и PostgreSQL берётся оценка из системных таблиц (без COUNT(*)),
+    для остальных бэкендов — точный COUNT(*).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            cursor.execute("SELECT COUNT(*) FROM %s" % connection.ops.quote_name(table))
+        row = cursor.fetchone()
+    return max(int(row[0] or 0), 0) if row else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator для админки: без фильтров число строк — оценка СУБД.
+
+    Точный COUNT(*) выполняется только для отфильтрованных выборок. Номер
+    последней страницы при этом приблизительный.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return estimate_count(queryset.model, queryset.db)
+        return super().count
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def approximate_count(self):
+        return self.paginator.approximate_count
+
+
+class KeysetPaginator:
+    """Пагинация по ключу (keyset/cursor) вместо LIMIT/OFFSET.
+
+    ``ordering`` — кортеж полей с одинаковым направлением сортировки,
+    последним должен идти уникальный столбец (обычно ``id``). Стоимость
+    запроса любой страницы одинакова при наличии составного индекса по этим
+    полям. Курсоры непрозрачны для клиента: это base64 от значений ключа
+    последней (или первой) строки страницы.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), count_approximately=False):
+        directions = {name.startswith('-') for name in ordering}
+        if len(directions) != 1:
+            raise ValueError('Все поля ключа должны сортироваться в одном направлении')
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.descending = directions.pop()
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.count_approximately = count_approximately
+
+    @property
+    def approximate_count(self):
+        if not self.count_approximately:
+            return None
+        if not hasattr(self, '_approximate_count'):
+            self._approximate_count = estimate_count(self.queryset.model, self.queryset.db)
+        return self._approximate_count
+
+    async def aapproximate_count(self):
+        if self.count_approximately and not hasattr(self, '_approximate_count'):
+            self._approximate_count = await sync_to_async(estimate_count)(self.queryset.model, self.queryset.db)
+        return self.approximate_count
+
+    def encode_cursor(self, obj, direction):
+        return self._encode(direction, [self._value(obj, name) for name in self.fields])
+
+    def _encode(self, direction, values):
+        payload = json.dumps([direction] + values, default=_encode_value, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def normalize_cursor(self, cursor):
+        """Канонический вид курсора — для ключей кэша: пустой — None,
+        некорректный — InvalidCursor, равные по значению — одна строка."""
+        if not cursor:
+            return None
+        return self._encode(*self.decode_cursor(cursor))
+
+    def decode_cursor(self, cursor):
+        """``(направление, значения ключа)``; любой некорректный курсор — InvalidCursor."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if not isinstance(payload, list) or len(payload) != len(self.fields) + 1:
+                raise ValueError(cursor)
+            direction, values = payload[0], payload[1:]
+            if direction not in ('n', 'p'):
+                raise ValueError(cursor)
+            values = [self._to_python(name, value) for name, value in zip(self.fields, values)]
+        except (ValueError, TypeError, ValidationError, OverflowError) as exc:
+            # UnicodeDecodeError, binascii.Error и JSONDecodeError — подклассы ValueError
+            raise InvalidCursor(cursor) from exc
+        return direction, values
+
+    def page(self, cursor=None):
+        queryset, forward = self._page_queryset(cursor)
+        return self._finish(list(queryset), cursor, forward)
+
+    async def apage(self, cursor=None):
+        queryset, forward = self._page_queryset(cursor)
+        return self._finish([row async for row in queryset], cursor, forward)
+
+    def _page_queryset(self, cursor):
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:self.per_page + 1], True
+        direction, values = self.decode_cursor(cursor)
+        if direction == 'n':
+            queryset = self.queryset.filter(self._after(values, forward=True)).order_by(*self.ordering)
+            return queryset[:self.per_page + 1], True
+        reverse_ordering = [name[1:] if name.startswith('-') else '-' + name for name in self.ordering]
+        queryset = self.queryset.filter(self._after(values, forward=False)).order_by(*reverse_ordering)
+        return queryset[:self.per_page + 1], False
+
+    def _finish(self, rows, cursor, forward):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            return self._build_page(rows[::-1], has_next=True, has_previous=has_more)
+        return self._build_page(rows, has_next=has_more, has_previous=bool(cursor))
+
+    def _build_page(self, rows, has_next, has_previous):
+        next_cursor = self.encode_cursor(rows[-1], 'n') if rows and has_next else None
+        previous_cursor = self.encode_cursor(rows[0], 'p') if rows and has_previous else None
+        return KeysetPage(rows, self, has_next, has_previous, next_cursor, previous_cursor)
+
+    def _after(self, values, forward):
+        # (a, b) < (va, vb)  <=>  a < va OR (a = va AND b < vb)
+        lookup = 'lt' if self.descending == forward else 'gt'
+        condition = Q()
+        for i, name in enumerate(self.fields):
+            term = Q(**{'%s__%s' % (name, lookup): values[i]})
+            for prev_name, prev_value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{prev_name: prev_value})
+            condition |= term
+        return condition
+
+    def _field(self, name):
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def _value(self, obj, name):
+        if isinstance(obj, dict):
+            return obj[name]
+        field = self._field(name)
+        return getattr(obj, field.attname if field is not None else name)
+
+    def _to_python(self, name, value):
+        # NULL в ключе не бывает, а bool, список и объект JSON — не значения ключа
+        if value is None or isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise TypeError(repr(value))
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError(repr(value))
+        field = self._field(name)
+        if field is None:
+            return value
+        value = field.to_python(value)
+        if value is None:
+            raise TypeError(name)
+        return value
@@ -0,0 +1,248 @@
+"""Рекомендации «с этой книгой покупают» по совместным покупкам.
+
+``BookCooccurrence`` — разреженная матрица книга × книга: сколько заказов
+содержат обе книги, на диагонали — сколько заказов содержат книгу.
+``BookRecommendation`` — готовый топ-N соседей каждой книги, на странице
+это один запрос по индексу.
+
+Полная пересборка (``rebuild``, команда rebuild_recommendations) считает
+матрицу как XᵀX по разреженной матрице «заказ × книга» в SciPy, а без
+NumPy/SciPy — агрегатом в БД. После оформления заказа задача
+``fold_order_recommendations`` прибавляет заказ к матрице и пересчитывает
+топ только для его книг; у остальных книг топ может немного устареть до
+следующей полной пересборки. Учтённые заказы отмечаются в ``FoldedOrder``
+в той же транзакции, что и матрица, поэтому повтор задачи или задача,
+дошедшая до воркера после пересборки, заказ второй раз не прибавят.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter
+from itertools import groupby, repeat
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .db.upsert import upsert_increments
+from .models import ArchivedOrderItem, BookCooccurrence, BookRecommendation, FoldedOrder, OrderItem
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+TOP_N = getattr(settings, 'RECOMMENDATIONS_TOP_N', 10)
+# При дообучении книга сравнивается с этим числом самых частых соседей
+CANDIDATES = getattr(settings, 'RECOMMENDATIONS_CANDIDATES', 50)
+# Сглаживание: пара, один раз купленная вместе, не обгоняет устойчивые пары
+SHRINK = 3
+CARD_FIELDS = ('id', 'title', 'author', 'price')
+# Откуда пересборка берёт позиции: архив заказов тоже (bookstore/archive.py)
+SOURCES = (OrderItem, ArchivedOrderItem)
+
+
+def score(together, orders, other_orders):
+    """Косинусная близость, уменьшенная для редких совместных покупок."""
+    return together / math.sqrt(orders * other_orders) * together / (together + SHRINK)
+
+
+def _top(book_id, neighbours, diagonal, top_n):
+    """``neighbours`` — [(книга, заказов вместе)]; возвращает [(балл, книга)]."""
+    orders = diagonal.get(book_id)
+    if not orders:
+        return []
+    scored = (
+        (score(together, orders, diagonal[other]), other)
+        for other, together in neighbours
+        if other != book_id and diagonal.get(other)
+    )
+    return heapq.nlargest(top_n, scored)
+
+
+def _recommendations(book_id, top):
+    return [
+        BookRecommendation(book_id=book_id, recommended_id=other, rank=rank, score=value)
+        for rank, (value, other) in enumerate(top, 1)
+    ]
+
+
+def _pairs_from_db(batch_size):
+    """(книга, другая книга, заказов вместе) — самосоединением позиций в БД."""
+    # Рабочие и архивные заказы не пересекаются, их пары просто складываются
+    pairs = Counter()
+    for model in SOURCES:
+        rows = (
+            model.objects.values_list('book_id', 'order__items__book_id')
+            .annotate(together=Count('order_id', distinct=True))
+            .order_by()
+            .iterator(chunk_size=batch_size)
+        )
+        for book_id, other_id, together in rows:
+            pairs[book_id, other_id] += together
+    return ((book_id, other_id, together) for (book_id, other_id), together in pairs.items())
+
+
+def _pairs_from_matrix(batch_size):
+    """То же через SciPy: XᵀX по матрице «заказ × книга» из нулей и единиц."""
+    order_ids, book_ids = array('q'), array('q')
+    for model in SOURCES:
+        for order_id, book_id in model.objects.values_list('order_id', 'book_id').iterator(chunk_size=batch_size):
+            order_ids.append(order_id)
+            book_ids.append(book_id)
+    if not book_ids:
+        return
+    rows = np.unique(np.frombuffer(order_ids, dtype=np.int64), return_inverse=True)[1]
+    books, columns = np.unique(np.frombuffer(book_ids, dtype=np.int64), return_inverse=True)
+    purchases = sparse.csr_matrix(
+        (np.ones(len(columns), dtype=np.int32), (rows, columns)), shape=(rows.max() + 1, len(books)),
+    )
+    # Одна книга дважды в заказе — всё равно одна покупка
+    purchases.data[:] = 1
+    together = (purchases.T @ purchases).tocsr()
+    for row in range(together.shape[0]):
+        start, end = together.indptr[row], together.indptr[row + 1]
+        yield from zip(
+            repeat(int(books[row])),
+            books[together.indices[start:end]].tolist(),
+            together.data[start:end].tolist(),
+        )
+
+
+def _order_ids(batch_size):
+    ids = set()
+    for model in SOURCES:
+        rows = model.objects.order_by().values_list('order_id', flat=True).distinct()
+        ids.update(rows.iterator(chunk_size=batch_size))
+    return ids
+
+
+def _bulk_create(model, objects, batch_size):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+
+
+def rebuild(top_n=TOP_N, batch_size=5000, progress=None):
+    """Пересобирает матрицу совместных покупок и топ-N для всех книг.
+
+    Позиции и номера заказов читаются внутри транзакции пересборки, в одном
+    снимке (REPEATABLE READ в MySQL): заказы, попавшие в матрицу, отмечаются
+    учтёнными, а оформленные позже прибавят их собственные задачи.
+    """
+    with transaction.atomic():
+        BookCooccurrence.objects.all().delete()
+        BookRecommendation.objects.all().delete()
+        FoldedOrder.objects.all().delete()
+        pairs = _pairs_from_db(batch_size) if sparse is None else _pairs_from_matrix(batch_size)
+        _bulk_create(BookCooccurrence, (
+            BookCooccurrence(book_id=book_id, other_id=other_id, orders=together)
+            for book_id, other_id, together in pairs
+        ), batch_size)
+        _bulk_create(FoldedOrder, (
+            FoldedOrder(order_id=order_id) for order_id in _order_ids(batch_size)
+        ), batch_size)
+        if progress:
+            progress(1, 2, 'матрица совместных покупок')
+
+        diagonal = dict(BookCooccurrence.objects.filter(other=F('book')).values_list('book_id', 'orders'))
+        rows = (
+            BookCooccurrence.objects.order_by('book_id')
+            .values_list('book_id', 'other_id', 'orders')
+            .iterator(chunk_size=batch_size)
+        )
+        _bulk_create(BookRecommendation, (
+            recommendation
+            for book_id, group in groupby(rows, key=lambda row: row[0])
+            for recommendation in _recommendations(
+                book_id, _top(book_id, [(other, together) for _, other, together in group], diagonal, top_n),
+            )
+        ), batch_size)
+    if progress:
+        progress(2, 2, 'топ соседей')
+    return {
+        'books': len(diagonal),
+        'recommendations': BookRecommendation.objects.count(),
+        'engine': 'db' if sparse is None else 'scipy',
+    }
+
+
+def refresh(book_ids, top_n=TOP_N, candidates=CANDIDATES):
+    """Пересчитывает топ-N указанных книг по текущей матрице."""
+    neighbours = {
+        book_id: list(
+            BookCooccurrence.objects.filter(book_id=book_id).exclude(other_id=book_id)
+            .order_by('-orders').values_list('other_id', 'orders')[:candidates]
+        )
+        for book_id in book_ids
+    }
+    needed = set(book_ids).union(*({other for other, _ in row} for row in neighbours.values()))
+    diagonal = dict(
+        BookCooccurrence.objects.filter(book_id__in=needed, other=F('book')).values_list('book_id', 'orders')
+    )
+    with transaction.atomic():
+        BookRecommendation.objects.filter(book_id__in=book_ids).delete()
+        BookRecommendation.objects.bulk_create([
+            recommendation
+            for book_id in book_ids
+            for recommendation in _recommendations(book_id, _top(book_id, neighbours[book_id], diagonal, top_n))
+        ])
+
+
+def fold_order(order_id, top_n=TOP_N):
+    """Добавляет один заказ к матрице и обновляет топ его книг. Возвращает число книг.
+
+    Уже учтённый заказ пропускается. Отметка вставляется первой: вторая
+    задача с тем же заказом ждёт на уникальном ключе коммита первой.
+    """
+    with transaction.atomic():
+        _, created = FoldedOrder.objects.get_or_create(order_id=order_id)
+        if not created:
+            return 0
+        # Заказ мог уйти в архив, пока задача ждала в очереди
+        book_ids = sorted({
+            book_id for model in SOURCES
+            for book_id in model.objects.filter(order_id=order_id).values_list('book_id', flat=True)
+        })
+        if not book_ids:
+            return 0
+        upsert_increments(
+            BookCooccurrence, ('book_id', 'other_id'), ('orders',),
+            {(book_id, other_id): [1] for book_id in book_ids for other_id in book_ids},
+        )
+        refresh(book_ids, top_n)
+    return len(book_ids)
+
+
+def _cards(book_ids, exclude):
+    return (
+        BookRecommendation.objects.filter(book_id__in=book_ids).exclude(recommended_id__in=exclude)
+        .values_list('recommended_id', 'score', *('recommended__' + field for field in CARD_FIELDS[1:]))
+    )
+
+
+def _merge(rows, limit):
+    # Для нескольких книг (корзина) баллы одного соседа складываются
+    totals, cards = {}, {}
+    for book_id, value, *card in rows:
+        totals[book_id] = totals.get(book_id, 0) + value
+        cards[book_id] = dict(zip(CARD_FIELDS, (book_id, *card)))
+    return [cards[book_id] for book_id in sorted(totals, key=totals.get, reverse=True)[:limit]]
+
+
+def for_books(book_ids, limit=TOP_N, exclude=()):
+    """Рекомендации к книгам одним запросом: [{id, title, author, price}]."""
+    if not book_ids:
+        return []
+    return _merge(_cards(book_ids, exclude), limit)
+
+
+async def afor_books(book_ids, limit=TOP_N, exclude=()):
+    if not book_ids:
+        return []
+    return _merge([row async for row in _cards(book_ids, exclude)], limit)
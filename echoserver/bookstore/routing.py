@@ -0,0 +1,109 @@
+"""Чтение каталога и заказов с реплик, запись — в основную базу.
+
+Реплики перечислены в ``DATABASE_REPLICAS``; пока список пуст, роутер
+ничего не меняет. Чтения ``Book``, ``Order`` и ``OrderItem`` уходят на
+случайную реплику, кроме случаев, когда реплика может отставать от того,
+что пользователь только что сделал:
+
+* внутри транзакции на основной базе;
+* до конца запроса, в котором уже была запись этих моделей;
+* ``REPLICA_STICKY_SECONDS`` секунд после такой записи — срок хранится в
+  cookie (см. ``ReadYourWritesMiddleware``), поэтому работает и для
+  анонимных сессий.
+
+Вне HTTP-запроса (команды, воркеры задач) закрепить чтения за основной
+базой можно через ``with use_primary():``.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ROUTED_MODELS = {
+    'bookstore.book', 'bookstore.order', 'bookstore.orderitem',
+    'bookstore.archivedorder', 'bookstore.archivedorderitem',
+}
+STICKY_COOKIE = 'primary_until'
+
+
+class RoutingState:
+    """Состояние маршрутизации одного запроса."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def _routed(model):
+    return model._meta.label_lower in ROUTED_MODELS
+
+
+def sticky_until(value):
+    """Момент (unix time) из cookie, до которого чтения идут в основную базу."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def begin_request(cookie_value):
+    state = RoutingState(pinned=sticky_until(cookie_value) > time.time())
+    return state, _state.set(state)
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Все чтения внутри блока — из основной базы."""
+    token = _state.set(RoutingState(pinned=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or not _routed(model):
+            return None
+        state = _state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        if not replicas():
+            return None
+        if _routed(model):
+            state = _state.get()
+            if state is not None:
+                state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Объекты с реплики и из основной базы — одни и те же данные
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,205 @@
+"""Сводные таблицы продаж по дням: по книгам и по авторам.
+
+Счётчики увеличиваются инкрементально в той же транзакции, что и
+оформление заказа или перевод его в статус «выполнен», одним
+``INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE`` на таблицу. Отчёты
+читают только сводные таблицы, поэтому их стоимость зависит от
+длины периода, а не от числа заказов. День — дата создания заказа в
+текущем часовом поясе.
+
+Удаление заказа из админки и каскадом вместе с пользователем вычитает
+его из сводок (``record_orders_deleted``). Перенос в архив — нет:
+архивные заказы остаются в сводках, и ``rebuild`` тоже их учитывает.
+Удаление книги каскадом убирает её позиции и строки ``DailyBookSales``,
+а в ``DailyAuthorSales`` её продажи остаются до пересборки.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .db.upsert import upsert_increments
+from .models import ArchivedOrder, ArchivedOrderItem, Book, DailyAuthorSales, DailyBookSales, Order, OrderItem
+
+COUNTERS = ('quantity', 'revenue', 'completed_quantity', 'completed_revenue')
+ROLLUPS = (
+    (DailyBookSales, 'book_id', 'book_id'),
+    (DailyAuthorSales, 'author', 'book__author'),
+)
+
+
+def _zero():
+    return [0, Decimal('0'), 0, Decimal('0')]
+
+
+def apply_lines(lines, placed=0, completed=0):
+    """Применяет позиции заказов к сводным таблицам.
+
+    ``lines`` — кортежи (момент создания заказа, id книги, автор, количество,
+    цена); ``placed``/``completed`` — знак изменения (+1, -1 или 0)
+    соответствующих счётчиков.
+    """
+    per_book = defaultdict(_zero)
+    per_author = defaultdict(_zero)
+    for created_at, book_id, author, quantity, price in lines:
+        day = timezone.localdate(created_at)
+        revenue = price * quantity
+        for counters in (per_book[day, book_id], per_author[day, author]):
+            counters[0] += placed * quantity
+            counters[1] += placed * revenue
+            counters[2] += completed * quantity
+            counters[3] += completed * revenue
+    upsert_increments(DailyBookSales, ('day', 'book_id'), COUNTERS, per_book)
+    upsert_increments(DailyAuthorSales, ('day', 'author'), COUNTERS, per_author)
+
+
+LINE_FIELDS = ('order__created_at', 'book_id', 'book__author', 'quantity', 'price')
+
+
+def _order_lines(orders):
+    return list(OrderItem.objects.filter(order__in=orders).values_list(*LINE_FIELDS))
+
+
+def record_order_placed(order, lines):
+    """Вызывается в транзакции оформления заказа; ``lines`` — строки корзины."""
+    completed = 1 if order.status == 'C' else 0
+    apply_lines(
+        [(order.created_at, line['book'].pk, line['book'].author, line['quantity'], line['price'])
+         for line in lines],
+        placed=1, completed=completed,
+    )
+
+
+def record_status_change(order, old_status, new_status):
+    if old_status == new_status or 'C' not in (old_status, new_status):
+        return
+    apply_lines(_order_lines([order.pk]), completed=1 if new_status == 'C' else -1)
+
+
+def record_orders_deleted(orders):
+    """Вычитает заказы из сводок; вызывается в транзакции до их удаления."""
+    lines = {False: [], True: []}
+    for status, *line in OrderItem.objects.filter(order__in=orders).values_list('order__status', *LINE_FIELDS):
+        lines[status == 'C'].append(line)
+    for completed, group in lines.items():
+        if group:
+            apply_lines(group, placed=-1, completed=-1 if completed else 0)
+
+
+def complete_orders(queryset):
+    """Переводит заказы из «ожидает» в «выполнен» пачкой, вместе со сводками.
+
+    Возвращает число переведённых заказов.
+    """
+    with transaction.atomic():
+        ids = list(queryset.filter(status='P').select_for_update().values_list('pk', flat=True))
+        if not ids:
+            return 0
+        Order.objects.filter(pk__in=ids).update(status='C', updated_at=timezone.now())
+        apply_lines(_order_lines(ids), completed=1)
+    return len(ids)
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def order_days():
+    """``(первый, последний)`` день заказов в рабочей таблице и архиве или None."""
+    bounds = [
+        model.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        for model in (Order, ArchivedOrder)
+    ]
+    firsts = [bound['first'] for bound in bounds if bound['first'] is not None]
+    if not firsts:
+        return None
+    lasts = [bound['last'] for bound in bounds if bound['last'] is not None]
+    return timezone.localdate(min(firsts)), timezone.localdate(max(lasts))
+
+
+def rebuild(start, end, batch_size=1000):
+    """Пересчитывает сводки за дни [start, end] из заказов, включая архив. Возвращает число строк."""
+    window = {
+        'order__created_at__gte': _local_midnight(start),
+        'order__created_at__lt': _local_midnight(end + datetime.timedelta(days=1)),
+    }
+    revenue = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    completed = Q(order__status='C')
+    total = 0
+    with transaction.atomic():
+        for model, key_field, lookup in ROLLUPS:
+            model.objects.filter(day__gte=start, day__lte=end).delete()
+            rows = (
+                OrderItem.objects.filter(**window)
+                .annotate(day=TruncDate('order__created_at'))
+                .values('day', lookup)
+                .annotate(
+                    total_quantity=Sum('quantity'),
+                    total_revenue=Sum(revenue),
+                    total_completed_quantity=Coalesce(Sum('quantity', filter=completed), 0),
+                    total_completed_revenue=Coalesce(Sum(revenue, filter=completed), Decimal('0')),
+                )
+                .order_by()
+            )
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(model(**{
+                    'day': row['day'],
+                    key_field: row[lookup],
+                    'quantity': row['total_quantity'],
+                    'revenue': row['total_revenue'],
+                    'completed_quantity': row['total_completed_quantity'],
+                    'completed_revenue': row['total_completed_revenue'],
+                }))
+                if len(batch) >= batch_size:
+                    model.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            model.objects.bulk_create(batch)
+            total += len(batch)
+        # Архивные заказы (все выполненные) — поверх, инкрементально
+        archived = (
+            ArchivedOrderItem.objects.filter(**window)
+            .values_list('order__created_at', 'book_id', 'book__author', 'quantity', 'price')
+            .order_by()
+            .iterator(chunk_size=batch_size)
+        )
+        for lines in iter(lambda: list(islice(archived, batch_size)), []):
+            apply_lines(lines, placed=1, completed=1)
+            total = None
+        if total is None:
+            # Архив мог добавить строки сводок
+            total = sum(model.objects.filter(day__gte=start, day__lte=end).count() for model, _, _ in ROLLUPS)
+    return total
+
+
+def sales_report(start, end, top=10):
+    """Выручка по дням и топ книг/авторов за [start, end] — только по сводкам."""
+    period = {'day__gte': start, 'day__lte': end}
+    totals = {
+        'quantity': Sum('quantity'),
+        'revenue': Sum('revenue'),
+        'completed_revenue': Sum('completed_revenue'),
+    }
+    days = list(DailyAuthorSales.objects.filter(**period).values('day').annotate(**totals).order_by('day'))
+    top_books = list(
+        DailyBookSales.objects.filter(**period).values('book_id').annotate(**totals).order_by('-revenue')[:top]
+    )
+    titles = Book.objects.in_bulk([row['book_id'] for row in top_books])
+    for row in top_books:
+        row['book'] = titles.get(row['book_id'])
+    top_authors = list(
+        DailyAuthorSales.objects.filter(**period).values('author').annotate(**totals).order_by('-revenue')[:top]
+    )
+    return {
+        'days': days,
+        'top_books': top_books,
+        'top_authors': top_authors,
+        'revenue': sum((row['revenue'] for row in days), Decimal('0')),
+        'quantity': sum(row['quantity'] for row in days),
+    }
@@ -0,0 +1,87 @@
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Book, BookSearchTerm
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+
+# Совпадение в названии важнее, чем в авторе, а тот — важнее описания
+FIELD_WEIGHTS = (
+    ('title', 5),
+    ('author', 3),
+    ('description', 1),
+)
+
+
+def tokenize(text):
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall((text or '').lower())
+        if len(token) >= MIN_TERM_LENGTH
+    ]
+
+
+def book_terms(book):
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for token in tokenize(getattr(book, field)):
+            weights[token] += weight
+    return weights
+
+
+def index_books(books):
+    """Переиндексирует переданные книги (удаляет старые термы и пишет новые)."""
+    books = [book for book in books if book.pk is not None]
+    if not books:
+        return
+    rows = [
+        BookSearchTerm(term=term, book_id=book.pk, weight=weight)
+        for book in books
+        for term, weight in book_terms(book).items()
+    ]
+    with transaction.atomic():
+        BookSearchTerm.objects.filter(book_id__in=[book.pk for book in books]).delete()
+        BookSearchTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+def search_queryset(query):
+    """Ранжированные результаты в виде словарей ``{'book_id': id, 'score': вес}``.
+
+    Последнее слово запроса ищется по префиксу, чтобы поиск работал при
+    наборе текста. Префикс — ``startswith`` (``LIKE 'терм%'``): диапазон
+    ``term >= 'терм' AND term < 'терм' + max-символ`` зависел бы от порядка
+    сортировки в collation СУБД.
+    """
+    return _matching_terms(query).values('book_id').annotate(score=Sum('weight'))
+
+
+def matching_book_ids(query):
+    """id книг, подходящих под запрос, — для подзапроса ``pk__in=...``."""
+    return _matching_terms(query).values('book_id')
+
+
+def _matching_terms(query):
+    tokens = tokenize(query)
+    if not tokens:
+        return BookSearchTerm.objects.none()
+    *whole, last = tokens
+    terms = BookSearchTerm.objects.filter(term__startswith=last)
+    if whole:
+        terms = terms | BookSearchTerm.objects.filter(term__in=whole)
+    return terms
+
+
+def attach_books(rows):
+    books = Book.objects.in_bulk([row['book_id'] for row in rows])
+    results = []
+    for row in rows:
+        book = books.get(row['book_id'])
+        if book is not None:
+            book.search_score = row['score']
+            results.append(book)
+    return results
@@ -0,0 +1,71 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import book_cache, facets
+from .cache import bump_catalog_version
+from .cart import merge_session_cart
+from .models import Book, Order, User
+from .sales import record_orders_deleted, record_status_change
+from .search import index_books
+
+
+@receiver(post_save, sender=Book)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    # Термы удалённой книги уходят вместе с ней по ON DELETE CASCADE
+    if not raw:
+        index_books([instance])
+
+
+@receiver(pre_save, sender=Book)
+def remember_facet_key(sender, instance, raw=False, **kwargs):
+    # Книга загружена не целиком или создана не из БД — старые значения берём запросом
+    if not raw and instance.pk is not None and not instance._state.adding \
+            and getattr(instance, '_facet_values', None) is None:
+        instance._facet_old_key = facets.stored_key(instance.pk)
+    else:
+        instance._facet_old_key = facets.loaded_key(instance)
+
+
+@receiver(post_save, sender=Book)
+def update_facet_counts(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    facets.record_saved(instance, None if created else getattr(instance, '_facet_old_key', None))
+    instance._facet_values = tuple(getattr(instance, field) for field in facets.KEY_FIELDS)
+
+
+@receiver(post_delete, sender=Book)
+def discount_deleted_book(sender, instance, **kwargs):
+    facets.record_deleted(instance)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_catalog_cache(sender, instance, raw=False, **kwargs):
+    # После коммита, чтобы другой воркер не закэшировал старые данные под новой версией
+    transaction.on_commit(bump_catalog_version)
+    if not raw:
+        book_cache.touch([instance.pk])
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is not None:
+        merge_session_cart(request, user)
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, created=False, raw=False, **kwargs):
+    # Новые заказы учитывает place_order; здесь — только смена статуса
+    old_status = getattr(instance, '_loaded_status', None)
+    if not created and not raw and old_status is not None:
+        record_status_change(instance, old_status, instance.status)
+    instance._loaded_status = instance.status
+
+
+@receiver(pre_delete, sender=User)
+def discount_user_orders(sender, instance, **kwargs):
+    # Заказы пользователя удаляются каскадом следом, в той же транзакции
+    record_orders_deleted(Order.objects.filter(user=instance))
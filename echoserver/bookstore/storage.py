@@ -0,0 +1,46 @@
+"""Хранилище статики: имена с хешем содержимого и сжатые копии.
+
+``collectstatic`` кладёт в ``STATIC_ROOT`` файлы вида
+``bootstrap.min.4a5b6c.css`` (манифест ``staticfiles.json``) и рядом —
+``.gz`` и, если установлен пакет ``brotli``, ``.br``. Отдаёт их
+``StaticAssetMiddleware`` (bookstore/middleware.py).
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ttf', '.eot')
+# Сжатая копия хранится, только если она заметно меньше оригинала
+MIN_SAVING = 0.05
+
+
+def compressed_variants(content):
+    """``[(расширение, сжатые байты)]`` для содержимого файла."""
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content, quality=11)))
+    return [(suffix, data) for suffix, data in variants if len(data) < len(content) * (1 - MIN_SAVING)]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if name.endswith(COMPRESSIBLE):
+                self._compress(name)
+
+    def _compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        for suffix, data in compressed_variants(content):
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self.save(name + suffix, ContentFile(data))
@@ -0,0 +1,90 @@
+"""Фоновые задачи магазина для очереди из bookstore/jobs.py."""
+import datetime
+import os
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import recommendations
+from .export import book_rows, encode, parse_fields
+from .importing import RowError, build_book, chunks, read_rows, write_chunk
+from .jobs import job
+from .models import Book
+from .pagination import estimate_count
+from .sales import rebuild
+from .search import index_books
+
+
+@job('import_books')
+def import_books(ctx, path, format=None, upsert=False, chunk_size=10000):
+    fmt = format or ('csv' if path.endswith('.csv') else 'jsonl')
+    size = os.path.getsize(path) or 1
+    total = skipped = 0
+    with open(path, encoding='utf-8', newline='') as stream:
+        for rows in chunks(read_rows(stream, fmt), chunk_size):
+            books = []
+            for row in rows:
+                try:
+                    books.append(build_book(row))
+                except RowError:
+                    skipped += 1
+            total += write_chunk(books, upsert=upsert)
+            ctx.progress(stream.buffer.tell(), size, f'{total} книг')
+    return {'imported': total, 'skipped': skipped}
+
+
+@job('export_books')
+def export_books(ctx, format='ndjson', fields=None, chunk_size=2000):
+    fields = parse_fields(fields)
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    name = 'books-%s.%s' % (timezone.now().strftime('%Y%m%d-%H%M%S'), format)
+    path = os.path.join(settings.EXPORT_ROOT, name)
+    expected = estimate_count(Book) or 1
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='') as stream:
+        for written, line in enumerate(encode(book_rows(fields, chunk_size=chunk_size), fields, format), 1):
+            stream.write(line)
+            if written % chunk_size == 0:
+                ctx.progress(written, expected, f'{written} строк')
+    return {'path': path, 'lines': written}
+
+
+@job('rebuild_sales_rollups')
+def rebuild_sales_rollups(ctx, start, end, window=7):
+    start = datetime.date.fromisoformat(start)
+    end = datetime.date.fromisoformat(end)
+    days = (end - start).days + 1
+    day = start
+    total = 0
+    while day <= end:
+        last = min(day + datetime.timedelta(days=window - 1), end)
+        total += rebuild(day, last)
+        ctx.progress((last - start).days + 1, days, f'до {last}')
+        day = last + datetime.timedelta(days=1)
+    return {'rows': total}
+
+
+@job('rebuild_search_index')
+def rebuild_search_index(ctx, batch_size=500):
+    expected = estimate_count(Book) or 1
+    last_id = 0
+    total = 0
+    while True:
+        batch = list(Book.objects.filter(pk__gt=last_id).order_by('pk')[:batch_size])
+        if not batch:
+            break
+        index_books(batch)
+        last_id = batch[-1].pk
+        total += len(batch)
+        ctx.progress(total, expected, f'{total} книг')
+    return {'indexed': total}
+
+
+@job('fold_order_recommendations')
+def fold_order_recommendations(ctx, order_id):
+    return {'books': recommendations.fold_order(order_id)}
+
+
+@job('rebuild_recommendations', max_attempts=1)
+def rebuild_recommendations(ctx, top_n=None):
+    return recommendations.rebuild(top_n or recommendations.TOP_N, progress=ctx.progress)
@@ -0,0 +1,39 @@
+from django import template
+
+from ..cache import fragment_key, get_or_build
+
+register = template.Library()
+
+
+class CatalogFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        vary_on = [value.resolve(context) for value in self.vary_on]
+        key = fragment_key(name, vary_on, version=context.get('catalog_version'))
+        return get_or_build(key, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def catalog_fragment(parser, token):
+    """Кэширует фрагмент шаблона до следующего изменения каталога.
+
+        {% catalog_fragment "card" book.pk %}...{% endcatalog_fragment %}
+
+    Внутрь нельзя помещать ничего, что зависит от пользователя
+    (csrf_token, кнопки администратора и т.п.).
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("'catalog_fragment' требует имя фрагмента")
+    nodelist = parser.parse(('endcatalog_fragment',))
+    parser.delete_first_token()
+    return CatalogFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
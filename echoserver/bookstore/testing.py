@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.urls import URLPattern, reverse
+
+from .middleware import QueryRecorder, QueryReport, query_budget
+
+
+@contextmanager
+def assert_query_budget(testcase, view_name, budget=None):
+    """Проверяет, что код внутри блока укладывается в бюджет запросов и не даёт N+1.
+
+        with assert_query_budget(self, 'order_list'):
+            self.client.get(reverse('order_list'))
+    """
+    recorder = QueryRecorder()
+    with recorder.capture():
+        yield recorder
+    report = QueryReport(
+        view_name, recorder,
+        budget if budget is not None else query_budget(view_name),
+        getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5),
+    )
+    problems = report.problems()
+    if problems:
+        testcase.fail('\n'.join(problems))
+
+
+class QueryBudgetMixin:
+    """Примесь к TestCase: прогоняет GET по всем маршрутам bookstore/urls.py.
+
+    Маршруты с параметрами проверяются, только если для них переданы kwargs.
+    """
+
+    def assertUrlsWithinBudget(self, client=None, url_kwargs=None, skip=('logout',)):
+        from . import urls
+
+        client = client or self.client
+        url_kwargs = url_kwargs or {}
+        checked = set()
+        for pattern in urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or not pattern.name:
+                continue
+            name = pattern.name
+            if name in skip or name in checked:
+                continue
+            if pattern.pattern.converters and name not in url_kwargs:
+                continue
+            checked.add(name)
+            with self.subTest(view=name):
+                with assert_query_budget(self, name):
+                    client.get(reverse(name, kwargs=url_kwargs.get(name)))
+        return checked
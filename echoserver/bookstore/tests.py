@@ -1,3 +1,1691 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import itertools
+import json
+import re
+import tempfile
+import textwrap
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from decimal import Decimal
+from importlib import import_module
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.db.models import Q, Sum
+from django.http import Http404, HttpResponse, QueryDict
+from django.templatetags.static import static
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views, book_cache, facets, hashing, recommendations, routing, sales, warmup
+from .archive import archive_orders
+from .auth import LoginThrottle, aauthenticate
+from .benchmark import Scenario, run_scenario, run_scenario_async
+from .cart import CART_MAX_QUANTITY, DatabaseCart, place_order, repair_counts
+from .checks import check_import_time_work, check_shared_caches, scan_source
+from .db.backends.pooled import PooledDatabaseWrapperMixin
+from .db.pool import ConnectionPool, PoolTimeout, get_pool, pool_stats
+from .facets import facet_counts, parse_filters
+from .hashing import HashingBusy, acheck_password, check_password
+from .importing import RowError, build_book, write_chunk
+from .jobs import JobContext, claim, enqueue, heartbeat, job, requeue_stale, run_job
+from .middleware import ReadYourWritesMiddleware
+from .models import (
+    ArchivedOrder, Book, BookCooccurrence, BookFacetCount, BookRecommendation, BookSearchTerm, Cart, CartItem,
+    DailyBookSales, FoldedOrder, Job, Order, OrderItem, User,
+)
+from .pagination import EstimatedCountPaginator, InvalidCursor, KeysetPaginator, estimate_count
+from .routing import PrimaryReplicaRouter
+from .search import MAX_TERM_LENGTH, index_books, matching_book_ids, search_queryset, tokenize
+from .testing import QueryBudgetMixin, assert_query_budget
+
+
+def make_books(count, **fields):
+    return [
+        Book.objects.create(title=f'Книга {i}', author=fields.get('author', f'Автор {i % 3}'),
+                            price=fields.get('price', 100 + i))
+        for i in range(count)
+    ]
+
+
+# Без collectstatic манифеста нет; сборку проверяет StaticAssetTests
+PLAIN_STATIC = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=PLAIN_STATIC)
+class BookstoreTestCase(TestCase):
+    """TestCase с чистыми кэшами: откат транзакции их не трогает."""
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all(initialized_only=True):
+            cache.clear()
+        book_cache._local.clear()
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+class KeysetPaginationTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(12)
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'pw12345!')
+
+    def paginator(self, per_page=5):
+        return KeysetPaginator(Book.objects.all(), per_page, ordering=('-created_at', '-id'))
+
+    def test_pages_forward_and_back(self):
+        paginator = self.paginator()
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        ids = [book.id for page in (first, second, third) for book in page]
+        expected = list(Book.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertFalse(third.has_next())
+        self.assertEqual([book.id for book in paginator.page(third.previous_cursor)],
+                         [book.id for book in second])
+        self.assertFalse(paginator.page(second.previous_cursor).has_previous())
+
+    def test_cursor_round_trip(self):
+        paginator = self.paginator()
+        book = Book.objects.get(pk=self.books[3].pk)
+        direction, values = paginator.decode_cursor(paginator.encode_cursor(book, 'n'))
+        self.assertEqual((direction, values), ('n', [book.created_at, book.id]))
+
+    def test_malformed_cursors_are_invalid(self):
+        paginator = self.paginator()
+        cursors = [
+            'e30',  # {}
+            '!!!',
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+            raw_cursor([]),
+            raw_cursor('n'),
+            raw_cursor({'0': 'n'}),
+            raw_cursor(['n', None, None]),
+            raw_cursor(['n', '2024-01-01T00:00:00', None]),
+            raw_cursor(['n', '2024-01-01T00:00:00']),
+            raw_cursor(['n', '2024-01-01T00:00:00', 1, 2]),
+            raw_cursor(['x', '2024-01-01T00:00:00', 1]),
+            raw_cursor(['n', 'не дата', 1]),
+            raw_cursor(['n', '2024-01-01T00:00:00', 'abc']),
+            raw_cursor(['n', '2024-01-01T00:00:00', [1]]),
+            raw_cursor(['n', '2024-01-01T00:00:00', {'id': 1}]),
+            raw_cursor(['n', '2024-01-01T00:00:00', True]),
+            raw_cursor(['n', '2024-01-01T00:00:00', 1e400]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_views_reject_malformed_cursor(self):
+        self.client.force_login(self.user)
+        for cursor in ('e30', raw_cursor(['n', None, None])):
+            for name, status in (('book_list', 404), ('order_list', 404), ('api_book_collection', 400)):
+                with self.subTest(view=name, cursor=cursor):
+                    response = self.client.get(reverse(name), {'cursor': cursor})
+                    self.assertEqual(response.status_code, status)
+            with self.subTest(view='book_search', cursor=cursor):
+                response = self.client.get(reverse('book_search'), {'q': 'книга', 'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class CatalogCacheTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(12)
+
+    def book_queries(self, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book_list'), *args, **kwargs)
+        return response, [query['sql'] for query in queries if 'bookstore_book"' in query['sql']]
+
+    def test_warm_page_skips_database(self):
+        response, queries = self.book_queries()
+        self.assertEqual(len(queries), 1)
+        response, queries = self.book_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, self.books[-1].title)
+
+    def test_book_changes_reach_cached_page(self):
+        self.client.get(reverse('book_list'))
+        book = Book.objects.get(pk=self.books[-1].pk)
+        book.title = 'Переименованная книга'
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertContains(self.client.get(reverse('book_list')), 'Переименованная книга')
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertNotContains(self.client.get(reverse('book_list')), 'Переименованная книга')
+
+    def test_cursor_is_normalized_before_cache_key(self):
+        page = self.client.get(reverse('book_list')).context['page_obj']
+        direction, (created_at, pk) = KeysetPaginator(
+            Book.objects.all(), 5, ordering=('-created_at', '-id'),
+        ).decode_cursor(page.next_cursor)
+        # Тот же курсор в другой записи (JSON с пробелами)
+        same = raw_cursor([direction, created_at.isoformat(), pk])
+        self.assertNotEqual(same, page.next_cursor)
+        self.book_queries({'cursor': page.next_cursor})
+        response, queries = self.book_queries({'cursor': same})
+        self.assertEqual(queries, [])
+        self.assertEqual(list(response.context['books']), list(page.paginator.page(page.next_cursor)))
+
+    def test_bogus_cursors_do_not_fill_cache(self):
+        catalog = caches[settings.CATALOG_CACHE_ALIAS]
+        self.client.get(reverse('book_list'))
+        with mock.patch.object(type(catalog), 'set', autospec=True) as cache_set, \
+                mock.patch.object(type(catalog), 'add', autospec=True) as cache_add:
+            for i in range(3):
+                self.assertEqual(self.client.get(reverse('book_list'), {'cursor': f'junk{i}'}).status_code, 404)
+        cache_set.assert_not_called()
+        cache_add.assert_not_called()
+
+    def test_process_local_cache_needs_single_worker(self):
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={**settings.CACHES, 'catalog': locmem}):
+            self.assertEqual(check_shared_caches(), [])
+            with override_settings(WORKER_PROCESSES=4):
+                # Счётчик корзины и лимиты входа по умолчанию живут в том же кэше
+                self.assertEqual([error.obj for error in check_shared_caches()],
+                                 ['CATALOG_CACHE_ALIAS', 'CART_COUNT_CACHE', 'LOGIN_THROTTLE_CACHE'])
+        with override_settings(WORKER_PROCESSES=4):
+            self.assertEqual(check_shared_caches(), [])
+
+
+class SearchTests(BookstoreTestCase):
+    def test_tokenize(self):
+        self.assertEqual(tokenize('«Война и мир», Л. Толстой; TOP_10'), ['война', 'мир', 'толстой', 'top_10'])
+        self.assertEqual(tokenize(None), [])
+        self.assertEqual(tokenize('я' * 100), ['я' * MAX_TERM_LENGTH])
+
+    def test_ranking_by_field_weight(self):
+        in_description = Book.objects.create(title='Описание', author='Автор', price=100, description='Пушкин')
+        in_author = Book.objects.create(title='Сказки', author='Пушкин', price=100)
+        in_title = Book.objects.create(title='Пушкин и Пушкин', author='Автор', price=100)
+        rows = list(search_queryset('пушкин').order_by('-score', '-book_id'))
+        self.assertEqual([(row['book_id'], row['score']) for row in rows],
+                         [(in_title.pk, 10), (in_author.pk, 3), (in_description.pk, 1)])
+        response = self.client.get(reverse('book_search'), {'q': 'Пушкин'})
+        self.assertEqual([book.pk for book in response.context['books']], [in_title.pk, in_author.pk, in_description.pk])
+
+    def test_prefix_matches_last_word_only(self):
+        tolstoy = Book.objects.create(title='Война и мир', author='Толстой', price=100)
+        tolkien = Book.objects.create(title='Хоббит', author='Толкин', price=100)
+        Book.objects.create(title='Мир_толстой', author='Другой', price=100)
+        ids = lambda query: set(matching_book_ids(query).values_list('book_id', flat=True))
+        self.assertEqual(ids('тол'), {tolstoy.pk, tolkien.pk})
+        self.assertEqual(ids('Толс'), {tolstoy.pk})
+        # Символы LIKE в запросе — обычные буквы
+        self.assertEqual(ids('тол_той'), set())
+        # Не последнее слово — только целиком
+        self.assertEqual(ids('тол война'), {tolstoy.pk})
+        self.assertEqual(ids('!!'), set())
+
+    def test_migration_backfills_existing_books(self):
+        books = make_books(3)
+        Book.objects.filter(pk=books[0].pk).update(description='Редкое слово')
+        index_books([Book.objects.get(pk=books[0].pk)])
+        expected = set(BookSearchTerm.objects.values_list('term', 'book_id', 'weight'))
+        BookSearchTerm.objects.all().delete()
+        migration = import_module('bookstore.migrations.0004_book_search_term')
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.backfill_search_terms(django_apps, None)
+        self.assertEqual(set(BookSearchTerm.objects.values_list('term', 'book_id', 'weight')), expected)
+
+
+class BookCacheTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(3)
+
+    def setUp(self):
+        super().setUp()
+        book_cache._stats.clear()
+
+    def test_hits_and_misses(self):
+        first, second, _ = self.books
+        with self.assertNumQueries(1):
+            summaries = book_cache.get_many([first.pk, second.pk, 99999, first.pk])
+        self.assertEqual(summaries, {
+            book.pk: (book.pk, book.title, book.author, book.price, book.updated_at) for book in (first, second)
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(book_cache.get_many([first.pk, second.pk, 99999]), summaries)
+            self.assertIsNone(book_cache.get(99999))
+        # Другой процесс: своего LRU нет, сводки берутся из общего кэша
+        book_cache._local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(book_cache.get(first.pk), summaries[first.pk])
+        stats = book_cache.stats()
+        self.assertEqual((stats['local_hits'], stats['shared_hits'], stats['misses']), (2, 3, 3))
+        self.assertEqual(stats['hit_ratio'], round(5 / 8, 4))
+
+    async def test_async_lookup_shares_entries(self):
+        book = self.books[0]
+        self.assertEqual((await book_cache.aget(book.pk)).title, book.title)
+        self.assertIsNone(await book_cache.aget(99999))
+        book_cache._local.clear()
+        self.assertEqual(await sync_to_async(book_cache.get)(book.pk), await book_cache.aget(book.pk))
+        self.assertEqual(book_cache.stats()['misses'], 2)
+
+    def test_save_and_delete_invalidate_only_that_book(self):
+        first, second, _ = self.books
+        book_cache.get_many([first.pk, second.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            first.title = 'Новое название'
+            first.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(book_cache.get_many([first.pk, second.pk])[first.pk].title, 'Новое название')
+        self.assertEqual(book_cache.stats()['misses'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.get(pk=first.pk).delete()
+        with self.assertNumQueries(0):
+            self.assertIsNone(book_cache.get(first.pk))
+
+    def test_bulk_price_change_invalidates(self):
+        book = self.books[0]
+        book_cache.get(book.pk)
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw12345!')
+        self.client.force_login(admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:bookstore_book_changelist'), {
+                'action': 'change_price', ACTION_CHECKBOX_NAME: [book.pk], 'apply': '1', 'percent': '10',
+            })
+        self.assertEqual(book_cache.get(book.pk).price, Book.objects.get(pk=book.pk).price)
+        self.assertNotEqual(book_cache.get(book.pk).price, book.price)
+
+    def test_stale_reader_does_not_overwrite_new_stamp(self):
+        book = self.books[0]
+        cache_type = type(caches[settings.CATALOG_CACHE_ALIAS])
+        real_add = cache_type.add
+
+        def add_after_concurrent_save(cache, *args, **kwargs):
+            # Книгу меняют между чтением сводки из БД и записью штампа
+            if Book.objects.get(pk=book.pk).title == book.title:
+                with self.captureOnCommitCallbacks(execute=True):
+                    Book.objects.filter(pk=book.pk).update(title='Новое название', updated_at=timezone.now())
+                    book_cache.touch([book.pk])
+            return real_add(cache, *args, **kwargs)
+
+        with mock.patch.object(cache_type, 'add', add_after_concurrent_save):
+            self.assertEqual(book_cache.get(book.pk).title, book.title)
+        self.assertEqual(book_cache.get(book.pk).title, 'Новое название')
+
+
+class DatabaseCartTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(3)
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw12345!')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def post(self, name, book_id, data=None):
+        # Сдвиг закешированного счётчика выполняется после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse(name, args=[book_id]), data)
+
+    def assertCounterMatches(self, expected):
+        cart = Cart.objects.get(user=self.user)
+        actual = CartItem.objects.filter(cart=cart).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertEqual(cart.item_count, actual)
+        self.assertEqual(actual, expected)
+        self.assertEqual(DatabaseCart(self.user).count(), expected)
+
+    def test_add_update_remove_keep_counter(self):
+        first, second, _ = self.books
+        self.post('add_to_cart', first.pk)
+        self.post('add_to_cart', first.pk)
+        self.post('add_to_cart', second.pk)
+        self.assertCounterMatches(3)
+
+        self.post('update_cart_item', first.pk, {'quantity': 5})
+        self.assertCounterMatches(6)
+        self.post('update_cart_item', second.pk, {'quantity': 0})
+        self.assertCounterMatches(5)
+        self.post('remove_from_cart', first.pk)
+        self.assertCounterMatches(0)
+        self.assertEqual(DatabaseCart(self.user).quantities(), {})
+
+    def test_update_unknown_book_is_404(self):
+        self.post('add_to_cart', self.books[0].pk)
+        for quantity in (3, 0):
+            response = self.post('update_cart_item', 99999, {'quantity': quantity})
+            self.assertEqual(response.status_code, 404)
+        self.assertCounterMatches(1)
+
+    def test_add_unknown_book_is_404(self):
+        response = self.post('add_to_cart', 99999)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_quantity_is_capped(self):
+        book = self.books[0]
+        self.post('update_cart_item', book.pk, {'quantity': 99999999999})
+        self.assertCounterMatches(CART_MAX_QUANTITY)
+
+    def test_merge_session_cart_on_login(self):
+        self.client.logout()
+        first, second, _ = self.books
+        self.post('add_to_cart', first.pk)
+        self.post('add_to_cart', second.pk)
+        DatabaseCart(self.user).add(first.pk, 2)
+        self.client.post(reverse('login'), {'username': 'buyer', 'password': 'pw12345!'})
+        self.assertEqual(DatabaseCart(self.user).quantities(), {first.pk: 3, second.pk: 1})
+        self.assertCounterMatches(4)
+
+    def test_repair_counts(self):
+        cart = DatabaseCart(self.user)
+        cart.add(self.books[0].pk, 2)
+        Cart.objects.filter(user=self.user).update(item_count=40)
+        self.assertEqual(repair_counts(), (1, 1))
+        self.assertCounterMatches(2)
+
+    def test_badge_reads_counter_from_cache(self):
+        self.post('add_to_cart', self.books[0].pk)
+        self.client.get(reverse('book_list'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('book_list'))
+        self.assertFalse([q for q in ctx.captured_queries if 'bookstore_cart' in q['sql']])
+
+    def test_stale_fill_does_not_overwrite_committed_write(self):
+        first, second, _ = self.books
+        DatabaseCart(self.user).add(first.pk)
+        caches[settings.CART_COUNT_CACHE].clear()
+        cache_type = type(caches[settings.CART_COUNT_CACHE])
+        real_add = cache_type.add
+
+        def add_after_concurrent_write(cache, *args, **kwargs):
+            # Другой воркер меняет корзину между чтением счётчика из БД и add
+            with self.captureOnCommitCallbacks(execute=True):
+                DatabaseCart(self.user).add(second.pk)
+            return real_add(cache, *args, **kwargs)
+
+        with mock.patch.object(cache_type, 'add', add_after_concurrent_write):
+            self.assertEqual(DatabaseCart(self.user).count(), 1)
+        self.assertCounterMatches(2)
+
+    @override_settings(CART_COUNT_CACHE='default', WORKER_PROCESSES=4)
+    def test_check_requires_shared_counter_cache(self):
+        self.assertEqual([error.obj for error in check_shared_caches()], ['CART_COUNT_CACHE'])
+
+
+class CheckoutTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(2)
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw12345!')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        cart = DatabaseCart(self.user)
+        cart.add(self.books[0].pk, 2)
+        cart.add(self.books[1].pk)
+
+    def checkout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('checkout'))
+
+    def test_checkout_requires_post(self):
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 405)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(DatabaseCart(self.user).count(), 3)
+
+    def test_checkout_places_order_and_empties_cart(self):
+        response = self.checkout()
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('order_detail', args=[order.pk]), fetch_redirect_response=False)
+        self.assertEqual((order.item_count, order.total_price), (3, 2 * self.books[0].price + self.books[1].price))
+        self.assertEqual(set(order.items.values_list('book_id', 'quantity')),
+                         {(self.books[0].pk, 2), (self.books[1].pk, 1)})
+        self.assertEqual(DatabaseCart(self.user).count(), 0)
+        self.assertRedirects(self.checkout(), reverse('cart_view'), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_second_checkout_of_same_cart_places_nothing(self):
+        # Оба запроса уже прочитали непустую корзину; второй ждёт блокировку позиций
+        first, second = DatabaseCart(self.user), DatabaseCart(self.user)
+        self.assertTrue(first.quantities() and second.quantities())
+        self.assertIsNotNone(place_order(self.user, first))
+        self.assertIsNone(place_order(self.user, second))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+    def test_removed_books_are_skipped(self):
+        Book.objects.filter(pk=self.books[1].pk).delete()
+        self.checkout()
+        self.assertEqual(list(Order.objects.get().items.values_list('book_id', flat=True)), [self.books[0].pk])
+
+
+class FacetCountTests(BookstoreTestCase):
+    def counts(self):
+        return {
+            (row.author, row.price_band, row.year): row.books
+            for row in BookFacetCount.objects.filter(books__gt=0)
+        }
+
+    def assertCountsMatchBooks(self):
+        expected = Counter(facets.book_key(book) for book in Book.objects.all())
+        self.assertEqual(self.counts(), dict(expected))
+
+    def test_save_and_delete_keep_counts(self):
+        book = Book.objects.create(title='А', author='Толстой', price=150,
+                                   published_date=datetime.date(1869, 1, 1))
+        Book.objects.create(title='Б', author='Толстой', price=700)
+        self.assertEqual(self.counts(), {('Толстой', 0, 1869): 1, ('Толстой', 500, facets.NO_YEAR): 1})
+
+        book.price = 1500
+        book.save()
+        self.assertCountsMatchBooks()
+        # Книга загружена не целиком: старый ключ берётся запросом
+        partial = Book.objects.only('id', 'title').get(pk=book.pk)
+        partial.author = 'Чехов'
+        partial.save()
+        self.assertCountsMatchBooks()
+        Book.objects.get(pk=book.pk).delete()
+        self.assertEqual(self.counts(), {('Толстой', 500, facets.NO_YEAR): 1})
+
+    def test_facet_counts_and_filters(self):
+        make_books(6)
+        result = facet_counts({'author': 'Автор 1'})
+        self.assertEqual(result['total'], Book.objects.filter(author='Автор 1').count())
+        self.assertEqual(parse_filters(QueryDict('author=Автор 1&price=0&year=0')),
+                         {'author': 'Автор 1', 'price_band': 0, 'year': 0})
+
+    def test_parse_filters_ignores_bad_values(self):
+        for query in ('price=inf', 'price=-Infinity', 'price=nan', 'price=1e999999', 'price=sNaN', 'price=abc', 'year=99999'):
+            with self.subTest(query=query):
+                self.assertEqual(parse_filters(QueryDict(query)), {})
+        self.assertEqual(self.client.get(reverse('book_list'), {'price': 'inf'}).status_code, 200)
+
+    def test_migration_key_matches_default_bands(self):
+        migration = import_module('bookstore.migrations.0014_book_facets')
+        self.assertEqual(migration.PRICE_BANDS, facets.PRICE_BANDS)
+        for price in (Decimal('0'), Decimal('199.99'), Decimal('200'), Decimal('5000')):
+            for published in (None, datetime.date(1869, 1, 1)):
+                self.assertEqual(migration.facet_key('А', price, published), facets.facet_key('А', price, published))
+
+    def test_admin_price_change_moves_bands(self):
+        make_books(4, price=180)
+        admin_user = User.objects.create_superuser('root', 'root@example.com', 'pw12345!')
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:bookstore_book_changelist'), {
+            'action': 'change_price',
+            ACTION_CHECKBOX_NAME: list(Book.objects.values_list('pk', flat=True)[:3]),
+            'percent': '200',
+            'apply': '1',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Book.objects.filter(price=540).count(), 3)
+        self.assertCountsMatchBooks()
+
+
+@job('tests.echo', max_attempts=2)
+def echo_job(ctx, value=None, fail=False):
+    if fail:
+        raise RuntimeError('сбой')
+    return value
+
+
+class JobQueueTests(BookstoreTestCase):
+    def test_claim_run_and_no_double_claim(self):
+        queued = enqueue('tests.echo', value=42)
+        self.assertEqual(claim('w1', 5), [queued.pk])
+        self.assertEqual(claim('w2', 5), [])
+        self.assertTrue(run_job(queued.pk))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.result, queued.attempts), ('D', 42, 1))
+
+    def test_failure_retries_then_fails(self):
+        queued = enqueue('tests.echo', fail=True)
+        claim('w1', 1)
+        self.assertFalse(run_job(queued.pk))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'Q')
+        Job.objects.filter(pk=queued.pk).update(run_after=timezone.now())
+        claim('w1', 1)
+        run_job(queued.pk)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('F', 2))
+        self.assertIn('сбой', queued.error)
+
+    def test_requeue_uses_heartbeat_not_start_time(self):
+        queued = enqueue('tests.echo')
+        claim('w1', 1)
+        long_ago = timezone.now() - datetime.timedelta(hours=2)
+        Job.objects.filter(pk=queued.pk).update(locked_at=long_ago, updated_at=long_ago)
+        # Долгая задача с живым воркером: heartbeat освежает updated_at
+        self.assertEqual(heartbeat('w1', [queued.pk]), 1)
+        self.assertEqual(requeue_stale(datetime.timedelta(hours=1)), 0)
+        # Прогресс — тоже признак жизни
+        Job.objects.filter(pk=queued.pk).update(updated_at=long_ago)
+        JobContext(Job.objects.get(pk=queued.pk), min_interval=0).progress(1, 10)
+        self.assertEqual(requeue_stale(datetime.timedelta(hours=1)), 0)
+        # Heartbeat чужого воркера не считается
+        Job.objects.filter(pk=queued.pk).update(updated_at=long_ago)
+        self.assertEqual(heartbeat('w2', [queued.pk]), 0)
+        self.assertEqual(requeue_stale(datetime.timedelta(hours=1)), 1)
+        self.assertEqual(Job.objects.get(pk=queued.pk).status, 'Q')
+
+    def test_requeued_job_is_not_finished_by_old_worker(self):
+        queued = enqueue('tests.echo', value=1)
+        claim('w1', 1)
+        stale = Job.objects.get(pk=queued.pk)
+        Job.objects.filter(pk=queued.pk).update(updated_at=timezone.now() - datetime.timedelta(hours=2))
+        requeue_stale(datetime.timedelta(hours=1))
+        self.assertEqual(claim('w2', 1), [queued.pk])
+        # Первый воркер дорабатывает свою копию уже после перехвата
+        with mock.patch.object(Job.objects, 'get', return_value=stale):
+            self.assertFalse(run_job(queued.pk))
+        current = Job.objects.get(pk=queued.pk)
+        self.assertEqual((current.status, current.locked_by), ('R', 'w2'))
+        self.assertTrue(run_job(queued.pk))
+        self.assertEqual(Job.objects.get(pk=queued.pk).status, 'D')
+
+
+class ImportTimeCheckTests(SimpleTestCase):
+    def scan(self, source):
+        return [(lineno, what) for lineno, what, _ in scan_source(textwrap.dedent(source))]
+
+    def test_module_level_work_found(self):
+        found = self.scan("""\
+            import requests
+            TOTAL = Book.objects.filter(price__gt=0).count()
+            IDS = list(Book.objects.values_list('id', flat=True))
+            VERSION = cache.get('catalog-version')
+            HOME = reverse('book_list')
+            DATA = requests.get('https://example.com')
+            with open('prices.csv') as f:
+                pass
+        """)
+        self.assertEqual(found, [
+            (2, 'запрос к БД'), (3, 'запрос к БД'), (4, 'обращение к кэшу'),
+            (5, 'разрешение URL (используйте reverse_lazy)'), (6, 'вызов requests'), (7, 'чтение файла'),
+        ])
+
+    def test_import_time_parts_of_definitions(self):
+        found = self.scan("""\
+            @cache_page(caches['default'].get('ttl'))
+            def view(request, default=Book.objects.first()):
+                return Book.objects.count()
+
+            class Form:
+                choices = list(Book.objects.all())
+
+                def clean(self):
+                    return reverse('book_list')
+
+            key = lambda book=Book.objects.last(): Book.objects.get()
+        """)
+        self.assertEqual(found, [(1, 'обращение к кэшу'), (2, 'запрос к БД'), (6, 'запрос к БД'), (11, 'запрос к БД')])
+
+    def test_runtime_code_ignored(self):
+        self.assertEqual(self.scan("""\
+            LAZY = reverse_lazy('book_list')
+            queryset = Book.objects.filter(price__gt=0)
+
+            def total():
+                return Book.objects.count()
+
+            if __name__ == '__main__':
+                print(total())
+        """), [])
+
+    def test_project_is_clean(self):
+        self.assertEqual(check_import_time_work(), [])
+
+
+class WarmupTests(SimpleTestCase):
+    def test_steps_timed(self):
+        with mock.patch('bookstore.warmup.gc') as gc_mock:
+            timings = warmup.warm_up()
+        self.assertEqual([name for name, _ in timings], ['urls', 'templates', 'models', 'translations'])
+        gc_mock.freeze.assert_called_once_with()
+
+        with mock.patch('bookstore.warmup.warm_worker') as warm_worker, mock.patch('bookstore.warmup.gc') as gc_mock:
+            timings = warmup.warm_up(freeze=False, connect=True)
+        self.assertEqual(timings[-1][0], 'connections')
+        warm_worker.assert_called_once_with()
+        gc_mock.freeze.assert_not_called()
+
+    def test_templates_compiled(self):
+        own = len(list((Path(settings.BASE_DIR) / 'bookstore' / 'templates' / 'bookstore').glob('*.html')))
+        self.assertEqual(warmup.warm_templates(('bookstore/*.html',)), own)
+        # Шаблоны crispy-forms лежат в пакете, а не в каталоге проекта
+        self.assertGreater(warmup.warm_templates(), own)
+
+    def test_worker_opens_only_pooled_connections(self):
+        pooled = mock.Mock(spec=PooledDatabaseWrapperMixin, ensure_connection=mock.Mock(), close=mock.Mock())
+        plain = mock.Mock()
+        with mock.patch('bookstore.warmup.connections') as connections_mock:
+            connections_mock.all.return_value = [pooled, plain]
+            warmup.warm_worker()
+        pooled.ensure_connection.assert_called_once_with()
+        pooled.close.assert_called_once_with()
+        plain.ensure_connection.assert_not_called()
+
+
+class BenchmarkRunnerTests(SimpleTestCase):
+    def scenario(self, asynchronous):
+        calls = itertools.count()
+
+        async def arequest(client, ctx):
+            return HttpResponse()
+
+        def prepare(client, ctx):
+            if next(calls) % 4 == 0:
+                raise OperationalError('database is locked')
+            return ()
+
+        request = arequest if asynchronous else (lambda client, ctx: HttpResponse())
+        return Scenario('flaky', request, prepare=prepare)
+
+    def test_prepare_failures_are_reported(self):
+        for runner, asynchronous in ((run_scenario, False), (run_scenario_async, True)):
+            with self.subTest(runner=runner.__name__):
+                stats = runner(self.scenario(asynchronous), 40, 3, {}, {})
+                self.assertEqual(stats['requested'], 40)
+                self.assertEqual(stats['requests'] + stats['errors'], 40)
+                self.assertEqual(stats['errors'], 10)
+                self.assertIn('database is locked', stats['error_samples'][0])
+
+
+class FakeConnections:
+    """Соединения для пула — просто номера; ``broken`` не проходят проверку."""
+
+    def __init__(self):
+        self.opened = itertools.count(1)
+        self.closed = []
+        self.broken = set()
+
+    def connect(self):
+        return next(self.opened)
+
+    def check(self, connection):
+        if connection in self.broken:
+            raise OperationalError('server has gone away')
+
+    def close(self, connection):
+        self.closed.append(connection)
+
+    def pool(self, **options):
+        return ConnectionPool(self.connect, self.check, self.close, **options)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        # TestCase держит транзакцию открытой; здесь её нет, как в обычном запросе
+        patcher = mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Book), 'replica')
+        self.assertEqual(self.router.db_for_read(ArchivedOrder), 'replica')
+        self.assertIsNone(self.router.db_for_read(User))
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertIsNone(self.router.db_for_read(Book))
+            self.assertIsNone(self.router.db_for_write(Book))
+
+    def test_atomic_block_pins_to_primary(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Order), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Order), 'replica')
+
+    def test_write_pins_rest_of_request(self):
+        state, token = routing.begin_request(None)
+        try:
+            self.assertEqual(self.router.db_for_read(Order), 'replica')
+            # Запись корзины не влияет на чтение каталога и заказов
+            self.assertEqual(self.router.db_for_write(CartItem), DEFAULT_DB_ALIAS)
+            self.assertFalse(state.wrote)
+            self.assertEqual(self.router.db_for_write(Order), DEFAULT_DB_ALIAS)
+            self.assertTrue(state.wrote)
+            self.assertEqual(self.router.db_for_read(OrderItem), DEFAULT_DB_ALIAS)
+        finally:
+            routing.end_request(token)
+        self.assertEqual(self.router.db_for_read(OrderItem), 'replica')
+
+    def test_use_primary(self):
+        with routing.use_primary():
+            self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Book), 'replica')
+
+    def test_sticky_cookie(self):
+        for value, pinned in ((str(time.time() + 5), True), (str(time.time() - 1), False), ('мусор', False)):
+            with self.subTest(value=value):
+                state, token = routing.begin_request(value)
+                routing.end_request(token)
+                self.assertIs(state.pinned, pinned)
+
+    def test_allow_migrate(self):
+        self.assertIs(self.router.allow_migrate('replica', 'bookstore'), False)
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'bookstore'))
+
+    def middleware_response(self, get_response, request):
+        middleware = ReadYourWritesMiddleware(get_response)
+        if iscoroutinefunction(middleware):
+            return async_to_sync(middleware)(request)
+        return middleware(request)
+
+    def test_middleware_sets_cookie_after_write(self):
+        def write(request):
+            self.router.db_for_write(Book)
+            return HttpResponse()
+
+        async def awrite(request):
+            return write(request)
+
+        for get_response in (write, awrite):
+            with self.subTest(asynchronous=get_response is awrite):
+                response = self.middleware_response(get_response, RequestFactory().post('/'))
+                cookie = response.cookies[routing.STICKY_COOKIE]
+                self.assertEqual(cookie['max-age'], 5)
+                self.assertGreater(routing.sticky_until(cookie.value), time.time())
+
+        response = ReadYourWritesMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+        self.assertNotIn(routing.STICKY_COOKIE, response.cookies)
+
+    def test_middleware_reads_cookie(self):
+        seen = []
+
+        def read(request):
+            seen.append(self.router.db_for_read(Book))
+            return HttpResponse()
+
+        middleware = ReadYourWritesMiddleware(read)
+        request = RequestFactory().get('/')
+        request.COOKIES[routing.STICKY_COOKIE] = str(time.time() + 5)
+        response = middleware(request)
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(seen, [DEFAULT_DB_ALIAS, 'replica'])
+        # Чтение не продлевает окно
+        self.assertNotIn(routing.STICKY_COOKIE, response.cookies)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.connections = FakeConnections()
+
+    def test_acquire_reuses_released_connection(self):
+        pool = self.connections.pool(min_size=0, max_size=2)
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertEqual((first.connection, second.connection), (1, 2))
+        pool.release(second)
+        self.assertIs(pool.acquire(), second)
+        stats = pool.stats()
+        self.assertEqual((stats['opened'], stats['borrowed'], stats['in_use']), (2, 3, 2))
+
+    def test_fill_opens_min_size(self):
+        pool = self.connections.pool(min_size=2, max_size=3)
+        pool.fill()
+        self.assertEqual((pool.stats()['size'], pool.stats()['idle']), (2, 2))
+
+    def test_timeout_when_exhausted(self):
+        pool = self.connections.pool(min_size=0, max_size=1, timeout=0.05)
+        entry = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        # После возврата соединение снова выдаётся
+        pool.release(entry)
+        self.assertIs(pool.acquire(), entry)
+
+    def test_failed_connect_frees_slot(self):
+        pool = self.connections.pool(min_size=0, max_size=1, timeout=0.05)
+        with mock.patch.object(pool, '_connect', side_effect=OperationalError('refused')):
+            with self.assertRaises(OperationalError):
+                pool.acquire()
+        self.assertEqual(pool.acquire().connection, 1)
+
+    def test_expired_connection_is_recycled(self):
+        pool = self.connections.pool(min_size=0, max_size=1, max_age=0)
+        entry = pool.acquire()
+        pool.release(entry)
+        self.assertEqual(self.connections.closed, [1])
+        self.assertEqual(pool.acquire().connection, 2)
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+    def test_broken_idle_connection_is_replaced(self):
+        pool = self.connections.pool(min_size=0, max_size=1, check_idle=0)
+        pool.release(pool.acquire())
+        self.connections.broken.add(1)
+        self.assertEqual(pool.acquire().connection, 2)
+        self.assertEqual(self.connections.closed, [1])
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+
+    def test_idle_connections_above_min_size_are_closed(self):
+        pool = self.connections.pool(min_size=1, max_size=3, max_idle=0)
+        entries = [pool.acquire() for _ in range(3)]
+        for entry in entries:
+            pool.release(entry)
+        pool.release(pool.acquire())
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(self.connections.closed, [1, 2])
+
+
+    @mock.patch.dict('bookstore.db.pool._pools')
+    def test_pool_follows_connection_params(self):
+        alias = 'pool-test'
+        first = get_pool(alias, {'host': 'a', 'password': 'x'}, self.connections.pool)
+        self.assertIs(get_pool(alias, {'password': 'x', 'host': 'a'}, self.connections.pool), first)
+        busy, idle = first.acquire(), first.acquire()
+        first.release(idle)
+
+        second = get_pool(alias, {'host': 'a', 'password': 'y'}, self.connections.pool)
+        self.assertIsNot(second, first)
+        self.assertIs(get_pool(alias, {'host': 'a', 'password': 'y'}, self.connections.pool), second)
+        self.assertEqual(self.connections.closed, [idle.connection])
+        # Соединение со старыми параметрами в новый пул не попадает
+        first.release(busy)
+        self.assertEqual(self.connections.closed, [idle.connection, busy.connection])
+        self.assertEqual(second.acquire().connection, 3)
+        self.assertEqual(pool_stats()[alias]['opened'], 1)
+
+
+class StreamingExportTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_books(7)
+
+    def expected_ids(self):
+        return list(Book.objects.order_by('id').values_list('id', flat=True))
+
+    def test_wsgi_export_streams_all_rows(self):
+        response = self.client.get(reverse('api_book_export'), {'fields': 'id,title'})
+        self.assertFalse(response.is_async)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.expected_ids())
+
+    async def test_asgi_export_uses_async_iterator(self):
+        with mock.patch('bookstore.export.ASYNC_LINES', 3):
+            response = await self.async_client.get(reverse('api_book_export'), {'format': 'csv', 'fields': 'id'})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual(lines[0], 'id')
+        ids = await sync_to_async(self.expected_ids)()
+        self.assertEqual([int(line) for line in lines[1:]], ids)
+        self.assertGreater(len(chunks), 1)
+
+
+class AsyncViewTests(BookstoreTestCase):
+    """Асинхронные версии горячих страниц вызываются напрямую: urls.py выбирает модуль при импорте."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(3)
+        cls.user = User.objects.create_user('async', 'async@example.com', 'pw12345!')
+        cls.order = Order.objects.create(user=cls.user, total_price=100, item_count=1)
+        OrderItem.objects.create(order=cls.order, book=cls.books[1], quantity=1, price=100)
+
+    def setUp(self):
+        super().setUp()
+        # Сессия загружается заранее: в async-тесте обращение к БД запрещено
+        self.client.force_login(self.user)
+        self.session = self.client.session
+
+    def request(self, method='get', path='/', user=None, **extra):
+        request = getattr(AsyncRequestFactory(), method)(path, **extra)
+        request.session = self.session if user else import_module(settings.SESSION_ENGINE).SessionStore()
+        return request
+
+    async def test_acondition_short_circuits(self):
+        calls = []
+
+        @async_views.acondition(etag_func=lambda request: 'v1')
+        async def view(request):
+            calls.append(request.method)
+            return HttpResponse('ok')
+
+        response = await view(self.request())
+        self.assertEqual(response['ETag'], '"v1"')
+        response = await view(self.request(headers={'If-None-Match': '"v1"'}))
+        self.assertEqual(response.status_code, 304)
+        response = await view(self.request(headers={'If-None-Match': '"v0"'}))
+        self.assertEqual(response.status_code, 200)
+        # POST не сравнивает ETag и не получает его
+        response = await view(self.request('post', headers={'If-None-Match': '"v1"'}))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(calls, ['GET', 'GET', 'POST'])
+
+    async def test_acondition_last_modified(self):
+        modified = datetime.datetime(2024, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+        @async_views.acondition(last_modified_func=lambda request: modified)
+        async def view(request):
+            return HttpResponse('ok')
+
+        response = await view(self.request())
+        self.assertEqual(response['Last-Modified'], 'Wed, 01 May 2024 12:00:00 GMT')
+        response = await view(self.request(headers={'If-Modified-Since': response['Last-Modified']}))
+        self.assertEqual(response.status_code, 304)
+
+    async def test_order_list_requires_login(self):
+        request = self.request(path=reverse('order_list'))
+        response = await async_views.order_list(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+
+    async def test_order_list(self):
+        request = self.request(path=reverse('order_list'), user=self.user)
+        response = await async_views.order_list(request)
+        self.assertContains(response, f'Заказ #{self.order.pk}')
+        self.assertContains(response, self.books[1].title)
+        self.assertEqual(request.cart_badge_count, 0)
+
+        request = self.request(path=reverse('order_list'), user=self.user,
+                               headers={'If-None-Match': response['ETag']})
+        response = await async_views.order_list(request)
+        self.assertEqual(response.status_code, 304)
+
+        request = self.request(path=reverse('order_list'), user=self.user, data={'cursor': '!'})
+        with self.assertRaises(Http404):
+            await async_views.order_list(request)
+
+    async def test_add_to_cart(self):
+        book = self.books[0]
+        response = await async_views.add_to_cart(self.request(), book.pk)
+        self.assertEqual(response.status_code, 405)
+        request = self.request('post', user=self.user)
+        with self.assertRaises(Http404):
+            await async_views.add_to_cart(request, 0)
+
+        response = await async_views.add_to_cart(request, book.pk)
+        self.assertRedirects(response, reverse('cart_view'), fetch_redirect_response=False)
+        quantities = await sync_to_async(DatabaseCart(self.user).quantities)()
+        self.assertEqual(quantities, {book.pk: 1})
+
+        request = self.request(user=self.user)
+        response = await async_views.cart_view(request)
+        self.assertContains(response, book.title)
+
+    async def test_book_list(self):
+        response = await async_views.BookListView.as_view()(self.request())
+        for book in self.books:
+            self.assertContains(response, book.title)
+        with self.assertRaises(Http404):
+            await async_views.BookListView.as_view()(self.request(data={'cursor': '!'}))
+
+
+class ConditionalGetTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(3)
+        cls.user = User.objects.create_user('owner', 'owner@example.com', 'pw12345!')
+
+    def change_book(self, **fields):
+        book = Book.objects.get(pk=self.books[0].pk)
+        for name, value in fields.items():
+            setattr(book, name, value)
+        # Версия каталога увеличивается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+
+    def test_catalog_not_modified_without_queries(self):
+        # Первый ответ ставит cookie CSRF, а она входит в ETag
+        self.client.get(reverse('book_list'))
+        response = self.client.get(reverse('book_list'))
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('book_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('book_list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        self.change_book(price=999)
+        response = self.client.get(reverse('book_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_edit_in_another_worker_invalidates_validators(self):
+        # Каждый воркер держит свой экземпляр кэша каталога; версия — только в общем хранилище
+        workers = [caches.create_connection(settings.CATALOG_CACHE_ALIAS) for _ in range(2)]
+        with mock.patch('bookstore.cache.catalog_cache', return_value=workers[0]):
+            self.client.get(reverse('book_list'))
+            etag = self.client.get(reverse('book_list'))['ETag']
+            self.assertEqual(self.client.get(reverse('book_list'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with mock.patch('bookstore.cache.catalog_cache', return_value=workers[1]):
+            self.change_book(price=999)
+        with mock.patch('bookstore.cache.catalog_cache', return_value=workers[0]):
+            response = self.client.get(reverse('book_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '999')
+
+    def test_order_detail_etag_follows_book_titles(self):
+        order = Order.objects.create(user=self.user, total_price=100, item_count=1)
+        OrderItem.objects.create(order=order, book=self.books[0], quantity=1, price=100)
+        self.client.force_login(self.user)
+        url = reverse('order_detail', args=[order.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.change_book(title='Новое название')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новое название')
+
+
+class ImportTests(BookstoreTestCase):
+    def row(self, **fields):
+        return {'title': 'Книга', 'author': 'Автор', 'price': '150', 'isbn': '', **fields}
+
+    def test_bad_rows_are_rejected(self):
+        for price in ('NaN', 'sNaN', 'Infinity', '-1', '10000', '1e999999', 'abc', ''):
+            with self.subTest(price=price), self.assertRaises(RowError):
+                build_book(self.row(price=price))
+        with self.assertRaises(RowError):
+            build_book({'title': 'Книга', 'author': 'Автор'})
+        with self.assertRaises(RowError):
+            build_book(self.row(isbn='9' * 30))
+        self.assertEqual(build_book(self.row(price='12.345')).price, Decimal('12.35'))
+
+    def test_duplicate_isbn_in_chunk_is_written_once(self):
+        for upsert in (False, True):
+            with self.subTest(upsert=upsert):
+                Book.objects.all().delete()
+                BookFacetCount.objects.all().delete()
+                books = [
+                    build_book(self.row(isbn='978-1', price='150')),
+                    build_book(self.row(isbn='978-2')),
+                    build_book(self.row(isbn='978-1', price='700', title='Второе издание')),
+                ]
+                self.assertEqual(write_chunk(books, upsert=upsert), 2)
+                self.assertEqual(Book.objects.get(isbn='978-1').title, 'Второе издание')
+                self.assertEqual(
+                    dict(BookFacetCount.objects.filter(books__gt=0).values_list('price_band', 'books')),
+                    {0: 1, 500: 1},
+                )
+
+    def test_upsert_moves_facet_counts(self):
+        write_chunk([build_book(self.row(isbn='978-1', price='150'))], upsert=True)
+        write_chunk([build_book(self.row(isbn='978-1', price='1500'))], upsert=True)
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(
+            dict(BookFacetCount.objects.filter(books__gt=0).values_list('price_band', 'books')), {1000: 1},
+        )
+
+
+class OrderHistoryTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(4)
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'pw12345!')
+        cls.other = User.objects.create_user('other', 'other@example.com', 'pw12345!')
+        now = timezone.now()
+        cls.orders = []
+        for i in range(12):
+            order = Order.objects.create(user=cls.user, total_price=300, item_count=3)
+            OrderItem.objects.create(order=order, book=cls.books[i % 4], quantity=1, price=100)
+            OrderItem.objects.create(order=order, book=cls.books[(i + 1) % 4], quantity=2, price=100)
+            # Одинаковое время у пары заказов — порядок решает id
+            Order.objects.filter(pk=order.pk).update(created_at=now - datetime.timedelta(hours=i // 2))
+            cls.orders.append(order)
+        cls.foreign = Order.objects.create(user=cls.other, total_price=100, item_count=1)
+        OrderItem.objects.create(order=cls.foreign, book=cls.books[0], quantity=1, price=100)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_pages_cover_history_once(self):
+        expected = list(
+            Order.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        seen, params = [], {}
+        while True:
+            with assert_query_budget(self, 'order_list'):
+                response = self.client.get(reverse('order_list'), params)
+            seen += [order.pk for order in response.context['orders']]
+            page = response.context['page_obj']
+            if not page.has_next():
+                break
+            params = {'cursor': page.next_cursor}
+        self.assertEqual(seen, expected)
+        self.assertNotIn(self.foreign.pk, seen)
+
+        response = self.client.get(reverse('order_list'), {'cursor': 'мусор'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_items_prefetched(self):
+        with assert_query_budget(self, 'order_list'):
+            response = self.client.get(reverse('order_list'))
+        first = response.context['orders'][0]
+        with self.assertNumQueries(0):
+            titles = [item.book.title for item in first.items.all()]
+        self.assertEqual(len(titles), 2)
+        self.assertContains(response, titles[0])
+
+    def test_detail(self):
+        order = self.orders[3]
+        with assert_query_budget(self, 'order_detail'):
+            response = self.client.get(reverse('order_detail', args=[order.pk]))
+        self.assertFalse(response.context['archived'])
+        self.assertEqual([item.book for item in response.context['order'].items.all()],
+                         [self.books[3], self.books[0]])
+        response = self.client.get(reverse('order_detail', args=[self.foreign.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_archive_listed_separately(self):
+        Order.objects.filter(pk=self.orders[-1].pk).update(
+            status='C', created_at=timezone.now() - datetime.timedelta(days=500),
+        )
+        archive_orders()
+        response = self.client.get(reverse('order_list'))
+        self.assertNotIn(self.orders[-1].pk, [order.pk for order in response.context['orders']])
+        with assert_query_budget(self, 'order_list'):
+            response = self.client.get(reverse('order_list'), {'archive': '1'})
+        self.assertTrue(response.context['archive'])
+        self.assertEqual([order.pk for order in response.context['orders']], [self.orders[-1].pk])
+        self.assertContains(response, self.books[3].title)
+
+
+class SalesRollupTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(3)
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw12345!')
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw12345!')
+
+    def place(self, user, *books):
+        cart = DatabaseCart(user)
+        for book in books:
+            cart.add(book.pk)
+        return place_order(user, cart)
+
+    def rollups(self):
+        # Нулевые строки остаются после вычитания; пересборка их не создаёт
+        nonzero = ~Q(quantity=0, revenue=0, completed_quantity=0, completed_revenue=0)
+        return {
+            model.__name__: set(model.objects.filter(nonzero).values_list('day', key, *sales.COUNTERS))
+            for model, key, _ in sales.ROLLUPS
+        }
+
+    def assertRebuildMatches(self):
+        incremental = self.rollups()
+        days = sales.order_days() or (timezone.localdate(),) * 2
+        sales.rebuild(*days)
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_place_and_complete(self):
+        first, second, _ = self.books
+        order = self.place(self.user, first, first, second)
+        today = timezone.localdate(order.created_at)
+        row = DailyBookSales.objects.get(day=today, book=first)
+        self.assertEqual((row.quantity, row.revenue, row.completed_quantity), (2, 2 * first.price, 0))
+
+        self.assertEqual(sales.complete_orders(Order.objects.all()), 1)
+        self.assertEqual(sales.complete_orders(Order.objects.all()), 0)
+        row.refresh_from_db()
+        self.assertEqual((row.completed_quantity, row.completed_revenue), (2, 2 * first.price))
+        # Возврат в «ожидает» — отрицательная дельта
+        order = Order.objects.get()
+        order.status = 'P'
+        order.save()
+        row.refresh_from_db()
+        self.assertEqual((row.quantity, row.completed_quantity), (2, 0))
+
+        report = sales.sales_report(today, today)
+        self.assertEqual((report['quantity'], report['revenue']), (3, order.total_price))
+        self.assertEqual(report['top_books'][0]['book'], first)
+
+    def test_rebuild_matches_incremental(self):
+        first, second, third = self.books
+        self.place(self.user, first, second)
+        completed = self.place(self.user, second, third, third)
+        self.place(self.admin_user, first)
+        sales.complete_orders(Order.objects.filter(pk=completed.pk))
+        Order.objects.filter(pk=completed.pk).update(created_at=timezone.now() - datetime.timedelta(days=3))
+        # Сдвиг даты мимо сводок — пересобираем затронутые дни
+        sales.rebuild(*sales.order_days())
+        self.assertRebuildMatches()
+        # Два дня по две книги и по два автора
+        self.assertEqual(sales.rebuild(*sales.order_days()), 8)
+
+    def test_deleted_orders_leave_rollups(self):
+        first, second, _ = self.books
+        kept = self.place(self.user, first)
+        removed = self.place(self.user, first, second)
+        sales.complete_orders(Order.objects.filter(pk=removed.pk))
+        self.client.force_login(self.admin_user)
+        self.client.post(reverse('admin:bookstore_order_delete', args=[removed.pk]), {'post': 'yes'})
+        self.assertFalse(Order.objects.filter(pk=removed.pk).exists())
+        self.assertEqual(DailyBookSales.objects.get(book=first).quantity, 1)
+        self.assertRebuildMatches()
+
+        self.client.post(reverse('admin:bookstore_order_changelist'), {
+            'action': 'delete_selected', ACTION_CHECKBOX_NAME: [kept.pk], 'post': 'yes',
+        })
+        self.assertFalse(Order.objects.exists())
+        self.assertRebuildMatches()
+
+        self.place(self.user, second)
+        self.user.delete()
+        self.assertEqual(self.rollups(), {'DailyBookSales': set(), 'DailyAuthorSales': set()})
+
+    def test_archived_orders_stay_in_rollups(self):
+        order = self.place(self.user, *self.books)
+        sales.complete_orders(Order.objects.all())
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - datetime.timedelta(days=500))
+        sales.rebuild(*sales.order_days())
+        before = self.rollups()
+        archive_orders()
+        self.assertEqual(self.rollups(), before)
+        self.assertRebuildMatches()
+
+
+class ArchiveTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(2)
+        cls.user = User.objects.create_user('history', 'history@example.com', 'pw12345!')
+
+    def make_order(self, status, days_ago, quantity=2):
+        order = Order.objects.create(user=self.user, total_price=100 * quantity, status=status,
+                                     item_count=quantity)
+        OrderItem.objects.create(order=order, book=self.books[0], quantity=quantity, price=100)
+        created = timezone.now() - datetime.timedelta(days=days_ago)
+        Order.objects.filter(pk=order.pk).update(created_at=created)
+        return order
+
+    def test_round_trip(self):
+        old_done = self.make_order('C', 500)
+        old_pending = self.make_order('P', 500)
+        recent_done = self.make_order('C', 5)
+        item_ids = list(old_done.items.values_list('id', flat=True))
+
+        self.assertEqual(archive_orders(batch_size=1), 1)
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {old_pending.pk, recent_done.pk})
+        archived = ArchivedOrder.objects.get(pk=old_done.pk)
+        self.assertEqual((archived.user_id, archived.total_price, archived.item_count, archived.status),
+                         (self.user.pk, old_done.total_price, 2, 'C'))
+        self.assertEqual(list(archived.items.values_list('id', flat=True)), item_ids)
+        self.assertFalse(OrderItem.objects.filter(pk__in=item_ids).exists())
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('order_detail', args=[old_done.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.books[0].title)
+        response = self.client.get(reverse('order_list'), {'archive': '1'})
+        self.assertEqual([order.pk for order in response.context['orders']], [old_done.pk])
+
+    def test_sales_rebuild_covers_archive_only_days(self):
+        self.make_order('C', 500, quantity=3)
+        self.make_order('C', 5, quantity=1)
+        archive_orders()
+        call_command('rebuild_sales_rollups', stdout=io.StringIO())
+        old_day = timezone.localdate(ArchivedOrder.objects.get().created_at)
+        self.assertEqual(DailyBookSales.objects.get(day=old_day).completed_quantity, 3)
+        self.assertEqual(DailyBookSales.objects.aggregate(total=Sum('quantity'))['total'], 4)
+
+
+class TokenBackend:
+    """Второй бэкенд для проверки обхода AUTHENTICATION_BACKENDS."""
+
+    def authenticate(self, request, token=None):
+        if token == 'secret':
+            return User.objects.get(username='reader')
+        if token == 'banned':
+            raise PermissionDenied
+
+    def get_user(self, user_id):
+        return User.objects.filter(pk=user_id).first()
+
+
+class LoginTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'pw12345!')
+
+    def setUp(self):
+        super().setUp()
+        self.failures = []
+        receiver = lambda sender, credentials, **kwargs: self.failures.append(credentials)
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+
+    def login(self, username, password):
+        return self.client.post(reverse('login'), {'username': username, 'password': password})
+
+    def test_login_by_username_or_email(self):
+        for login in ('reader', 'reader@example.com'):
+            with self.subTest(login=login):
+                self.assertRedirects(self.login(login, 'pw12345!'), reverse('book_list'), fetch_redirect_response=False)
+                self.client.logout()
+        self.assertEqual(self.failures, [])
+
+    @override_settings(LOGIN_THROTTLE={'ip': (20, 60), 'account': (3, 300)})
+    def test_account_throttled_after_failures(self):
+        for _ in range(3):
+            self.assertEqual(self.login('Reader ', 'wrong').status_code, 200)
+        # Лимит по учётной записи: правильный пароль уже не проверяется
+        self.assertEqual(self.login('reader', 'pw12345!').status_code, 429)
+        self.assertEqual(len(self.failures), 3)
+        self.assertEqual(self.failures[0]['password'], '********************')
+        self.assertEqual(self.login('other', 'wrong').status_code, 200)
+
+    @override_settings(LOGIN_THROTTLE={'ip': (20, 60), 'account': (3, 300)})
+    def test_success_resets_account_bucket(self):
+        for _ in range(2):
+            self.login('reader', 'wrong')
+        self.assertEqual(self.login('reader', 'pw12345!').status_code, 302)
+        self.client.logout()
+        for _ in range(3):
+            self.assertEqual(self.login('reader', 'wrong').status_code, 200)
+        self.assertEqual(self.login('reader', 'wrong').status_code, 429)
+
+    @override_settings(LOGIN_THROTTLE={'ip': (2, 60), 'account': (5, 300)})
+    def test_ip_throttled_across_accounts(self):
+        self.login('first', 'wrong')
+        self.login('second', 'wrong')
+        self.assertEqual(self.login('reader', 'pw12345!').status_code, 429)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['bookstore.auth.EmailOrUsernameBackend', 'bookstore.tests.TokenBackend'])
+    async def test_async_authenticate_uses_all_backends(self):
+        user = await aauthenticate(None, username='reader@example.com', password='pw12345!')
+        self.assertEqual((user.pk, user.backend), (self.user.pk, 'bookstore.auth.EmailOrUsernameBackend'))
+        user = await aauthenticate(None, token='secret')
+        self.assertEqual((user.pk, user.backend), (self.user.pk, 'bookstore.tests.TokenBackend'))
+        self.assertIsNone(await aauthenticate(None, username='reader', password='wrong'))
+        self.assertIsNone(await aauthenticate(None, token='banned'))
+        self.assertEqual(self.failures, [{'username': 'reader', 'password': '********************'},
+                                         {'token': '********************'}])
+
+    def test_password_checked_in_pool(self):
+        encoded = make_password('pw12345!', hasher='pbkdf2_sha256')
+        with override_settings(PASSWORD_HASH_WORKERS=1):
+            valid, new_hash = check_password('pw12345!', encoded)
+            self.assertIsNotNone(hashing._pool)
+        # Пароль не основным хешером — перехеширован основным
+        self.assertTrue(valid)
+        self.assertTrue(new_hash.startswith('scrypt$'))
+        self.assertEqual(check_password('wrong', encoded), (False, None))
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_TIMEOUT=0.01)
+    def test_stuck_pool_gives_busy(self):
+        futures = []
+
+        def submit(password, encoded):
+            futures.append(Future())
+            return None, futures[-1]
+
+        with mock.patch('bookstore.hashing._submit', submit):
+            with self.assertRaises(HashingBusy):
+                check_password('pw12345!', self.user.password)
+            self.assertTrue(futures[0].cancelled())
+            with self.assertRaises(HashingBusy):
+                async_to_sync(acheck_password)('pw12345!', self.user.password)
+            self.assertContains(self.login('reader', 'pw12345!'), 'Сервер перегружен')
+        # Отказ из-за пула — не неудачный вход: попытки не тратятся
+        self.assertEqual(self.failures, [])
+        account = LoginThrottle(None, 'reader').account
+        self.assertIsNone(account.cache.get(account.key))
+
+    @override_settings(PASSWORD_HASH_WORKERS=1)
+    def test_full_queue_gives_busy(self):
+        hashing._get_pool()
+        with mock.patch('bookstore.hashing._pending', threading.BoundedSemaphore(1)) as pending:
+            pending.acquire()
+            with self.assertRaises(HashingBusy):
+                check_password('pw12345!', self.user.password)
+            response = self.login('reader', 'pw12345!')
+        self.assertContains(response, 'Сервер перегружен')
+
+
+class AdminTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw12345!')
+        cls.tolstoy = Book.objects.create(title='Война и мир', author='Толстой', price=500, isbn='978-5-17-090085-4')
+        cls.chekhov = Book.objects.create(title='Вишнёвый сад', author='Чехов', price=300,
+                                          description='Пьеса о продаже имения')
+        cls.order = Order.objects.create(user=cls.admin_user, total_price=500, item_count=1)
+        cls.item = OrderItem.objects.create(order=cls.order, book=cls.tolstoy, quantity=1, price=500)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin_user)
+
+    def test_order_items_are_read_only(self):
+        url = reverse('admin:bookstore_order_change', args=[self.order.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'Война и мир')
+        self.assertNotContains(response, 'name="items-0-quantity"')
+        response = self.client.post(url, {
+            'user': self.admin_user.pk, 'total_price': '500', 'status': 'P', 'item_count': '1',
+            'items-TOTAL_FORMS': '2', 'items-INITIAL_FORMS': '1', 'items-MIN_NUM_FORMS': '0',
+            'items-MAX_NUM_FORMS': '1000',
+            'items-0-id': self.item.pk, 'items-0-order': self.order.pk, 'items-0-quantity': '5',
+            'items-0-DELETE': 'on',
+            'items-1-order': self.order.pk, 'items-1-book': self.chekhov.pk, 'items-1-quantity': '2',
+            'items-1-price': '300',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(self.order.items.values_list('book_id', 'quantity')), [(self.tolstoy.pk, 1)])
+
+    def test_paginator_estimates_only_unfiltered_lists(self):
+        queryset = Book.objects.order_by('-id')
+        with mock.patch('bookstore.pagination.estimate_count', return_value=1000) as estimate:
+            self.assertEqual(EstimatedCountPaginator(queryset, 50).count, 1000)
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(author='Чехов'), 50).count, 1)
+        estimate.assert_called_once_with(Book, 'default')
+        # На SQLite оценки нет — точный COUNT(*)
+        self.assertEqual(estimate_count(Book), 2)
+
+    def test_book_search_uses_index(self):
+        url = reverse('admin:bookstore_book_changelist')
+        for query, expected in (('толстой', [self.tolstoy]), ('пьеса им', [self.chekhov]),
+                                (self.tolstoy.isbn, [self.tolstoy]), ('достоевский', [])):
+            with self.subTest(query=query), CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, {'q': query})
+                self.assertEqual(list(response.context['cl'].result_list), expected)
+                self.assertFalse([q['sql'] for q in ctx.captured_queries if "LIKE '%" in q['sql']])
+
+    def test_order_search_is_exact(self):
+        url = reverse('admin:bookstore_order_changelist')
+        for query, expected in ((str(self.order.pk), [self.order]), ('admin', [self.order]),
+                                ('admin@example.com', [self.order]), ('adm', [])):
+            with self.subTest(query=query):
+                self.assertEqual(list(self.client.get(url, {'q': query}).context['cl'].result_list), expected)
+
+
+class RecommendationTests(BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(4)
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw12345!')
+
+    def make_order(self, *books, status='P'):
+        order = Order.objects.create(user=self.user, total_price=100 * len(books), status=status,
+                                     item_count=len(books))
+        OrderItem.objects.bulk_create([OrderItem(order=order, book=book, quantity=1, price=100) for book in books])
+        return order
+
+    def matrix(self):
+        return set(BookCooccurrence.objects.values_list('book_id', 'other_id', 'orders'))
+
+    def top(self):
+        return list(BookRecommendation.objects.values_list('book_id', 'recommended_id', 'rank', 'score'))
+
+    def test_rebuild(self):
+        a, b, c, d = self.books
+        orders = [self.make_order(a, b), self.make_order(a, b, c), self.make_order(a, d)]
+        result = recommendations.rebuild()
+        self.assertEqual(result['books'], 4)
+        pairs = {(a, b): 2, (a, c): 1, (b, c): 1, (a, d): 1}
+        expected = {(x.pk, y.pk, n) for (x, y), n in pairs.items()} | {(y.pk, x.pk, n) for (x, y), n in pairs.items()}
+        expected |= {(a.pk, a.pk, 3), (b.pk, b.pk, 2), (c.pk, c.pk, 1), (d.pk, d.pk, 1)}
+        self.assertEqual(self.matrix(), expected)
+        self.assertEqual(set(FoldedOrder.objects.values_list('order_id', flat=True)), {order.pk for order in orders})
+        top = list(BookRecommendation.objects.filter(book=a).values_list('recommended_id', flat=True))
+        self.assertEqual(top[0], b.pk)
+        self.assertEqual(set(top), {b.pk, c.pk, d.pk})
+        self.assertAlmostEqual(BookRecommendation.objects.get(book=a, rank=1).score, recommendations.score(2, 3, 2))
+
+    def test_fold_order_is_idempotent(self):
+        a, b, c, d = self.books
+        included = self.make_order(a, b)
+        recommendations.rebuild()
+        order = self.make_order(a, c, c, d)
+        self.assertEqual(recommendations.fold_order(order.pk), 3)
+        # Повтор задачи и заказ, уже попавший в пересборку, ничего не меняют
+        self.assertEqual(recommendations.fold_order(order.pk), 0)
+        self.assertEqual(recommendations.fold_order(included.pk), 0)
+        folded, folded_top = self.matrix(), self.top()
+        self.assertIn((a.pk, c.pk, 1), folded)
+        recommendations.rebuild()
+        self.assertEqual(self.matrix(), folded)
+        self.assertEqual([row[:3] for row in self.top() if row[0] in (a.pk, c.pk, d.pk)],
+                         [row[:3] for row in folded_top if row[0] in (a.pk, c.pk, d.pk)])
+
+    def test_fold_archived_order(self):
+        a, b, _, _ = self.books
+        order = self.make_order(a, b, status='C')
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - datetime.timedelta(days=500))
+        archive_orders()
+        self.assertEqual(recommendations.fold_order(order.pk), 2)
+        self.assertIn((a.pk, b.pk, 1), self.matrix())
+
+    def test_for_books_merges_neighbours(self):
+        a, b, c, d = self.books
+        self.make_order(a, c)
+        self.make_order(b, c)
+        self.make_order(b, d)
+        recommendations.rebuild()
+        cards = recommendations.for_books([a.pk, b.pk], exclude=[a.pk, b.pk])
+        self.assertEqual([card['id'] for card in cards], [c.pk, d.pk])
+        self.assertEqual(cards[0], {'id': c.pk, 'title': c.title, 'author': c.author, 'price': c.price})
+        self.assertEqual(recommendations.for_books([]), [])
+        self.assertEqual(async_to_sync(recommendations.afor_books)([a.pk, b.pk], exclude=[a.pk, b.pk]), cards)
+
+    @skipIf(recommendations.sparse is None, 'нет NumPy/SciPy')
+    def test_db_and_scipy_agree(self):
+        a, b, c, d = self.books
+        self.make_order(a, b, b)
+        self.make_order(a, b, c)
+        self.make_order(c, d)
+        archived = self.make_order(a, d, status='C')
+        Order.objects.filter(pk=archived.pk).update(created_at=timezone.now() - datetime.timedelta(days=500))
+        archive_orders()
+        self.assertEqual(recommendations.rebuild()['engine'], 'scipy')
+        matrix, top = self.matrix(), self.top()
+        with mock.patch.object(recommendations, 'sparse', None):
+            self.assertEqual(recommendations.rebuild()['engine'], 'db')
+        self.assertEqual(self.matrix(), matrix)
+        self.assertEqual([row[:3] for row in self.top()], [row[:3] for row in top])
+        for (*_, db_score), (*_, scipy_score) in zip(self.top(), top):
+            self.assertAlmostEqual(db_score, scipy_score)
+
+
+class QueryBudgetTests(QueryBudgetMixin, BookstoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(30)
+        cls.user = User.objects.create_user('budget', 'budget@example.com', 'pw12345!')
+        cls.order = Order.objects.create(user=cls.user, total_price=300, status='C', item_count=3)
+        for book in cls.books[:3]:
+            OrderItem.objects.create(order=cls.order, book=book, quantity=1, price=100)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        for book in self.books[:5]:
+            self.client.post(reverse('add_to_cart', args=[book.pk]))
+
+    def test_pages_within_budget(self):
+        book = self.books[0]
+        checked = self.assertUrlsWithinBudget(url_kwargs={
+            'order_detail': {'order_id': self.order.pk},
+            'book_update': {'pk': book.pk},
+            'api_book_detail': {'pk': book.pk},
+            'api_book_recommendations': {'pk': book.pk},
+        })
+        self.assertTrue({'book_list', 'cart_view', 'order_list', 'order_detail'} <= checked)
+
+    def test_cart_writes_within_budget(self):
+        book = self.books[10]
+        with assert_query_budget(self, 'add_to_cart'):
+            self.client.post(reverse('add_to_cart', args=[book.pk]))
+        with assert_query_budget(self, 'update_cart_item'):
+            self.client.post(reverse('update_cart_item', args=[book.pk]), {'quantity': 3})
+        with assert_query_budget(self, 'remove_from_cart'):
+            self.client.post(reverse('remove_from_cart', args=[book.pk]))
+        with assert_query_budget(self, 'checkout'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('checkout'))
+
+
+def body(response):
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+class StaticAssetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        static_root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(static_root.cleanup)
+        overrides = override_settings(STATIC_ROOT=static_root.name, STATIC_URL='/static/')
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def page_assets(self):
+        html = self.client.get(reverse('login')).content.decode()
+        self.assertNotRegex(html, r'(?:href|src)="(?:https?:)?//')
+        return re.findall(r'(?:href|src)="(/static/[^"]+)"', html)
+
+    def test_base_page_uses_hashed_local_assets(self):
+        assets = self.page_assets()
+        self.assertEqual(len(assets), 4)
+        for url in assets:
+            with self.subTest(url=url):
+                self.assertRegex(url, r'/vendor/.+\.[0-9a-f]{12}\.(?:css|js)$')
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertIn('immutable', response['Cache-Control'])
+
+    def test_icon_fonts_are_hashed(self):
+        css_url = next(url for url in self.page_assets() if 'bootstrap-icons' in url)
+        css = body(self.client.get(css_url)).decode()
+        fonts = re.findall(r'url\("\./(fonts/[^"?]+)', css)
+        self.assertEqual(len(fonts), 2)
+        for font in fonts:
+            self.assertRegex(font, r'\.[0-9a-f]{12}\.woff2?$')
+            response = self.client.get(css_url.rsplit('/', 1)[0] + '/' + font)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('immutable', response['Cache-Control'])
+
+    def test_missing_manifest_entry_is_an_error(self):
+        with self.assertRaises(ValueError):
+            static('vendor/bootstrap/css/missing.css')
@@ -0,0 +1,47 @@
+"""Token bucket в кеше Django для ограничения попыток входа.
+
+Ведро на ключ хранит ``(токены, время)``; токены восполняются со
+скоростью ``capacity / period`` в секунду. Запись в кеш не атомарна:
+при гонке параллельных запросов могут пройти одна-две лишние попытки,
+что для ограничения перебора допустимо.
+"""
+import time
+
+from django.core.cache import caches
+
+
+class TokenBucket:
+    def __init__(self, key, capacity, period, cache_alias='default'):
+        self.key = 'throttle:' + key
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+        self.cache = caches[cache_alias]
+
+    def _tokens(self, state, now):
+        if state is None:
+            return self.capacity
+        tokens, stamp = state
+        return min(self.capacity, tokens + (now - stamp) * self.rate)
+
+    def allows(self):
+        return self._tokens(self.cache.get(self.key), time.time()) >= 1
+
+    async def aallows(self):
+        return self._tokens(await self.cache.aget(self.key), time.time()) >= 1
+
+    def consume(self):
+        now = time.time()
+        tokens = self._tokens(self.cache.get(self.key), now)
+        self.cache.set(self.key, (max(tokens - 1, 0), now), self.period)
+
+    async def aconsume(self):
+        now = time.time()
+        tokens = self._tokens(await self.cache.aget(self.key), now)
+        await self.cache.aset(self.key, (max(tokens - 1, 0), now), self.period)
+
+    def reset(self):
+        self.cache.delete(self.key)
+
+    async def areset(self):
+        await self.cache.adelete(self.key)
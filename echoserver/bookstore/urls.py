@@ -1,24 +1,35 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
+
+if settings.ASYNC_VIEWS:
+    from . import async_views as hot_views
+else:
+    hot_views = views
 
 urlpatterns = [
-    path('', views.BookListView.as_view(), name='book_list'),
+    path('', hot_views.BookListView.as_view(), name='book_list'),
+    path('search/', views.book_search, name='book_search'),
     path('books/create/', views.book_create, name='book_create'),
     path('books/<int:pk>/update/', views.book_update, name='book_update'),
     path('books/<int:pk>/delete/', views.book_delete, name='book_delete'),
 
     path('register/', views.register, name='register'),
-    path('login/', views.user_login, name='login'),
+    path('login/', hot_views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
-    path('cart/', views.cart_view, name='cart_view'),
+    path('cart/', hot_views.cart_view, name='cart_view'),
     path('profile/', views.profile, name='profile'),
-    path('cart/add/<int:book_id>/', views.add_to_cart, name='add_to_cart'),
-    path('cart/', views.cart_detail, name='cart'),
+    path('cart/add/<int:book_id>/', hot_views.add_to_cart, name='add_to_cart'),
     path('checkout/', views.checkout, name='checkout'),
-    path('orders/', views.order_list, name='order_list'),
+    path('orders/', hot_views.order_list, name='order_list'),
     path('orders/<int:order_id>/', views.order_detail, name='order_detail'),
-    path('cart/update/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
-    path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/update/<int:book_id>/', views.update_cart_item, name='update_cart_item'),
+    path('cart/remove/<int:book_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('api/books/', api.book_collection, name='api_book_collection'),
+    path('api/books/export/', api.book_export, name='api_book_export'),
+    path('api/books/<int:pk>/', api.book_detail, name='api_book_detail'),
+    path('api/books/<int:pk>/recommendations/', api.book_recommendations, name='api_book_recommendations'),
+    path('internal/stats/', views.internal_stats, name='internal_stats'),
     # Альтернативный вариант для POST запросов без ID в URL
     path('cart/remove/', views.remove_from_cart, name='remove_from_cart_post'),
 ]
\ No newline at end of file
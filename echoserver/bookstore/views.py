@@ -1,18 +1,31 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.http import require_POST, require_http_methods
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_POST, require_http_methods
 from django.views.generic import ListView
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
 from django.core.paginator import Paginator
-from .models import Cart, CartItem, Order, Book, OrderItem
+from django.http import Http404
+from .models import Cart, CartItem, Book
 from .forms import BookForm, UserRegistrationForm, UserLoginForm, UserProfileForm
+from . import book_cache
+from .cart import CART_MAX_QUANTITY, get_cart, place_order, summarize_cart
+from .conditional import catalog_etag, catalog_last_modified, live_order, order_etag, order_list_etag
+from .archive import order_history
+from .cache import cache_stats, catalog_version, fragment_key, get_or_build
+from .db.pool import pool_stats
+from .facets import facet_counts, filter_books, parse_filters
+from .pagination import InvalidCursor, KeysetPage, KeysetPaginator
+from .recommendations import for_books
+from .search import attach_books, search_queryset
 from decimal import Decimal
 from django.http import JsonResponse
 
 def is_admin(user):
     return user.is_authenticated and user.is_admin()
 
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified), name='dispatch')
 class BookListView(ListView):
     model = Book
     template_name = 'bookstore/book_list.html'
@@ -20,7 +33,62 @@ class BookListView(ListView):
     paginate_by = 5
 
     def get_queryset(self):
-        return Book.objects.all().order_by('-created_at')
+        self.filters = parse_filters(self.request.GET)
+        return filter_books(Book.objects.all(), self.filters).order_by('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, page_size):
+        # Keyset-пагинация по (created_at, id): без COUNT(*) и OFFSET,
+        # поэтому любая страница стоит столько же, сколько первая
+        paginator = KeysetPaginator(queryset, page_size, ordering=('-created_at', '-id'),
+                                    count_approximately=True)
+        try:
+            # До ключа кэша: произвольная строка в ?cursor= не заводит новых записей
+            cursor = paginator.normalize_cursor(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Неверный курсор страницы')
+        self.catalog_version = catalog_version()
+        filters = sorted(self.filters.items())
+        self.facets = get_or_build(
+            fragment_key('facets', filters, version=self.catalog_version),
+            lambda: facet_counts(self.filters),
+        )
+        # Число книг (с фильтрами или без) уже посчитано по фасетам — без оценки по статистике
+        paginator._approximate_count = self.facets['total']
+
+        def build():
+            page = paginator.page(cursor)
+            return (page.object_list, page.has_next(), page.has_previous(),
+                    page.next_cursor, page.previous_cursor, paginator.approximate_count)
+
+        object_list, has_next, has_previous, next_cursor, previous_cursor, count = get_or_build(
+            fragment_key('page', [page_size, cursor, *filters], version=self.catalog_version), build,
+        )
+        paginator._approximate_count = count
+        page = KeysetPage(object_list, paginator, has_next, has_previous, next_cursor, previous_cursor)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['catalog_version'] = self.catalog_version
+        context['facets'] = self.facets
+        return context
+
+def book_search(request):
+    query = request.GET.get('q', '').strip()
+    page = None
+    books = []
+    if query:
+        paginator = KeysetPaginator(search_queryset(query), 10, ordering=('-score', '-book_id'))
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Неверный курсор страницы')
+        books = attach_books(page.object_list)
+    return render(request, 'bookstore/book_search.html', {
+        'query': query,
+        'books': books,
+        'page_obj': page,
+    })
 
 @login_required
 def book_create(request):
@@ -58,6 +126,15 @@ def book_delete(request, pk):
         return redirect('book_list')
     return render(request, 'bookstore/book_confirm_delete.html', {'book': book})
 
+@login_required
+@user_passes_test(is_admin)
+def internal_stats(request):
+    return JsonResponse({
+        'catalog_cache': cache_stats(),
+        'book_cache': book_cache.stats(),
+        'db_pools': pool_stats(),
+    })
+
 def register(request):
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST)
@@ -71,19 +148,19 @@ def register(request):
     return render(request, 'bookstore/register.html', {'form': form})
 
 def user_login(request):
+    status = 200
     if request.method == 'POST':
         form = UserLoginForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-            if user is not None:
-                login(request, user)
-                messages.success(request, f'Добро пожаловать, {username}!')
-                return redirect('book_list')
+            user = form.get_user()
+            login(request, user)
+            messages.success(request, f'Добро пожаловать, {user.username}!')
+            return redirect('book_list')
+        if form.is_throttled():
+            status = 429
     else:
         form = UserLoginForm()
-    return render(request, 'bookstore/login.html', {'form': form})
+    return render(request, 'bookstore/login.html', {'form': form}, status=status)
 
 @login_required
 def user_logout(request):
@@ -110,171 +187,104 @@ def profile(request):
     return render(request, 'bookstore/profile.html', {'form': form})
 
 
+def _posted_quantity(request, default=1):
+    try:
+        quantity = int(request.POST.get('quantity', default))
+    except (TypeError, ValueError):
+        return default
+    # Больше — переполнение PositiveIntegerField и суммы заказа
+    return min(quantity, CART_MAX_QUANTITY)
+
+
 @require_POST
 def add_to_cart(request, book_id):
-    book = get_object_or_404(Book, pk=book_id)
-    cart = request.session.get('cart', {})
-    book_id_str = str(book_id)
-
-    if book_id_str in cart:
-        cart[book_id_str]['quantity'] += 1
-    else:
-        cart[book_id_str] = {
-            'quantity': 1,
-            'price': str(book.price),
-            'title': book.title
-        }
-
-    request.session['cart'] = cart
-    request.session.modified = True
+    if book_cache.get(book_id) is None:
+        raise Http404('Книга не найдена')
+    get_cart(request).add(book_id)
     return redirect('cart_view')
 
-    request.session['cart'] = cart
-    request.session.modified = True
-
-    return JsonResponse({
-        'success': True,
-        'book_id': book_id,
-        'quantity': cart[book_id_str]['quantity'],
-        'cart_total': sum(item['quantity'] for item in cart.values())
-    })
-
-
-@login_required
-def cart_detail(request):
-    try:
-        cart = Cart.objects.get(user=request.user)
-    except Cart.DoesNotExist:
-        cart = Cart.objects.create(user=request.user)
-
-    total = sum(item.book.price * item.quantity for item in cart.items.all())
-    return render(request, 'bookstore/cart.html', {
-        'cart': cart,
-        'total': total
-    })
-
 
 def cart_view(request):
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total_price = 0
-
-    for book_id, item in cart.items():
-        try:
-            book = Book.objects.get(id=book_id)
-            quantity = item['quantity']
-            price = float(item['price'])
-            subtotal = price * quantity
-
-            cart_items.append({
-                'book': book,
-                'quantity': quantity,
-                'price': price,
-                'subtotal': subtotal
-            })
-            total_price += subtotal
-        except Book.DoesNotExist:
-            continue
-
+    quantities = get_cart(request).quantities()
+    cart_items, total_price = summarize_cart(quantities)
     return render(request, 'bookstore/cart.html', {
         'cart_items': cart_items,
-        'total_price': total_price
+        'total_price': total_price,
+        'recommendations': for_books(list(quantities), limit=4, exclude=list(quantities)),
     })
 
 
-@require_http_methods(["POST"])
-@login_required
-def remove_from_cart(request, item_id):
-    # Получаем ID из URL или из POST данных
-    book_id = item_id or request.POST.get('book_id') or request.GET.get('book_id')
+@require_POST
+def update_cart_item(request, book_id):
+    if book_cache.get(book_id) is None:
+        raise Http404('Книга не найдена')
+    quantity = _posted_quantity(request)
+    get_cart(request).update(book_id, quantity)
+    if quantity > 0:
+        messages.success(request, "Количество обновлено")
+    else:
+        messages.success(request, "Товар удален из корзины")
+    return redirect('cart_view')
+
 
-    if not book_id:
+@require_POST
+def remove_from_cart(request, book_id=None):
+    # ID книги берётся из URL или из POST данных
+    book_id = book_id or request.POST.get('book_id')
+    try:
+        book_id = int(book_id)
+    except (TypeError, ValueError):
         messages.error(request, "Не указан ID товара")
         return redirect('cart_view')
 
-    cart = request.session.get('cart', {})
-    book_id_str = str(book_id)
-
-    if book_id_str in cart:
-        del cart[book_id_str]
-        request.session['cart'] = cart
-        request.session.modified = True
+    if get_cart(request).remove(book_id):
         messages.success(request, 'Товар удален из корзины')
     else:
         messages.warning(request, 'Товар не найден в корзине')
-
     return redirect('cart_view')
 
 @login_required
+@require_POST
 def checkout(request):
-    cart = request.session.get('cart', {})
-    if not cart:
-        return redirect('cart')
-
-    total = sum(Decimal(item['price']) * item['quantity'] for item in cart.values())
-    order = Order.objects.create(
-        user=request.user,
-        total_price=total,
-        status='P'
-    )
-
-    for book_id, item in cart.items():
-        book = Book.objects.get(pk=book_id)
-        order.items.create(
-            book=book,
-            quantity=item['quantity'],
-            price=item['price']
-        )
+    cart = get_cart(request)
+    if not cart.quantities():
+        return redirect('cart_view')
 
-    request.session['cart'] = {}
+    order = place_order(request.user, cart)
+    if order is None:
+        # Корзину успел оформить параллельный запрос или её книги удалены
+        messages.warning(request, 'Корзина пуста или её книг больше нет в каталоге')
+        return redirect('cart_view')
     return redirect('order_detail', order_id=order.id)
 
 
 @login_required
+@condition(etag_func=order_etag)
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, pk=order_id, user=request.user)
-    return render(request, 'bookstore/order_detail.html', {'order': order})
+    order = None
+    if live_order(request, order_id) is not None:
+        order = order_history().filter(pk=order_id, user=request.user).first()
+    archived = order is None
+    if archived:
+        # Старый выполненный заказ мог уйти в архив
+        order = get_object_or_404(order_history(archive=True), pk=order_id, user=request.user)
+    return render(request, 'bookstore/order_detail.html', {'order': order, 'archived': archived})
 
 
 @login_required
+@condition(etag_func=order_list_etag)
 def order_list(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'bookstore/order_list.html', {'orders': orders})
-
-@login_required
-def update_cart_item(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    if request.method == 'POST':
-        quantity = int(request.POST.get('quantity', 1))
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
-            messages.success(request, "Количество обновлено")
-        else:
-            cart_item.delete()
-            messages.success(request, "Товар удален из корзины")
-    return redirect('cart')
-
-@login_required
-def remove_from_cart(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    cart_item.delete()
-    messages.success(request, "Товар удален из корзины")
-    return redirect('cart')
-
-
-def book_list(request):
-    books = Book.objects.all()
-    cart = request.session.get('cart', {})
-
-    # Добавляем информацию о количестве в корзине для каждой книги
-    for book in books:
-        book.cart_quantity = cart.get(str(book.id), {}).get('quantity', 0)
-
-    return render(request, 'bookstore/book_list.html', {
-        'books': books
+    # Архив читается, только если его попросили явно
+    archive = request.GET.get('archive') == '1'
+    orders = order_history(archive).filter(user=request.user)
+    paginator = KeysetPaginator(orders, 10, ordering=('-created_at', '-id'))
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Неверный курсор страницы')
+    return render(request, 'bookstore/order_list.html', {
+        'orders': page.object_list, 'page_obj': page, 'archive': archive,
     })
 
-
 # ("adsdasd = %s", [input])
 # ("adsdasd = {input}")
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""Прогрев воркера: всё, что иначе делает первый запрос.
+
+``warm_up()`` вызывается из wsgi.py/asgi.py при ``BOOKSTORE_WARMUP``
+(у gunicorn с ``--preload`` — в главном процессе до fork): импортирует
+представления, заполняет резолвер URL, компилирует шаблоны (включая пакет
+crispy-forms), строит кэши полей моделей и загружает переводы. Потом
+``gc.freeze()`` убирает эти объекты из сборки мусора, чтобы она не
+трогала их страницы памяти и воркеры делили их copy-on-write.
+
+Соединения с БД до fork открывать нельзя — сокет достался бы всем
+воркерам сразу. Их открывает ``warm_worker()`` уже в воркере: при
+``BOOKSTORE_WARMUP=worker`` (приложение импортирует сам воркер) или из
+хука gunicorn ``post_fork = lambda server, worker: warm_worker()`` при
+``BOOKSTORE_WARMUP=preload``.
+"""
+import gc
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+from django.utils import translation
+
+from .db.backends.pooled import PooledDatabaseWrapperMixin
+
+logger = logging.getLogger(__name__)
+
+# Что компилировать: маски glob относительно каталогов шаблонов
+TEMPLATES = getattr(settings, 'WARMUP_TEMPLATES', (
+    'bookstore/*.html',
+    getattr(settings, 'CRISPY_TEMPLATE_PACK', 'bootstrap5') + '/**/*.html',
+))
+
+
+def _walk_resolver(resolver):
+    # reverse_dict заполняет резолвер, вложенные include — рекурсивно
+    resolver.reverse_dict
+    for pattern in resolver.url_patterns:
+        if hasattr(pattern, 'url_patterns'):
+            _walk_resolver(pattern)
+
+
+def warm_urls():
+    _walk_resolver(get_resolver())
+
+
+def warm_templates(patterns=TEMPLATES):
+    """Компилирует шаблоны; с кэширующим загрузчиком они остаются в памяти."""
+    compiled = 0
+    for engine in engines.all():
+        seen = set()
+        for directory in engine.template_dirs:
+            directory = Path(directory)
+            for pattern in patterns:
+                for path in directory.glob(pattern):
+                    name = path.relative_to(directory).as_posix()
+                    if name not in seen:
+                        seen.add(name)
+                        engine.get_template(name)
+        compiled += len(seen)
+    return compiled
+
+
+def warm_models():
+    """Кэши ``_meta``: поля, обратные связи, карты имён полей."""
+    for model in apps.get_models():
+        opts = model._meta
+        opts.get_fields()
+        opts._forward_fields_map
+        opts.fields_map
+    return len(apps.get_models())
+
+
+def warm_translations():
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.gettext('')
+    translation.deactivate()
+
+
+STEPS = (
+    ('urls', warm_urls),
+    ('templates', warm_templates),
+    ('models', warm_models),
+    ('translations', warm_translations),
+)
+
+
+def warm_up(freeze=True, connect=False):
+    """Прогрев; ``connect=True`` — ещё и соединения с БД (только после fork).
+
+    Возвращает ``[(шаг, секунды)]``.
+    """
+    timings = []
+    for name, step in STEPS + ((('connections', warm_worker),) if connect else ()):
+        started = time.perf_counter()
+        step()
+        timings.append((name, time.perf_counter() - started))
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    logger.info('Прогрев: %s', ', '.join('%s %.0f мс' % (name, seconds * 1000) for name, seconds in timings))
+    return timings
+
+
+def warm_worker():
+    """Прогрев в воркере после fork: пулы соединений с БД заполняются до ``MIN_SIZE``."""
+    for connection in connections.all():
+        if isinstance(connection, PooledDatabaseWrapperMixin):
+            # Первое подключение создаёт пул и открывает MIN_SIZE соединений
+            connection.ensure_connection()
+            connection.close()
@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookstore_project.settings')
+# Под ASGI каталог, корзина и заказы обслуживаются асинхронными представлениями
+os.environ.setdefault('BOOKSTORE_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+if settings.WARMUP:
+    from bookstore.warmup import warm_up
+
+    warm_up(connect=settings.WARMUP == 'worker')
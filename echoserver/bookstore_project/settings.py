@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,12 +45,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'bookstore.middleware.StaticAssetMiddleware',
+    'bookstore.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bookstore.middleware.QueryInspectorMiddleware',
 ]
 
 ROOT_URLCONF = 'bookstore_project.urls'
@@ -65,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'bookstore.context_processors.cart_badge',
             ],
         },
     },
@@ -72,13 +77,22 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'bookstore_project.wsgi.application'
 
+# Асинхронные версии каталога, корзины и заказов (bookstore/async_views.py).
+# asgi.py включает их по умолчанию, под WSGI остаются синхронные.
+ASYNC_VIEWS = os.environ.get('BOOKSTORE_ASYNC_VIEWS') == '1'
+
+# Прогрев при загрузке приложения (bookstore/warmup.py): 'preload' — до fork,
+# без соединений с БД; 'worker' — в каждом воркере, вместе с пулом соединений
+WARMUP = os.environ.get('BOOKSTORE_WARMUP', '')
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # django.db.backends.mysql с пулом соединений (bookstore/db/pool.py)
+        'ENGINE': 'bookstore.db.backends.mysql',
         'NAME': 'bookstore',
         'USER': 'root',
         'PASSWORD': 'Lb_190106',
@@ -88,15 +102,96 @@ DATABASES = {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'charset': 'utf8mb4',
         },
+        # На процесс: не больше MAX_SIZE соединений, поток ждёт свободное
+        # до TIMEOUT секунд. CONN_MAX_AGE остаётся 0 — соединение
+        # возвращается в пул в конце запроса.
+        'POOL': {
+            'MIN_SIZE': 2,
+            'MAX_SIZE': 10,
+            'TIMEOUT': 5,
+            'MAX_AGE': 1800,
+            'MAX_IDLE': 300,
+            'CHECK_IDLE': 5,
+        },
     }
 }
 
+# Реплики для чтения каталога и заказов (bookstore/routing.py), например
+# DATABASES['replica'] = {...}; DATABASE_REPLICAS = ['replica'].
+# Пустой список — всё идёт в default.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['bookstore.routing.PrimaryReplicaRouter']
+# Сколько секунд после своей записи клиент читает из основной базы —
+# не меньше обычного отставания реплики
+REPLICA_STICKY_SECONDS = 5
+
+
+
+# Сколько процессов-воркеров обслуживает сайт (gunicorn и uvicorn читают ту
+# же переменную). При нескольких процессах общее состояние — версия
+# каталога, счётчики корзин — должно лежать в общем кэше; manage.py check
+# не пропускает locmem (bookstore.E001)
+WORKER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Кэш каталога (карточки и страницы BookListView, версия каталога).
+# file — общий для воркеров одной машины, redis — для нескольких машин,
+# locmem — только для одного процесса (runserver).
+CATALOG_CACHE_BACKEND = os.environ.get('CATALOG_CACHE_BACKEND', 'file')
+CATALOG_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', str(BASE_DIR / 'cache' / 'catalog')),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
 
-
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': dict(CATALOG_CACHE_BACKENDS[CATALOG_CACHE_BACKEND], TIMEOUT=600),
+}
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 600
+# Сколько секунд остальные воркеры ждут, пока один пересобирает холодный ключ
+CATALOG_CACHE_LOCK_TIMEOUT = 5
+# Счётчик корзины для значка в шапке (bookstore/cart.py) должен быть виден
+# всем воркерам, поэтому живёт в том же кеше, что и каталог
+CART_COUNT_CACHE = CATALOG_CACHE_ALIAS
+CART_COUNT_TIMEOUT = 600
+
+
+# Первый хешер — целевой: пароли, сохранённые остальными, перехешируются
+# при успешном входе. scrypt дешевле PBKDF2 по CPU и стоек за счёт памяти
 PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
 ]
 
+AUTHENTICATION_BACKENDS = ['bookstore.auth.EmailOrUsernameBackend']
+# Процессов для проверки паролей (0 — в потоке запроса), сколько проверок
+# может ждать в очереди, прежде чем вход начнёт получать отказ, и сколько
+# секунд ждать результата
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_MAX_PENDING = 32
+PASSWORD_HASH_TIMEOUT = 10
+# Token bucket: (попыток, за сколько секунд восполняются). Вёдра должны
+# быть общими для воркеров, иначе лимит умножается на их число
+LOGIN_THROTTLE = {
+    'ip': (20, 60),
+    'account': (5, 300),
+}
+LOGIN_THROTTLE_CACHE = CATALOG_CACHE_ALIAS
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -127,6 +222,17 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Bootstrap, Popper и Bootstrap Icons лежат в bookstore/static/vendor
+# (суммы — в SHA256SUMS, обновление — manage.py vendor_assets).
+# collectstatic даёт файлам имена с хешем содержимого и сжимает их в .gz/.br;
+# отдаёт их StaticAssetMiddleware с Cache-Control: immutable. Без манифеста
+# при DEBUG = False {% static %} — ошибка, а не ссылка на неизменённое имя.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'bookstore.storage.CompressedManifestStaticFilesStorage'},
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -146,7 +252,51 @@ ITEMS_PER_PAGE = 5
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'book_list'
 LOGOUT_REDIRECT_URL = 'book_list'
-SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+# В cookie только ключ сессии; данные в кеше с записью в БД. Корзина
+# вошедшего пользователя хранится в Cart/CartItem, анонимная — в сессии
+# компактным словарём {id книги: количество}
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 SESSION_COOKIE_AGE = 604800  # 1 неделя в секундах
 
-CART_SESSION_ID = 'cart'
\ No newline at end of file
+CART_SESSION_ID = 'cart'
+
+# Куда фоновая задача export_books кладёт файлы выгрузки
+EXPORT_ROOT = BASE_DIR / 'exports'
+
+# Бюджет SQL-запросов на страницу (по имени маршрута)
+QUERY_BUDGETS = {
+    # +1 на холодном кэше фасетов: три запроса счётчиков вместо COUNT
+    'book_list': 6,
+    'book_search': 5,
+    'cart_view': 4,
+    # +1 — постановка задачи пересчёта рекомендаций в той же транзакции
+    'checkout': 11,
+    'order_list': 5,
+    'order_detail': 5,
+    # Вход с анонимной корзиной: сессия, пользователь и слияние корзины (cart.merge);
+    # +1 — новое значение счётчика для кэша значка
+    'login': 13,
+}
+QUERY_BUDGET_DEFAULT = 10
+# Сколько одинаковых по форме запросов считать признаком N+1
+N_PLUS_ONE_THRESHOLD = 5
+# Превышение бюджета — исключение (удобно в тестах), иначе только предупреждение в лог
+QUERY_BUDGET_STRICT = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'bookstore.queries': {
+            'handlers': ['console'],
+            'level': 'DEBUG' if DEBUG else 'WARNING',
+        },
+        'bookstore.jobs': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
@@ -0,0 +1,24 @@
+"""
+Настройки для нагрузочного прогона (manage.py benchmark).
+
+SQLite в файле вместо MySQL: бенчмарк сам заполняет БД синтетическими
+данными и не должен трогать рабочую базу.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'bench.sqlite3',
+        'OPTIONS': {
+            'timeout': 30,
+        },
+    }
+}
+
+LOGGING['loggers']['bookstore.queries']['level'] = 'WARNING'
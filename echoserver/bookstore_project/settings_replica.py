@@ -0,0 +1,29 @@
+"""
+Основная база и реплика на двух файлах SQLite — для локальной проверки
+маршрутизации (bookstore/routing.py).
+
+Реплика — копия основной базы, «репликация» делается вручную:
+
+    python manage.py migrate --settings=bookstore_project.settings_replica
+    sqlite3 primary.sqlite3 ".backup replica.sqlite3"
+
+Пока копия не обновлена, реплика отстаёт, и видно, что после своей записи
+клиент читает из основной базы, а остальные — со старой копии. В тестах
+реплика — зеркало основной базы (TEST MIRROR).
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'primary.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_REPLICAS = ['replica']